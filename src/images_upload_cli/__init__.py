@@ -1,5 +1,33 @@
-"""Public accessible objects of that module."""
+"""Public accessible objects of that module.
 
-from images_upload_cli import image, util
-from images_upload_cli.main import format_link, upload_images
-from images_upload_cli.upload import HOSTINGS, UPLOAD
+The objects are imported on first access, so the cli doesn't load the dependencies it doesn't use.
+"""
+
+from importlib import import_module
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from images_upload_cli import image, util
+    from images_upload_cli.main import format_link, upload_images
+    from images_upload_cli.upload import HOSTINGS, UPLOAD
+
+__all__ = ["HOSTINGS", "UPLOAD", "format_link", "image", "upload_images", "util"]
+
+_MODULES = {
+    "HOSTINGS": "images_upload_cli.upload",
+    "UPLOAD": "images_upload_cli.upload",
+    "format_link": "images_upload_cli.main",
+    "image": "images_upload_cli.image",
+    "upload_images": "images_upload_cli.main",
+    "util": "images_upload_cli.util",
+}
+
+
+def __getattr__(name: str) -> object:
+    """Import the public objects on first access."""
+    if name not in _MODULES:
+        msg = f"module {__name__!r} has no attribute {name!r}"
+        raise AttributeError(msg)
+
+    module = import_module(_MODULES[name])
+    return module if module.__name__.endswith(f".{name}") else getattr(module, name)
@@ -1,34 +1,277 @@
 """Entrypoint for cli."""
 
-import asyncio
+# Only the lightweight modules are imported at the top level, the rest are imported when needed.
+# So `--help`, `--version` and the startup of uploads don't pay for the unused dependencies.
+
 import sys
+from functools import partial
+from itertools import chain
 from pathlib import Path
+from typing import TYPE_CHECKING, Any, cast
 
 import click
-from dotenv import load_dotenv
-from pyperclip import copy
 
-from images_upload_cli.logger import setup_logger
-from images_upload_cli.main import format_link, upload_images
-from images_upload_cli.upload import HOSTINGS, UPLOAD
-from images_upload_cli.util import get_config_path, notify_send
+from images_upload_cli.util import ByteSizeParamType, get_config_path
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+    from io import BufferedIOBase
+
+    from httpx import Timeout
+
+    from images_upload_cli.image import Transform
+    from images_upload_cli.main import UploadRecord
+
+# The keys of `upload.UPLOAD`, listed here to avoid importing the upload functions at startup.
+HOSTINGS = (
+    "anhmoe",
+    "beeimg",
+    "catbox",
+    "fastpic",
+    "filecoffee",
+    "freeimage",
+    "gyazo",
+    "imageban",
+    "imagebin",
+    "imgbb",
+    "imgchest",
+    "imgur",
+    "lensdump",
+    "pixeldrain",
+    "pixhost",
+    "ptpimg",
+    "smms",
+    "sxcu",
+    "telegraph",
+    "thumbsnap",
+    "tixte",
+    "up2sha",
+    "uplio",
+    "uploadcare",
+    "vgy",
+)
+
+# The values of `image.RECOMPRESS_FORMATS`, listed here to avoid importing the image module at startup.
+RECOMPRESS_FORMATS = ("avif", "jpeg", "webp")
+
+
+class ImagePathParamType(click.ParamType):
+    """Path to an image or a directory of images, or a glob pattern, e.g. `shots/**/*.png`."""
+
+    name = "path"
+    path = click.Path(exists=True, path_type=Path)
+
+    def convert(
+        self: "ImagePathParamType",
+        value: str | Path,
+        param: click.Parameter | None,
+        ctx: click.Context | None,
+    ) -> Path:
+        """Check that the path exists, unless it is a glob pattern matched later."""
+        if (
+            isinstance(value, str)
+            and any(char in value for char in "*?[")
+            and not Path(value).exists()
+        ):
+            return Path(value)
+        return cast("Path", self.path.convert(value, param, ctx))
+
+
+class HostingsParamType(click.ParamType):
+    """Comma-separated list of hostings, e.g. `imgur,catbox`."""
+
+    name = "hostings"
+
+    def convert(
+        self: "HostingsParamType",
+        value: str | tuple[str, ...],
+        param: click.Parameter | None,
+        ctx: click.Context | None,
+    ) -> tuple[str, ...]:
+        """Parse the list of hostings."""
+        if isinstance(value, tuple):
+            return value
+
+        hostings = tuple(hosting.strip() for hosting in value.split(",") if hosting.strip())
+        if not hostings:
+            self.fail("At least one hosting is required.", param, ctx)
+        for hosting in hostings:
+            if hosting not in HOSTINGS:
+                self.fail(f"Unknown hosting '{hosting}', expected one of {HOSTINGS}.", param, ctx)
+
+        return hostings
+
+
+class TimeoutParamType(click.ParamType):
+    """Timeout in seconds for all phases, or per phase, e.g. `10` or `30,connect=5`."""
+
+    name = "timeout"
+    phases = ("connect", "read", "write", "pool")
+
+    def convert(
+        self: "TimeoutParamType",
+        value: "str | Timeout",
+        param: click.Parameter | None,
+        ctx: click.Context | None,
+    ) -> "Timeout":
+        """Convert the value to the `httpx.Timeout`."""
+        from httpx import Timeout
+
+        if isinstance(value, Timeout):
+            return value
+
+        default = 5.0
+        timeouts = {}
+        for item in value.split(","):
+            phase, _, seconds = item.strip().rpartition("=")
+            if phase and phase not in self.phases:
+                self.fail(f"Unknown phase '{phase}', expected one of {self.phases}.", param, ctx)
+            try:
+                timeout = float(seconds)
+            except ValueError:
+                self.fail(f"'{seconds}' is not a valid number of seconds.", param, ctx)
+
+            if phase:
+                timeouts[phase] = timeout
+            else:
+                default = timeout
+
+        return Timeout(default, **timeouts)
+
+
+class RecompressParamType(click.ParamType):
+    """Format and optional quality to re-encode the images to, e.g. `webp` or `jpeg:85`."""
+
+    name = "format[:quality]"
+
+    def convert(
+        self: "RecompressParamType",
+        value: str | tuple[str, int],
+        param: click.Parameter | None,
+        ctx: click.Context | None,
+    ) -> tuple[str, int]:
+        """Parse the format and the quality."""
+        if isinstance(value, tuple):
+            return value
+
+        fmt, sep, quality = value.strip().lower().partition(":")
+        if fmt not in RECOMPRESS_FORMATS:
+            self.fail(f"Unknown format '{fmt}', expected one of {RECOMPRESS_FORMATS}.", param, ctx)
+        if not sep:
+            return fmt, 80
+        if not quality.isdigit() or not 1 <= int(quality) <= 100:  # noqa: PLR2004
+            self.fail(f"'{quality}' is not a valid quality, expected 1 to 100.", param, ctx)
+
+        return fmt, int(quality)
+
+
+class UploadCommand(click.Command):
+    """The upload command, also dispatching to the subcommands by their name, e.g. `imgup serve`.
+
+    The upload options and arguments stay at the top level, so `imgup IMAGES...` keeps working.
+    An existing file named like a subcommand is uploaded.
+    """
+
+    def __init__(self: "UploadCommand", *args: Any, **kwargs: Any) -> None:  # noqa: ANN401
+        """Init."""
+        super().__init__(*args, **kwargs)
+        self.subcommands: dict[str, click.Command] = {}
+
+    def add_command(self: "UploadCommand", command: click.Command) -> None:
+        """Register a subcommand."""
+        self.subcommands[command.name or ""] = command
+
+    def parse_args(self: "UploadCommand", ctx: click.Context, args: list[str]) -> list[str]:
+        """Run the subcommand named by the first argument, or parse the upload arguments."""
+        if args and args[0] in self.subcommands and not Path(args[0]).exists():
+            command = self.subcommands[args[0]]
+            # Not a child context, so the usage doesn't show the arguments of the upload command.
+            with command.make_context(f"{ctx.info_name} {args[0]}", args[1:]) as sub_ctx:
+                command.invoke(sub_ctx)
+            ctx.exit()
+        return super().parse_args(ctx, args)
+
+    def format_help(
+        self: "UploadCommand", ctx: click.Context, formatter: click.HelpFormatter
+    ) -> None:
+        """Write the help of the upload command and the list of the subcommands."""
+        super().format_help(ctx, formatter)
+        with formatter.section("Commands"):
+            formatter.write_dl(
+                [
+                    (name, command.get_short_help_str())
+                    for name, command in self.subcommands.items()
+                ]
+            )
+
+
+def print_upload(
+    record: "UploadRecord", fmt: str, *, clipboard: bool = False, notify: bool = False
+) -> None:
+    """Print the link of an uploaded image, or the record of any image in the jsonl format."""
+    from images_upload_cli.main import format_link, format_record
+
+    if fmt == "jsonl":
+        click.echo(format_record(record))
+    elif record.links is not None:
+        output_links(format_link([record.links], fmt), clipboard=clipboard, notify=notify)
+
+
+def print_watched(
+    record: "UploadRecord", fmt: str, *, clipboard: bool = False, notify: bool = False
+) -> None:
+    """Print the link of a watched image, or log the image that failed, so the watcher keeps going."""
+    from loguru import logger
+
+    if record.links is None:
+        logger.warning(f"Skipped '{record.path}': {record.error}")
+    print_upload(record, fmt, clipboard=clipboard, notify=notify)
+
+
+def check_inputs(
+    images: "Iterable[Path]", from_stdin: bool, journal_path: Path | None, resume: bool
+) -> None:
+    """Check that there are images to upload and the options they are read with are consistent."""
+    if not images and not from_stdin:
+        msg = "Missing argument 'IMAGES...' or option '--from-stdin'."
+        raise click.UsageError(msg)
+    if resume and journal_path is None:
+        msg = "Option '--resume' requires '--journal'."
+        raise click.UsageError(msg)
+
 
+def load_env_file(_ctx: click.Context, _param: click.Parameter, value: Path | None) -> Path | None:
+    """Load environment variables before the options that can be set by them are processed."""
+    from dotenv import load_dotenv
 
-@click.command(context_settings={"max_content_width": 120, "show_default": True})
+    load_dotenv(dotenv_path=value or get_config_path())
+    return value
+
+
+@click.command(
+    cls=UploadCommand, context_settings={"max_content_width": 120, "show_default": True}
+)
 @click.argument(
     "images",
     nargs=-1,
-    required=True,
-    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    type=ImagePathParamType(),
+)
+@click.option(
+    "-h",
+    "--hosting",
+    type=HostingsParamType(),
+    default="imgur",
+    help="The hosting, or a comma-separated chain of hostings tried in order until the upload succeeds, "
+    "e.g. 'imgur,catbox'.",
 )
-@click.option("-h", "--hosting", type=click.Choice(HOSTINGS), default="imgur")
 @click.option(
     "-f",
     "--format",
     "fmt",
-    type=click.Choice(("plain", "bbcode", "html", "markdown")),
+    type=click.Choice(("plain", "bbcode", "html", "markdown", "jsonl")),
     default="plain",
-    help="The format of the links to be generated.",
+    help="The format of the links to be generated. Use jsonl to print a JSON record per image "
+    "as soon as it is uploaded or fails, with the links, the sizes, the timings and the failure reason.",
 )
 @click.option(
     "-t",
@@ -36,6 +279,138 @@ from images_upload_cli.util import get_config_path, notify_send
     is_flag=True,
     help="Create captioned thumbnails. By default, in bbcode format.",
 )
+@click.option(
+    "--from-stdin",
+    is_flag=True,
+    help="Read the paths of the images from stdin, one per line, in addition to IMAGES.",
+)
+@click.option(
+    "-0",
+    "--null",
+    is_flag=True,
+    help="Separate the paths read from stdin by NUL characters, e.g. from 'find -print0'.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=4,
+    help="The maximum number of requests sent concurrently.",
+)
+@click.option(
+    "-b",
+    "--batch-size",
+    type=click.IntRange(min=1, max=20),
+    default=10,
+    help="The maximum number of images sent in a single request to the hostings that accept several files "
+    "(imgchest, ptpimg). Use 1 to send the images one by one.",
+)
+@click.option(
+    "--race",
+    type=HostingsParamType(),
+    help="Upload each image to all the listed hostings concurrently and keep the fastest link, "
+    "e.g. 'imgur,catbox'. Takes precedence over --hosting.",
+)
+@click.option(
+    "--mirrors",
+    is_flag=True,
+    help="Let the slower uploads of a race finish and log their links.",
+)
+@click.option(
+    "--max-dimension",
+    type=click.IntRange(min=1),
+    help="Downscale the images so that their longest side is at most this many pixels.",
+)
+@click.option(
+    "--max-bytes",
+    type=ByteSizeParamType(),
+    help="Re-encode the images larger than this size, e.g. '2MiB', "
+    "lowering the quality and then the dimensions until they fit.",
+)
+@click.option(
+    "--recompress",
+    type=RecompressParamType(),
+    help="Re-encode the images to avif, jpeg or webp, with the quality from 1 to 100, e.g. 'webp:75'. "
+    "The quality defaults to 80.",
+)
+@click.option(
+    "--strip-metadata",
+    is_flag=True,
+    help="Remove the EXIF, XMP, comments and other metadata from the JPEG and PNG images without re-encoding them. "
+    "The orientation and the color profile are kept.",
+)
+@click.option(
+    "--retries",
+    type=click.IntRange(min=0),
+    default=3,
+    help="The maximum number of retries of a request failed with a transient error.",
+)
+@click.option(
+    "--http2/--no-http2",
+    is_flag=True,
+    default=False,
+    envvar="IMGUP_HTTP2",
+    help="Multiplex the requests to a hosting over a single HTTP/2 connection. Required the http2 extra.",
+)
+@click.option(
+    "--max-connections",
+    type=click.IntRange(min=1),
+    default=100,
+    envvar="IMGUP_MAX_CONNECTIONS",
+    help="The maximum number of connections to a hosting.",
+)
+@click.option(
+    "--max-keepalive-connections",
+    type=click.IntRange(min=0),
+    default=20,
+    envvar="IMGUP_MAX_KEEPALIVE_CONNECTIONS",
+    help="The maximum number of idle connections kept alive.",
+)
+@click.option(
+    "--keepalive-expiry",
+    type=click.FloatRange(min=0),
+    default=5.0,
+    envvar="IMGUP_KEEPALIVE_EXPIRY",
+    help="The time in seconds an idle connection is kept alive.",
+)
+@click.option(
+    "--timeout",
+    type=TimeoutParamType(),
+    default="5.0",
+    envvar="IMGUP_TIMEOUT",
+    help="The timeout in seconds, for all phases or per phase, e.g. '30,connect=5'. "
+    "Phases: connect, read, write, pool.",
+)
+@click.option(
+    "--stream",
+    is_flag=True,
+    help="Print the link of each image as soon as it is uploaded, in the order of completion. "
+    "The links are not copied to the clipboard or sent in the notification.",
+)
+@click.option(
+    "--journal",
+    "journal_path",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="Append each uploaded image to this JSON Lines file as soon as it is uploaded.",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Skip the images found in the --journal, uploaded to the same hosting, "
+    "and merge their links with the new ones.",
+)
+@click.option(
+    "--server",
+    envvar="IMGUP_SERVER",
+    help="Upload through the daemon started by 'imgup serve' at this Unix socket path or URL, "
+    "e.g. 'http://127.0.0.1:8765'. The format, thumbnail, transform and cache options are forwarded, "
+    "the hostings and the connection options are those of the daemon.",
+)
+@click.option(
+    "--server-token",
+    envvar="IMGUP_SERVER_TOKEN",
+    help="The token of the daemon listening on a TCP port, see 'imgup serve --token'.",
+)
 @click.option(
     "-n",
     "--notify",
@@ -48,9 +423,18 @@ from images_upload_cli.util import get_config_path, notify_send
     default=True,
     help="Copy the result to the clipboard.",
 )
+@click.option(
+    "--cache/--no-cache",
+    is_flag=True,
+    default=True,
+    help="Reuse the links of the images previously uploaded to the same hosting and the generated thumbnails.",
+)
 @click.option(
     "--env-file",
     type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    is_eager=True,
+    expose_value=False,
+    callback=load_env_file,
     help="The path to the environment file. Takes precedence over the default config file.",
 )
 @click.option(
@@ -62,50 +446,576 @@ from images_upload_cli.util import get_config_path, notify_send
 @click.version_option()
 def cli(
     images: tuple[Path],
-    hosting: str,
+    hosting: tuple[str, ...],
     fmt: str,
     thumbnail: bool,
+    from_stdin: bool,
+    null: bool,
+    jobs: int,
+    batch_size: int,
+    race: tuple[str, ...] | None,
+    mirrors: bool,
+    max_dimension: int | None,
+    max_bytes: int | None,
+    recompress: tuple[str, int] | None,
+    strip_metadata: bool,
+    retries: int,
+    http2: bool,
+    max_connections: int,
+    max_keepalive_connections: int,
+    keepalive_expiry: float,
+    timeout: "Timeout",
+    stream: bool,
+    journal_path: Path | None,
+    resume: bool,
+    server: str | None,
+    server_token: str | None,
     notify: bool,
     clipboard: bool,
-    env_file: Path,
+    cache: bool,
     log_level: str,
 ) -> None:
-    """Upload images via APIs."""
+    """Upload images via APIs.
+
+    IMAGES are the paths to the images or to the directories of images, walked recursively,
+    or the glob patterns, e.g. 'shots/**/*.png'.
+    """
     """
     Upload images to the specified hosting service, format links, and print.
     Optionally copy links to clipboard and send desktop notification.
 
     Args:
-        images: The paths to the images to upload.
-        hosting: The hosting service to use for uploading the images.
+        images: The paths to the images or the directories of images, or the glob patterns.
+        hosting: The hosting services to use for uploading the images, in order of preference.
         fmt: The format to use for generating the links to the uploaded images.
         thumbnail: Whether thumbnail images should be generated for the uploaded images.
+        from_stdin: Whether to read the paths of the images from stdin.
+        null: Whether the paths read from stdin are separated by NUL characters instead of newlines.
+        jobs: The maximum number of requests sent concurrently.
+        batch_size: The maximum number of images sent in a single request.
+        race: The hostings to race the uploads across.
+        mirrors: Whether to let the slower uploads of a race finish.
+        max_dimension: The maximum length of the longest side of the uploaded images.
+        max_bytes: The maximum size of the uploaded images.
+        recompress: The format and the quality to re-encode the images to.
+        strip_metadata: Whether to remove the metadata from the images.
+        retries: The maximum number of retries of a request failed with a transient error.
+        http2: Whether to enable HTTP/2 for the connections to the hosting.
+        max_connections: The maximum number of connections to the hosting.
+        max_keepalive_connections: The maximum number of idle connections kept alive.
+        keepalive_expiry: The time in seconds an idle connection is kept alive.
+        timeout: The timeouts of the connect, read, write and pool phases.
+        stream: Whether to print the link of each image as soon as it is uploaded.
+        journal_path: The path to the journal of the uploaded images.
+        resume: Whether to skip the images found in the journal.
+        server: The address of the upload daemon to upload through.
+        server_token: The token of the upload daemon listening on a TCP port.
         notify: Whether to send desktop notification on completion.
         clipboard: Whether to copy the image links to the clipboard.
-        env_file: The path to the environment file.
+        cache: Whether to reuse the links of the previously uploaded images and the generated thumbnails.
         log_level: The log level to use for the logger.
     """
+    import asyncio
+    from contextlib import closing, nullcontext
+
+    from httpx import Limits
+
+    from images_upload_cli.cache import ThumbnailCache, UploadCache
+    from images_upload_cli.image import Transform, iter_images
+    from images_upload_cli.journal import UploadJournal
+    from images_upload_cli.logger import setup_logger
+    from images_upload_cli.main import format_link, upload_images
+    from images_upload_cli.util import get_cache_path, read_paths
+
+    check_inputs(images, from_stdin, journal_path, resume)
+
     # Set up logger.
     error_handler = setup_logger(log_level=log_level)
-    # Load environment variables.
-    load_dotenv(dotenv_path=env_file or get_config_path())
+
+    paths: Iterable[Path] = images
+    if from_stdin:
+        stdin = cast("BufferedIOBase", sys.stdin.buffer)
+        paths = chain(images, read_paths(stdin, b"\0" if null else b"\n"))
+
+    # If thumbnail is enabled and fmt is plain, change fmt to bbcode.
+    if thumbnail and fmt == "plain":
+        fmt = "bbcode"
+
+    transform = None
+    if max_dimension or max_bytes or recompress or strip_metadata:
+        recompress_format, quality = recompress or (None, 80)
+        transform = Transform(max_dimension, max_bytes, recompress_format, quality, strip_metadata)
+
+    if server:
+        check_daemon_options(click.get_current_context())
+        upload_via_daemon(
+            server,
+            paths,
+            fmt,
+            thumbnail,
+            transform=transform,
+            cache=cache,
+            token=server_token,
+            clipboard=clipboard,
+            notify=notify,
+        )
+        return
+
+    printer = partial(print_upload, fmt=fmt) if stream or fmt == "jsonl" else None
 
     # Upload images.
-    links = asyncio.run(
-        upload_images(upload_func=UPLOAD[hosting], images=images, thumbnail=thumbnail)
-    )
+    with (
+        closing(UploadCache(get_cache_path())) if cache else nullcontext() as upload_cache,
+        closing(ThumbnailCache(get_cache_path()))
+        if cache and thumbnail
+        else nullcontext() as thumbnail_cache,
+        closing(
+            UploadJournal(
+                journal_path,
+                resume=resume,
+                hostings=race or hosting,
+                thumbnail=thumbnail,
+                on_upload=printer,
+                collect=printer is None,
+            )
+        )
+        if journal_path
+        else nullcontext() as journal,
+    ):
+        links = asyncio.run(
+            upload_images(
+                hosting=hosting,
+                images=journal.skip(iter_images(paths)) if journal else iter_images(paths),
+                thumbnail=thumbnail,
+                jobs=jobs,
+                batch_size=batch_size,
+                race=race or (),
+                mirrors=mirrors,
+                cache=upload_cache,
+                thumbnail_cache=thumbnail_cache,
+                transform=transform,
+                retries=retries,
+                http2=http2,
+                limits=Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_keepalive_connections,
+                    keepalive_expiry=keepalive_expiry,
+                ),
+                timeout=timeout,
+                on_upload=journal.write if journal else printer,
+            )
+        )
+    # The links of the journaled images are merged with the new ones.
+    if journal is not None and printer is None:
+        links = journal.links()
     # If links are available, format and print them.
-    # If thumbnail is enabled and fmt is plain, change fmt to bbcode.
     if links:
-        if thumbnail and fmt == "plain":
-            fmt = "bbcode"
-        formatted_links = format_link(links, fmt)
-
-        click.echo(formatted_links)
-        if clipboard:
-            copy(formatted_links)
-        if notify:
-            notify_send(formatted_links)
+        output_links(format_link(links, fmt), clipboard=clipboard, notify=notify)
 
     if error_handler.has_error_occurred():
         sys.exit(1)
+
+
+def output_links(formatted_links: str, *, clipboard: bool, notify: bool) -> None:
+    """Print the formatted links, optionally copy them to the clipboard and send a notification."""
+    click.echo(formatted_links)
+    if clipboard:
+        from pyperclip import copy
+
+        copy(formatted_links)
+    if notify:
+        from images_upload_cli.util import notify_send
+
+        notify_send(formatted_links)
+
+
+# The upload options set by the daemon for all the requests, see `check_daemon_options`.
+DAEMON_OPTIONS = (
+    "hosting",
+    "jobs",
+    "batch_size",
+    "race",
+    "mirrors",
+    "retries",
+    "http2",
+    "max_connections",
+    "max_keepalive_connections",
+    "keepalive_expiry",
+    "timeout",
+    "stream",
+    "journal_path",
+    "resume",
+)
+
+
+def check_daemon_options(ctx: click.Context) -> None:
+    """Reject the options given on the command line along with --server that the daemon doesn't take.
+
+    The options set by the environment are left to the daemon, which reads the same config.
+    """
+    from click.core import ParameterSource
+
+    given = [
+        max(param.opts, key=len)
+        for param in ctx.command.params
+        if param.name in DAEMON_OPTIONS
+        and ctx.get_parameter_source(param.name) is ParameterSource.COMMANDLINE
+    ]
+    if given:
+        msg = f"Option '--server' can't be used with {', '.join(given)}, set them when starting the daemon."
+        raise click.UsageError(msg)
+
+
+def upload_via_daemon(
+    address: str,
+    paths: "Iterable[Path]",
+    fmt: str,
+    thumbnail: bool,
+    *,
+    transform: "Transform | None",
+    cache: bool,
+    token: str | None,
+    clipboard: bool,
+    notify: bool,
+) -> None:
+    """Upload the images through the daemon and output the links.
+
+    Exits with the status 1 if some images failed to upload.
+    """
+    from images_upload_cli.client import DaemonError, request_upload
+
+    try:
+        response = request_upload(
+            address,
+            list(paths),
+            fmt,
+            thumbnail=thumbnail,
+            transform=transform,
+            cache=cache,
+            token=token,
+        )
+    except DaemonError as exc:
+        raise click.ClickException(str(exc)) from exc
+
+    # The records in the jsonl format are printed only, like those of a local upload.
+    if response["output"] and fmt == "jsonl":
+        click.echo(response["output"])
+    elif response["output"]:
+        output_links(response["output"], clipboard=clipboard, notify=notify)
+    if response["failed"]:
+        sys.exit(1)
+
+
+@click.command(
+    context_settings={"max_content_width": 120, "show_default": True},
+    short_help="Run the upload daemon.",
+)
+@click.option(
+    "--socket",
+    "socket_path",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="The Unix socket to listen on.  [default: imgup.sock in the app directory]",
+)
+@click.option(
+    "--port",
+    type=click.IntRange(min=0, max=65535),
+    help="Listen on this TCP port of 127.0.0.1 instead of the Unix socket, 0 for any free port. "
+    "Requires --token.",
+)
+@click.option(
+    "--token",
+    envvar="IMGUP_SERVER_TOKEN",
+    help="The token the clients must send, required on TCP, where any local user can connect. "
+    "The Unix socket is restricted to the current user.",
+)
+@click.option(
+    "-h",
+    "--hosting",
+    type=HostingsParamType(),
+    default="imgur",
+    help="The hosting, or a comma-separated chain of hostings tried in order until the upload succeeds.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=4,
+    help="The maximum number of requests sent concurrently per upload.",
+)
+@click.option(
+    "-b",
+    "--batch-size",
+    type=click.IntRange(min=1, max=20),
+    default=10,
+    help="The maximum number of images sent in a single request to the hostings that accept several files.",
+)
+@click.option(
+    "--retries",
+    type=click.IntRange(min=0),
+    default=3,
+    help="The maximum number of retries of a request failed with a transient error.",
+)
+@click.option(
+    "--http2/--no-http2",
+    is_flag=True,
+    default=False,
+    envvar="IMGUP_HTTP2",
+    help="Multiplex the requests to a hosting over a single HTTP/2 connection. Required the http2 extra.",
+)
+@click.option(
+    "--timeout",
+    type=TimeoutParamType(),
+    default="5.0",
+    envvar="IMGUP_TIMEOUT",
+    help="The timeout in seconds, for all phases or per phase, e.g. '30,connect=5'.",
+)
+@click.option(
+    "--cache/--no-cache",
+    is_flag=True,
+    default=True,
+    help="Reuse the links of the images previously uploaded to the same hosting and the generated thumbnails.",
+)
+@click.option(
+    "--env-file",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    is_eager=True,
+    expose_value=False,
+    callback=load_env_file,
+    help="The path to the environment file. Takes precedence over the default config file.",
+)
+@click.option(
+    "--log-level",
+    type=click.Choice(("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")),
+    default="INFO",
+    help="Use DEBUG to show debug logs. Use CRITICAL to suppress all logs.",
+)
+def serve(
+    *,
+    socket_path: Path | None,
+    port: int | None,
+    token: str | None,
+    hosting: tuple[str, ...],
+    jobs: int,
+    batch_size: int,
+    retries: int,
+    http2: bool,
+    timeout: "Timeout",
+    cache: bool,
+    log_level: str,
+) -> None:
+    """Run the upload daemon, keeping the clients, the workers, the caption font and the config warm.
+
+    Upload through it with 'imgup --server ADDRESS IMAGES...', so each upload costs about one round-trip.
+    """
+    import asyncio
+    from contextlib import aclosing, suppress
+
+    from images_upload_cli.logger import setup_logger
+    from images_upload_cli.server import UploadServer
+    from images_upload_cli.util import get_cache_path, get_socket_path
+
+    if port is not None and not token:
+        msg = "Option '--port' requires '--token'."
+        raise click.UsageError(msg)
+
+    setup_logger(log_level=log_level)
+
+    server = UploadServer(
+        hosting,
+        jobs=jobs,
+        batch_size=batch_size,
+        cache=cache,
+        cache_path=get_cache_path(),
+        retries=retries,
+        http2=http2,
+        timeout=timeout,
+        token=token,
+    )
+
+    async def run() -> None:
+        async with aclosing(server):
+            await server.start()
+            listener = await (
+                server.listen(socket_path=socket_path or get_socket_path())
+                if port is None
+                else server.listen(port=port)
+            )
+            async with listener:
+                await listener.serve_forever()
+
+    with suppress(KeyboardInterrupt):
+        asyncio.run(run())
+
+
+@click.command(
+    context_settings={"max_content_width": 120, "show_default": True},
+    short_help="Upload the new images of a directory as they appear.",
+)
+@click.argument(
+    "directory",
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+)
+@click.option(
+    "-h",
+    "--hosting",
+    type=HostingsParamType(),
+    default="imgur",
+    help="The hosting, or a comma-separated chain of hostings tried in order until the upload succeeds.",
+)
+@click.option(
+    "-f",
+    "--format",
+    "fmt",
+    type=click.Choice(("plain", "bbcode", "html", "markdown", "jsonl")),
+    default="plain",
+    help="The format of the links to be generated. Use jsonl to print a JSON record per image.",
+)
+@click.option(
+    "-t",
+    "--thumbnail",
+    is_flag=True,
+    help="Create captioned thumbnails. By default, in bbcode format.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=4,
+    help="The maximum number of images uploaded concurrently.",
+)
+@click.option(
+    "--settle",
+    type=click.FloatRange(min=0),
+    default=1.0,
+    help="The time in seconds a new file must stay unchanged before it is uploaded, "
+    "so the partially written files are not.",
+)
+@click.option(
+    "--poll",
+    is_flag=True,
+    help="Poll the directory instead of using inotify, e.g. for the network filesystems.",
+)
+@click.option(
+    "--poll-interval",
+    type=click.FloatRange(min=0.1),
+    default=1.0,
+    help="The time in seconds between the scans of the directory when it is polled.",
+)
+@click.option(
+    "--retries",
+    type=click.IntRange(min=0),
+    default=3,
+    help="The maximum number of retries of a request failed with a transient error.",
+)
+@click.option(
+    "--http2/--no-http2",
+    is_flag=True,
+    default=False,
+    envvar="IMGUP_HTTP2",
+    help="Multiplex the requests to a hosting over a single HTTP/2 connection. Required the http2 extra.",
+)
+@click.option(
+    "--timeout",
+    type=TimeoutParamType(),
+    default="5.0",
+    envvar="IMGUP_TIMEOUT",
+    help="The timeout in seconds, for all phases or per phase, e.g. '30,connect=5'.",
+)
+@click.option(
+    "-n",
+    "--notify",
+    is_flag=True,
+    help="Send desktop notification on each upload. Required libnotify.",
+)
+@click.option(
+    "--clipboard/--no-clipboard",
+    is_flag=True,
+    default=True,
+    help="Copy the link of each uploaded image to the clipboard.",
+)
+@click.option(
+    "--cache/--no-cache",
+    is_flag=True,
+    default=True,
+    help="Reuse the links of the images previously uploaded to the same hosting and the generated thumbnails.",
+)
+@click.option(
+    "--env-file",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    is_eager=True,
+    expose_value=False,
+    callback=load_env_file,
+    help="The path to the environment file. Takes precedence over the default config file.",
+)
+@click.option(
+    "--log-level",
+    type=click.Choice(("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")),
+    default="INFO",
+    help="Use DEBUG to show debug logs. Use CRITICAL to suppress all logs.",
+)
+def watch(
+    *,
+    directory: Path,
+    hosting: tuple[str, ...],
+    fmt: str,
+    thumbnail: bool,
+    jobs: int,
+    settle: float,
+    poll: bool,
+    poll_interval: float,
+    retries: int,
+    http2: bool,
+    timeout: "Timeout",
+    notify: bool,
+    clipboard: bool,
+    cache: bool,
+    log_level: str,
+) -> None:
+    """Upload the new images of DIRECTORY as they appear, e.g. the screenshots, until interrupted.
+
+    The link of each image is printed, and copied to the clipboard, as soon as it is uploaded.
+    The images present at the start and the subdirectories are ignored.
+    """
+    import asyncio
+    from contextlib import closing, nullcontext, suppress
+
+    from images_upload_cli.cache import ThumbnailCache, UploadCache
+    from images_upload_cli.logger import setup_logger
+    from images_upload_cli.main import upload_images
+    from images_upload_cli.util import get_cache_path
+    from images_upload_cli.watch import watch_images
+
+    setup_logger(log_level=log_level)
+
+    if thumbnail and fmt == "plain":
+        fmt = "bbcode"
+
+    with (
+        closing(UploadCache(get_cache_path())) if cache else nullcontext() as upload_cache,
+        closing(ThumbnailCache(get_cache_path()))
+        if cache and thumbnail
+        else nullcontext() as thumbnail_cache,
+        suppress(KeyboardInterrupt),
+    ):
+        # A single run of the pipeline, so the clients and the workers are kept between the images.
+        asyncio.run(
+            upload_images(
+                hosting=hosting,
+                images=watch_images(
+                    directory, settle=settle, interval=poll_interval, use_inotify=not poll
+                ),
+                thumbnail=thumbnail,
+                jobs=jobs,
+                batch_size=1,
+                cache=upload_cache,
+                thumbnail_cache=thumbnail_cache,
+                retries=retries,
+                http2=http2,
+                timeout=timeout,
+                on_upload=partial(print_watched, fmt=fmt, clipboard=clipboard, notify=notify),
+            )
+        )
+
+
+cli.add_command(serve)
+cli.add_command(watch)
@@ -0,0 +1,253 @@
+"""Persistent cache of the uploaded images."""
+
+import sqlite3
+from hashlib import blake2b
+from pathlib import Path
+from time import time
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(path: Path) -> str:
+    """Calculate the content hash of a file, reading it in chunks.
+
+    Args:
+        path: The path to the file.
+
+    Returns:
+        The hex digest of the file content.
+    """
+    digest = blake2b(digest_size=20)
+    with path.open("rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def connect(path: Path) -> sqlite3.Connection:
+    """Open a cache database, creating it if necessary.
+
+    Args:
+        path: The path to the database file.
+
+    Returns:
+        The connection to the database.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    return db
+
+
+class UploadCache:
+    """SQLite cache of the image links.
+
+    The links are keyed by the content hash of the image, the hosting and the thumbnail flag.
+    Entries older than `max_age` are evicted, then the least recently used entries
+    are evicted until at most `max_entries` remain. The eviction runs on open,
+    then on store at most every `evict_interval` seconds, so a long-running process stays bounded too.
+    """
+
+    def __init__(
+        self: "UploadCache",
+        path: Path,
+        max_entries: int = 10_000,
+        max_age: float = 30 * 24 * 60 * 60,
+        evict_interval: float = 60.0,
+    ) -> None:
+        """Open the cache database, creating it if necessary.
+
+        Args:
+            path: The path to the database file.
+            max_entries: The maximum number of entries to keep.
+            max_age: The maximum age of an entry in seconds.
+            evict_interval: The minimum time in seconds between the evictions on store.
+        """
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.evict_interval = evict_interval
+        self.evicted = 0.0
+
+        self.db = connect(path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS uploads ("
+            " digest TEXT NOT NULL,"
+            " hosting TEXT NOT NULL,"
+            " thumbnail INTEGER NOT NULL,"
+            " img_link TEXT NOT NULL,"
+            " thumb_link TEXT,"
+            " created REAL NOT NULL,"
+            " accessed REAL NOT NULL,"
+            " PRIMARY KEY (digest, hosting, thumbnail))"
+        )
+        self.evict()
+
+    def close(self: "UploadCache") -> None:
+        """Close the database."""
+        self.db.close()
+
+    def evict(self: "UploadCache") -> None:
+        """Remove expired entries and trim the cache to the maximum number of entries."""
+        self.evicted = time()
+        with self.db:
+            self.db.execute("DELETE FROM uploads WHERE created < ?", (time() - self.max_age,))
+            self.db.execute(
+                "DELETE FROM uploads WHERE rowid NOT IN"
+                " (SELECT rowid FROM uploads ORDER BY accessed DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+
+    def get(
+        self: "UploadCache",
+        digest: str,
+        hosting: str,
+        thumbnail: bool,
+    ) -> tuple[str, str | None] | None:
+        """Get the links of a previously uploaded image.
+
+        Args:
+            digest: The content hash of the image.
+            hosting: The hosting service the image was uploaded to.
+            thumbnail: Whether the thumbnail was uploaded along with the image.
+
+        Returns:
+            The links to the image and its thumbnail, or `None` if the image is not cached.
+        """
+        key = (digest, hosting, int(thumbnail))
+        row = self.db.execute(
+            "SELECT img_link, thumb_link FROM uploads"
+            " WHERE digest = ? AND hosting = ? AND thumbnail = ?",
+            key,
+        ).fetchone()
+        if row is None:
+            return None
+
+        with self.db:
+            self.db.execute(
+                "UPDATE uploads SET accessed = ? WHERE digest = ? AND hosting = ? AND thumbnail = ?",
+                (time(), *key),
+            )
+        return row[0], row[1]
+
+    def set(
+        self: "UploadCache",
+        digest: str,
+        hosting: str,
+        thumbnail: bool,
+        links: tuple[str, str | None],
+    ) -> None:
+        """Store the links of an uploaded image.
+
+        Args:
+            digest: The content hash of the image.
+            hosting: The hosting service the image was uploaded to.
+            thumbnail: Whether the thumbnail was uploaded along with the image.
+            links: The links to the image and its thumbnail.
+        """
+        now = time()
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO uploads VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (digest, hosting, int(thumbnail), *links, now, now),
+            )
+        if now - self.evicted >= self.evict_interval:
+            self.evict()
+
+
+class ThumbnailCache:
+    """SQLite cache of the generated thumbnails.
+
+    The thumbnails are keyed by the content hash of the image and the parameters of the thumbnail,
+    see `derive_key`. The least recently used thumbnails are evicted until their total size
+    is at most `max_bytes`, on open, then on store at most every `evict_interval` seconds.
+    """
+
+    def __init__(
+        self: "ThumbnailCache",
+        path: Path,
+        max_bytes: int = 256 * 1024 * 1024,
+        evict_interval: float = 60.0,
+    ) -> None:
+        """Open the cache database, creating it if necessary.
+
+        Args:
+            path: The path to the database file.
+            max_bytes: The maximum total size of the thumbnails to keep.
+            evict_interval: The minimum time in seconds between the evictions on store.
+        """
+        self.max_bytes = max_bytes
+        self.evict_interval = evict_interval
+        self.evicted = 0.0
+
+        self.db = connect(path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS thumbnails ("
+            " key TEXT PRIMARY KEY,"
+            " data BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " accessed REAL NOT NULL)"
+        )
+        self.evict()
+
+    def close(self: "ThumbnailCache") -> None:
+        """Close the database."""
+        self.db.close()
+
+    def evict(self: "ThumbnailCache") -> None:
+        """Trim the cache to the maximum total size, starting from the least recently used thumbnails."""
+        self.evicted = time()
+        with self.db:
+            self.db.execute(
+                "DELETE FROM thumbnails WHERE key IN (SELECT key FROM"
+                " (SELECT key, SUM(size) OVER (ORDER BY accessed DESC, key) AS total FROM thumbnails)"
+                " WHERE total > ?)",
+                (self.max_bytes,),
+            )
+
+    def get(self: "ThumbnailCache", key: str) -> bytes | None:
+        """Get a previously generated thumbnail.
+
+        Args:
+            key: The key of the thumbnail.
+
+        Returns:
+            The thumbnail, or `None` if the thumbnail is not cached.
+        """
+        row = self.db.execute("SELECT data FROM thumbnails WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+
+        with self.db:
+            self.db.execute("UPDATE thumbnails SET accessed = ? WHERE key = ?", (time(), key))
+        return row[0]
+
+    def set(self: "ThumbnailCache", key: str, thumb: bytes) -> None:
+        """Store a generated thumbnail.
+
+        Args:
+            key: The key of the thumbnail.
+            thumb: The thumbnail.
+        """
+        now = time()
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO thumbnails VALUES (?, ?, ?, ?)",
+                (key, thumb, len(thumb), now),
+            )
+        if now - self.evicted >= self.evict_interval:
+            self.evict()
+
+
+def derive_key(digest: str, *params: object) -> str:
+    """Get the cache key of a thumbnail or a transformed image derived from an image.
+
+    Args:
+        digest: The content hash of the image.
+        params: The parameters the derived image depends on, e.g. the size and the caption font.
+
+    Returns:
+        The hex digest of the key.
+    """
+    return blake2b(repr((digest, *params)).encode(), digest_size=20).hexdigest()
@@ -0,0 +1,120 @@
+"""Thin client of the upload daemon, see `server.UploadServer`.
+
+Only the standard library is used, so a client invocation doesn't pay for the upload dependencies.
+"""
+
+import json
+import socket
+from collections.abc import Sequence
+from http import HTTPStatus
+from http.client import HTTPConnection
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+from urllib.parse import urlencode, urlsplit
+
+if TYPE_CHECKING:
+    from images_upload_cli.image import Transform
+
+
+class DaemonError(Exception):
+    """Exception raised when the daemon fails to serve a request."""
+
+
+class UnixHTTPConnection(HTTPConnection):
+    """HTTP connection over a Unix socket."""
+
+    def __init__(self: "UnixHTTPConnection", socket_path: str, timeout: float) -> None:
+        """Init.
+
+        Args:
+            socket_path: The path of the Unix socket.
+            timeout: The timeout of the socket operations in seconds.
+        """
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self: "UnixHTTPConnection") -> None:
+        """Connect to the Unix socket."""
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def connect(address: str, timeout: float) -> HTTPConnection:
+    """Open a connection to the daemon.
+
+    Args:
+        address: The path of the Unix socket, or the URL of the TCP address, e.g. `http://127.0.0.1:8765`.
+        timeout: The timeout of the socket operations in seconds.
+
+    Returns:
+        The HTTP connection.
+    """
+    if address.startswith("http://"):
+        url = urlsplit(address)
+        return HTTPConnection(url.hostname or "127.0.0.1", url.port, timeout=timeout)
+    return UnixHTTPConnection(address, timeout)
+
+
+def request_upload(
+    address: str,
+    paths: Sequence[Path],
+    fmt: str,
+    *,
+    thumbnail: bool = False,
+    transform: "Transform | None" = None,
+    cache: bool = True,
+    token: str | None = None,
+    timeout: float = 300.0,
+) -> dict[str, Any]:
+    """Ask the daemon to upload the images.
+
+    Args:
+        address: The address of the daemon, see `connect`.
+        paths: The paths of the images, the directories or the glob patterns, made absolute for the daemon.
+        fmt: The format of the links.
+        thumbnail: Whether to upload the thumbnails along with the images.
+        transform: The transformation applied to the images by the daemon, uploaded as is if `None`.
+        cache: Whether the daemon uses its caches.
+        token: The token of the daemon, required on TCP.
+        timeout: The timeout of the socket operations in seconds.
+
+    Returns:
+        The response of the daemon, with the formatted links in `output`
+        and the number of the images failed to upload in `failed`.
+
+    Raises:
+        DaemonError: If the daemon is not reachable or rejects the request.
+    """
+    body = json.dumps({"paths": [str(path.absolute()) for path in paths]})
+    params: dict[str, str | int] = {"format": fmt, "thumbnail": int(thumbnail)}
+    if not cache:
+        params["cache"] = 0
+    if transform is not None:
+        options = {
+            "max_dimension": transform.max_dimension,
+            "max_bytes": transform.max_bytes,
+            "recompress": transform.format,
+            "quality": transform.quality,
+            "strip_metadata": int(transform.strip_metadata),
+        }
+        params.update({name: value for name, value in options.items() if value is not None})
+    query = urlencode(params)
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    connection = connect(address, timeout)
+    try:
+        connection.request("POST", f"/upload?{query}", body, headers=headers)
+        response = connection.getresponse()
+        data = json.loads(response.read())
+    except (OSError, ValueError) as exc:
+        msg = f"The daemon at '{address}' is not reachable: {exc}"
+        raise DaemonError(msg) from exc
+    finally:
+        connection.close()
+
+    if response.status != HTTPStatus.OK:
+        msg = f"The daemon at '{address}' rejected the request: {data.get('error')}"
+        raise DaemonError(msg)
+    return data
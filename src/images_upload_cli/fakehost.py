@@ -0,0 +1,528 @@
+"""Fake image hosting server with fault injection, for offline load and chaos testing.
+
+The server answers the requests of all the hostings of `upload.UPLOAD` with responses shaped like theirs,
+routing by the `Host` header. Run it with `python -m images_upload_cli.fakehost`,
+then send the requests to it through `FakeHostTransport`, e.g. with
+`transport.make_client(rate_limit, transport=FakeHostTransport("http://127.0.0.1:8080"))`.
+"""
+
+import asyncio
+import json
+import socket
+import struct
+from collections import Counter
+from collections.abc import Callable, Sequence
+from itertools import count
+from random import Random
+from time import monotonic
+from typing import Any, NamedTuple
+from urllib.parse import urlsplit
+
+import click
+from httpx import AsyncBaseTransport, AsyncHTTPTransport, Request, Response
+from loguru import logger
+
+from images_upload_cli.util import ByteSizeParamType
+
+# The hostings by the hosts their requests are sent to.
+HOSTS = {
+    "anh.moe": "anhmoe",
+    "beeimg.com": "beeimg",
+    "catbox.moe": "catbox",
+    "fastpic.org": "fastpic",
+    "file.coffee": "filecoffee",
+    "freeimage.host": "freeimage",
+    "upload.gyazo.com": "gyazo",
+    "api.imageban.ru": "imageban",
+    "imagebin.ca": "imagebin",
+    "api.imgbb.com": "imgbb",
+    "api.imgchest.com": "imgchest",
+    "api.imgur.com": "imgur",
+    "lensdump.com": "lensdump",
+    "pixeldrain.com": "pixeldrain",
+    "api.pixhost.to": "pixhost",
+    "ptpimg.me": "ptpimg",
+    "sm.ms": "smms",
+    "sxcu.net": "sxcu",
+    "telegra.ph": "telegraph",
+    "thumbsnap.com": "thumbsnap",
+    "api.tixte.com": "tixte",
+    "api.up2sha.re": "up2sha",
+    "upl.io": "uplio",
+    "upload.uploadcare.com": "uploadcare",
+    "vgy.me": "vgy",
+}
+
+# The host of the pages of the images uploaded to pixhost, holding their direct links.
+PIXHOST_SHOW_HOST = "pixhost.to"
+
+# The JSON responses of the hostings by the id and the extension of the uploaded image.
+JSON_RESPONSES: dict[str, Callable[[str, str], Any]] = {
+    "anhmoe": lambda uid, ext: {
+        "status_code": 200,
+        "image": {"id_encoded": uid, "url": f"https://cdn.anh.moe/c/{uid}.{ext}"},
+        "status_txt": "OK",
+    },
+    "beeimg": lambda uid, ext: {
+        "files": {"name": uid, "url": f"//beeimg.com/images/{uid}.{ext}", "code": "200"}
+    },
+    "filecoffee": lambda uid, ext: {
+        "success": True,
+        "file": f"{uid}.{ext}",
+        "url": f"https://file.coffee/u/{uid}.{ext}",
+    },
+    "freeimage": lambda uid, ext: {
+        "status_code": 200,
+        "image": {"id_encoded": uid, "url": f"https://iili.io/{uid}.{ext}"},
+        "status_txt": "OK",
+    },
+    "gyazo": lambda uid, ext: {
+        "image_id": uid,
+        "permalink_url": f"https://gyazo.com/{uid}",
+        "url": f"https://i.gyazo.com/{uid}.{ext}",
+    },
+    "imageban": lambda uid, ext: {
+        "data": {"name": f"{uid}.{ext}", "link": f"https://i1.imageban.ru/out/{uid}.{ext}"},
+        "success": True,
+        "status": 200,
+    },
+    "imgbb": lambda uid, ext: {
+        "data": {"id": uid, "url": f"https://i.ibb.co/{uid}/upload.{ext}"},
+        "success": True,
+        "status": 200,
+    },
+    "imgur": lambda uid, ext: {
+        "data": {"id": uid, "link": f"https://i.imgur.com/{uid}.{ext}"},
+        "success": True,
+        "status": 200,
+    },
+    "lensdump": lambda uid, ext: {
+        "status_code": 200,
+        "image": {"id_encoded": uid, "url": f"https://i.lensdump.com/i/{uid}.{ext}"},
+        "status_txt": "OK",
+    },
+    "pixeldrain": lambda uid, _: {"success": True, "id": uid},
+    "pixhost": lambda uid, ext: {
+        "name": f"upload.{ext}",
+        "show_url": f"https://{PIXHOST_SHOW_HOST}/show/1/{uid}_upload.{ext}",
+        "th_url": f"https://t1.pixhost.to/thumbs/1/{uid}_upload.{ext}",
+    },
+    "smms": lambda uid, ext: {
+        "success": True,
+        "code": "success",
+        "data": {"storename": f"{uid}.{ext}", "url": f"https://s2.loli.net/{uid}.{ext}"},
+    },
+    "sxcu": lambda uid, _: {"id": uid, "url": f"https://sxcu.net/{uid}"},
+    "telegraph": lambda uid, ext: [{"src": f"/file/{uid}.{ext}"}],
+    "thumbsnap": lambda uid, ext: {
+        "data": {"id": uid, "media": f"https://thumbsnap.com/i/{uid}.{ext}"},
+        "success": True,
+        "status": 200,
+    },
+    "tixte": lambda uid, ext: {
+        "success": True,
+        "data": {"id": uid, "direct_url": f"https://fake.tixte.co/r/{uid}.{ext}"},
+    },
+    "up2sha": lambda uid, _: {"id": uid, "public_url": f"https://up2sha.re/file?f={uid}"},
+    "uploadcare": lambda uid, _: {"filename": uid},
+    "vgy": lambda uid, ext: {"error": False, "image": f"https://i.vgy.me/{uid}.{ext}"},
+}
+
+# The JSON responses of the hostings accepting several files per request, by the ids of the uploaded images.
+BATCH_RESPONSES: dict[str, Callable[[Sequence[str], str], Any]] = {
+    "imgchest": lambda uids, ext: {
+        "data": {
+            "id": uids[0],
+            "images": [
+                {"id": uid, "link": f"https://cdn.imgchest.com/files/{uid}.{ext}", "position": i}
+                for i, uid in enumerate(uids, 1)
+            ],
+        }
+    },
+    "ptpimg": lambda uids, ext: [{"code": uid, "ext": ext} for uid in uids],
+}
+
+# The plain text and XML responses of the hostings.
+TEXT_RESPONSES: dict[str, Callable[[str, str], str]] = {
+    "catbox": lambda uid, ext: f"https://files.catbox.moe/{uid}.{ext}",
+    "fastpic": lambda uid, ext: (
+        '<?xml version="1.0" encoding="UTF-8"?>\n<UploadSettings>\n'
+        f"<imagepath>https://i1.fastpic.org/big/{uid}.{ext}</imagepath>\n"
+        f"<imageid>{uid}</imageid>\n<status>ok</status>\n<error></error>\n"
+        f"<thumbpath>https://i1.fastpic.org/thumb/{uid}.jpeg</thumbpath>\n</UploadSettings>"
+    ),
+    "imagebin": lambda uid, ext: f"status:{uid}\nurl:https://ibin.co/{uid}.{ext}",
+    "uplio": lambda uid, _: f"https://upl.io/{uid}",
+}
+
+# The signatures of the image formats, to give the links the extension of the uploaded image.
+SIGNATURES = ((b"\x89PNG", "png"), (b"\xff\xd8\xff", "jpg"), (b"GIF8", "gif"), (b"WEBP", "webp"))
+
+
+class Faults(NamedTuple):
+    """The faults injected into the responses, each drawn independently per request."""
+
+    latency: float = 0.0
+    """The delay of each response in seconds."""
+    bandwidth: int | None = None
+    """The bandwidth of the request bodies in bytes per second, shared by the connections, unlimited if `None`."""
+    throttle_rate: float = 0.0
+    """The probability of a `429 Too Many Requests` response."""
+    retry_after: float = 1.0
+    """The delay requested by the `Retry-After` header of the throttled responses in seconds."""
+    error_rate: float = 0.0
+    """The probability of a burst of `503 Service Unavailable` responses starting."""
+    error_burst: int = 1
+    """The number of the consecutive requests failed by a burst."""
+    slow_rate: float = 0.0
+    """The probability of a response body being trickled."""
+    slow_duration: float = 1.0
+    """The time a trickled response body takes in seconds."""
+    reset_rate: float = 0.0
+    """The probability of the connection being reset instead of the request being answered."""
+
+
+class SharedLink:
+    """Link of a limited bandwidth shared by the connections, receiving the request bodies one after another."""
+
+    def __init__(self: "SharedLink", bandwidth: int | None = None) -> None:
+        """Init.
+
+        Args:
+            bandwidth: The bandwidth in bytes per second, unlimited if `None`.
+        """
+        self.bandwidth = bandwidth
+        self.free_at = 0.0
+
+    async def receive(self: "SharedLink", reader: asyncio.StreamReader, size: int) -> bytes:
+        """Receive a part of a request body at the bandwidth of the link.
+
+        Args:
+            reader: The stream of the connection.
+            size: The size of the part in bytes.
+
+        Returns:
+            The part of the body.
+        """
+        data = await reader.readexactly(size)
+        if self.bandwidth is not None:
+            # The parts of the concurrent requests are received one after another.
+            now = monotonic()
+            self.free_at = max(self.free_at, now) + size / self.bandwidth
+            await asyncio.sleep(self.free_at - now)
+        return data
+
+
+async def read_request(
+    reader: asyncio.StreamReader, link: SharedLink
+) -> tuple[str, str, dict[str, str], bytes] | None:
+    """Read a request of a keep-alive connection, with a `Content-Length` or a chunked body.
+
+    Args:
+        reader: The stream of the connection.
+        link: The link the body is received through.
+
+    Returns:
+        The method, the target, the lowercase headers and the body of the request,
+        or `None` if the connection is closed.
+    """
+    if not (line := await reader.readline()):
+        return None
+    method, target, _ = line.decode("latin-1").split(" ", 2)
+    headers = {}
+    while (line := await reader.readline()).strip():
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    body = bytearray()
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        while size := int((await reader.readline()).split(b";")[0], 16):
+            body += await link.receive(reader, size)
+            await reader.readline()
+        await reader.readline()
+    else:
+        body += await link.receive(reader, int(headers.get("content-length", "0")))
+    return method, target, headers, bytes(body)
+
+
+class FakeHost:
+    """HTTP/1.1 server emulating the hostings, with keep-alive connections and injected faults."""
+
+    def __init__(self: "FakeHost", faults: Faults | None = None, seed: int | None = None) -> None:
+        """Init.
+
+        Args:
+            faults: The faults to inject, none if `None`.
+            seed: The seed of the random faults, for reproducible runs.
+        """
+        self.faults = faults or Faults()
+        self.random = Random(seed)  # noqa: S311
+        self.ids = count(1)
+        self.burst_left = 0
+        self.link = SharedLink(self.faults.bandwidth)
+        self.stats: Counter[str] = Counter()
+        """The number of the requests, the uploaded images and the injected faults by kind."""
+
+    async def listen(self: "FakeHost", host: str = "127.0.0.1", port: int = 0) -> asyncio.Server:
+        """Start accepting the connections.
+
+        Args:
+            host: The host to listen on.
+            port: The port to listen on, any free port if 0.
+
+        Returns:
+            The listening server.
+        """
+        return await asyncio.start_server(self.handle, host, port)
+
+    async def handle(
+        self: "FakeHost", reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Serve the requests of a keep-alive connection."""
+        try:
+            while (request := await read_request(reader, self.link)) is not None:
+                method, target, headers, body = request
+                self.stats["requests"] += 1
+                if self.random.random() < self.faults.reset_rate:
+                    self.stats["resets"] += 1
+                    reset(writer)
+                    return
+
+                await asyncio.sleep(self.faults.latency)
+                status, content_type, data, extra = self.respond(method, target, headers, body)
+                await self.write_response(writer, status, content_type, data, extra)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def respond(
+        self: "FakeHost", method: str, target: str, headers: dict[str, str], body: bytes
+    ) -> tuple[int, str, bytes, dict[str, str]]:
+        """Answer a request, or fail it with an injected fault.
+
+        Returns:
+            The status, the content type, the body and the extra headers of the response.
+        """
+        if self.random.random() < self.faults.throttle_rate:
+            self.stats["throttled"] += 1
+            error = json.dumps({"error": "Too many requests."}).encode()
+            return 429, "application/json", error, {"Retry-After": f"{self.faults.retry_after:g}"}
+        if self.burst_left == 0 and self.random.random() < self.faults.error_rate:
+            self.burst_left = self.faults.error_burst
+        if self.burst_left > 0:
+            self.burst_left -= 1
+            self.stats["errors"] += 1
+            return 503, "application/json", b'{"error": "Service unavailable."}', {}
+
+        host = headers.get("host", "").rsplit(":", 1)[0]
+        if method == "GET" and host == PIXHOST_SHOW_HOST:
+            return 200, "text/html", render_pixhost_page(urlsplit(target).path).encode(), {}
+        if method != "POST" or host not in HOSTS:
+            return 404, "application/json", b'{"error": "Not found."}', {}
+
+        hosting = HOSTS[host]
+        files = max(body.count(b'; filename="'), 1) if hosting in BATCH_RESPONSES else 1
+        uids = [f"fake{next(self.ids):06d}" for _ in range(files)]
+        self.stats["uploads"] += files
+        content_type, data = render_response(hosting, uids, guess_ext(body))
+        return 200, content_type, data, {}
+
+    async def write_response(
+        self: "FakeHost",
+        writer: asyncio.StreamWriter,
+        status: int,
+        content_type: str,
+        data: bytes,
+        extra: dict[str, str],
+    ) -> None:
+        """Write a response, trickling its body if drawn."""
+        head = f"HTTP/1.1 {status} {RESPONSE_REASONS[status]}\r\nContent-Type: {content_type}\r\n"
+        head += "".join(f"{name}: {value}\r\n" for name, value in extra.items())
+        writer.write(f"{head}Content-Length: {len(data)}\r\n\r\n".encode("latin-1"))
+
+        if data and self.random.random() < self.faults.slow_rate:
+            self.stats["slow"] += 1
+            # About 10 parts, each after an equal share of the duration.
+            step = max(len(data) // 10, 1)
+            for start in range(0, len(data), step):
+                await writer.drain()
+                await asyncio.sleep(self.faults.slow_duration * step / len(data))
+                writer.write(data[start : start + step])
+        else:
+            writer.write(data)
+        await writer.drain()
+
+
+# The reason phrases of the statuses sent by the server.
+RESPONSE_REASONS = {
+    200: "OK",
+    404: "Not Found",
+    429: "Too Many Requests",
+    503: "Service Unavailable",
+}
+
+
+def reset(writer: asyncio.StreamWriter) -> None:
+    """Reset the connection, so the client gets `ECONNRESET` rather than a clean close."""
+    sock = writer.get_extra_info("socket")
+    if sock is not None:
+        # Closing with a zero linger timeout sends RST.
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+    writer.transport.abort()
+
+
+def guess_ext(body: bytes) -> str:
+    """Guess the extension of the first image of a multipart body from its signature."""
+    found = [(body.find(signature), ext) for signature, ext in SIGNATURES]
+    return min(((index, ext) for index, ext in found if index >= 0), default=(0, "png"))[1]
+
+
+def render_response(hosting: str, uids: Sequence[str], ext: str) -> tuple[str, bytes]:
+    """Render the response of a hosting to an upload.
+
+    Args:
+        hosting: The hosting.
+        uids: The ids of the uploaded images, several for the hostings accepting several files per request.
+        ext: The extension of the images.
+
+    Returns:
+        The content type and the body of the response.
+    """
+    if hosting in BATCH_RESPONSES:
+        return "application/json", json.dumps(BATCH_RESPONSES[hosting](uids, ext)).encode()
+    if hosting in JSON_RESPONSES:
+        return "application/json", json.dumps(JSON_RESPONSES[hosting](uids[0], ext)).encode()
+    content_type = "application/xml" if hosting == "fastpic" else "text/plain"
+    return content_type, TEXT_RESPONSES[hosting](uids[0], ext).encode()
+
+
+def render_pixhost_page(path: str) -> str:
+    """Render the page of an image uploaded to pixhost, holding its direct link.
+
+    Args:
+        path: The path of the page, e.g. `/show/1/fake000001_upload.png`.
+
+    Returns:
+        The HTML of the page.
+    """
+    image_path = path.removeprefix("/show/")
+    return (
+        "<!DOCTYPE html>\n<html><body>\n"
+        f'<img id="image" src="https://img1.{PIXHOST_SHOW_HOST}/images/{image_path}">\n'
+        "</body></html>"
+    )
+
+
+class FakeHostTransport(AsyncBaseTransport):
+    """Transport sending the requests to a fake host instead of the hostings.
+
+    The `Host` header is kept, so the fake host answers like the hosting the request was meant for.
+    """
+
+    def __init__(
+        self: "FakeHostTransport", address: str, transport: AsyncBaseTransport | None = None
+    ) -> None:
+        """Init.
+
+        Args:
+            address: The URL of the fake host, e.g. `http://127.0.0.1:8080`.
+            transport: The transport used to send the requests.
+        """
+        url = urlsplit(address)
+        self.host = url.hostname or "127.0.0.1"
+        self.port = url.port or 80
+        self.transport = transport or AsyncHTTPTransport()
+
+    async def handle_async_request(self: "FakeHostTransport", request: Request) -> Response:
+        """Send the request to the fake host."""
+        request.url = request.url.copy_with(scheme="http", host=self.host, port=self.port)
+        return await self.transport.handle_async_request(request)
+
+    async def aclose(self: "FakeHostTransport") -> None:
+        """Close the underlying transport."""
+        await self.transport.aclose()
+
+
+@click.command(context_settings={"max_content_width": 120, "show_default": True})
+@click.option("--host", default="127.0.0.1", help="The host to listen on.")
+@click.option(
+    "--port", type=click.IntRange(min=0, max=65535), default=8080, help="The port to listen on."
+)
+@click.option(
+    "--latency",
+    type=click.FloatRange(min=0),
+    default=0.0,
+    help="The delay of each response in seconds.",
+)
+@click.option(
+    "--bandwidth",
+    type=ByteSizeParamType(),
+    help="The upload bandwidth per second, shared by the connections, e.g. '10M'.  [default: unlimited]",
+)
+@click.option(
+    "--throttle-rate",
+    type=click.FloatRange(min=0, max=1),
+    default=0.0,
+    help="The probability of a '429 Too Many Requests' response.",
+)
+@click.option(
+    "--retry-after",
+    type=click.FloatRange(min=0),
+    default=1.0,
+    help="The delay requested by the throttled responses in seconds.",
+)
+@click.option(
+    "--error-rate",
+    type=click.FloatRange(min=0, max=1),
+    default=0.0,
+    help="The probability of a burst of '503 Service Unavailable' responses starting.",
+)
+@click.option(
+    "--error-burst",
+    type=click.IntRange(min=1),
+    default=1,
+    help="The number of the consecutive requests failed by a burst.",
+)
+@click.option(
+    "--slow-rate",
+    type=click.FloatRange(min=0, max=1),
+    default=0.0,
+    help="The probability of a response body being trickled.",
+)
+@click.option(
+    "--slow-duration",
+    type=click.FloatRange(min=0),
+    default=1.0,
+    help="The time a trickled response body takes in seconds.",
+)
+@click.option(
+    "--reset-rate",
+    type=click.FloatRange(min=0, max=1),
+    default=0.0,
+    help="The probability of the connection being reset instead of the request being answered.",
+)
+@click.option("--seed", type=int, help="The seed of the random faults, for reproducible runs.")
+def main(*, host: str, port: int, seed: int | None, **faults: Any) -> None:  # noqa: ANN401
+    """Run a fake image hosting server answering like the hostings, with injected faults.
+
+    Send the requests to it through 'FakeHostTransport("http://HOST:PORT")', e.g. from a test or a benchmark.
+    """
+    fakehost = FakeHost(Faults(**faults), seed=seed)
+
+    async def run() -> None:
+        async with await fakehost.listen(host, port) as server:
+            host_, port_ = server.sockets[0].getsockname()[:2]
+            logger.info(f"Listening on 'http://{host_}:{port_}'.")
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        logger.info(f"Served {dict(fakehost.stats)}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,471 @@
-"""Image processing and manipulation."""
+"""Image processing and manipulation.
 
+`PIL` is imported on demand, so it is only loaded when an image is actually processed.
+"""
+
+import json
+import re
+import struct
+from collections.abc import Iterable, Iterator
+from functools import lru_cache
+from glob import iglob
 from io import BytesIO
-from os import getenv
+from os import getenv, walk
+from pathlib import Path
+from typing import TYPE_CHECKING, BinaryIO, NamedTuple
+
+from loguru import logger
+
+from images_upload_cli.util import GetEnvError, get_config_path, get_font_index_path, human_size
+
+if TYPE_CHECKING:
+    from PIL import Image, ImageFont
+
+
+# The number of bytes read to identify an image, enough for the headers of the common formats.
+HEADER_SIZE = 32 * 1024
+
+MIME_TYPES = {
+    "bmp": "image/bmp",
+    "gif": "image/gif",
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+    "webp": "image/webp",
+}
+
+# JPEG start of frame markers, except DHT, JPG and DAC.
+JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+class ImageInfo(NamedTuple):
+    """The format and dimensions of an image."""
+
+    format: str
+    """The lowercase format of the image, used as the file extension."""
+    mime: str
+    """The MIME type of the image."""
+    width: int
+    """The width in pixels."""
+    height: int
+    """The height in pixels."""
+
+
+def sniff_jpeg_size(header: bytes) -> tuple[int, int] | None:
+    """Find the dimensions of a JPEG image in the start of frame segment.
+
+    Args:
+        header: The first bytes of the image.
+
+    Returns:
+        The width and height of the image, or `None` if the segment is not in the header.
+    """
+    i = 2
+    while i + 9 <= len(header):
+        if header[i] != 0xFF:  # noqa: PLR2004
+            return None
+        marker = header[i + 1]
+        if marker == 0xFF:  # noqa: PLR2004
+            # Fill byte.
+            i += 1
+        elif marker in JPEG_SOF_MARKERS:
+            height, width = struct.unpack(">HH", header[i + 5 : i + 9])
+            return width, height
+        else:
+            (length,) = struct.unpack(">H", header[i + 2 : i + 4])
+            i += 2 + length
+
+    return None
+
+
+def unpack_header(fmt: str, header: bytes, offset: int) -> tuple[int, ...] | None:
+    """Unpack the fields of a header, checking that the header is long enough.
+
+    Args:
+        fmt: The `struct` format of the fields.
+        header: The first bytes of the image.
+        offset: The position of the fields in the header.
+
+    Returns:
+        The fields, or `None` if the header is truncated.
+    """
+    if len(header) < offset + struct.calcsize(fmt):
+        return None
+    return struct.unpack_from(fmt, header, offset)
+
+
+def sniff_webp_size(header: bytes) -> tuple[int, ...] | None:
+    """Find the dimensions of a WebP image in its first chunk.
+
+    Args:
+        header: The first bytes of the image.
+
+    Returns:
+        The width and height of the image, or `None` if the chunk is not recognized or truncated.
+    """
+    chunk = header[12:16]
+    if chunk == b"VP8 " and header[23:26] == b"\x9d\x01\x2a":
+        if (fields := unpack_header("<HH", header, 26)) is None:
+            return None
+        width, height = fields
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L" and header[20:21] == b"\x2f":
+        if (fields := unpack_header("<I", header, 21)) is None:
+            return None
+        (bits,) = fields
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X" and len(header) >= 30:  # noqa: PLR2004
+        return int.from_bytes(header[24:27], "little") + 1, int.from_bytes(
+            header[27:30], "little"
+        ) + 1
+
+    return None
+
+
+def sniff_bmp_size(header: bytes) -> tuple[int, ...] | None:
+    """Find the dimensions of a BMP image in its DIB header.
+
+    Args:
+        header: The first bytes of the image.
+
+    Returns:
+        The width and height of the image, or `None` if the header is truncated.
+    """
+    if (fields := unpack_header("<I", header, 14)) is None:
+        return None
+    # The OS/2 header has 16-bit dimensions, the later ones have 32-bit signed dimensions.
+    if fields[0] == 12:  # noqa: PLR2004
+        return unpack_header("<HH", header, 18)
+    if (fields := unpack_header("<ii", header, 18)) is None:
+        return None
+    width, height = fields
+    return width, abs(height)
+
+
+def sniff_image(header: bytes) -> ImageInfo | None:
+    """Identify an image by the magic bytes of its header, without decoding it.
+
+    Supports PNG, JPEG, GIF, WebP and BMP.
+
+    Args:
+        header: The first bytes of the image.
+
+    Returns:
+        The format and dimensions of the image, or `None` if the image is not recognized
+        or its header is truncated.
+    """
+    size: tuple[int, ...] | None = None
+    if header.startswith(b"\x89PNG\r\n\x1a\n") and header[12:16] == b"IHDR":
+        fmt = "png"
+        size = unpack_header(">II", header, 16)
+    elif header.startswith(b"\xff\xd8\xff"):
+        fmt = "jpeg"
+        size = sniff_jpeg_size(header)
+    elif header[:6] in {b"GIF87a", b"GIF89a"}:
+        fmt = "gif"
+        size = unpack_header("<HH", header, 6)
+    elif header.startswith(b"RIFF") and header[8:12] == b"WEBP":
+        fmt = "webp"
+        size = sniff_webp_size(header)
+    elif header.startswith(b"BM"):
+        fmt = "bmp"
+        size = sniff_bmp_size(header)
+    else:
+        return None
+
+    if size is None:
+        return None
+    return ImageInfo(fmt, MIME_TYPES[fmt], *size)
+
+
+def get_img_info(img: bytes | BinaryIO) -> ImageInfo:
+    """Get the format and dimensions of an image from a byte string or a binary file.
+
+    The image is identified by its header, `PIL` is only used for the formats not recognized by the header.
+    The position of the file is preserved.
+
+    Args:
+        img: A byte string or a binary file representing an image.
+
+    Returns:
+        The format and dimensions of the image.
+    """
+    f = BytesIO(img) if isinstance(img, bytes) else img
+    pos = f.tell()
+    try:
+        f.seek(0)
+        if info := sniff_image(f.read(HEADER_SIZE)):
+            return info
+
+        from PIL import Image
 
-from PIL import Image, ImageDraw, ImageFont
+        f.seek(0)
+        with Image.open(f) as im:
+            fmt = im.format or ""
+            return ImageInfo(
+                fmt.lower(), Image.MIME.get(fmt, "application/octet-stream"), *im.size
+            )
+    finally:
+        f.seek(pos)
 
-from images_upload_cli.util import GetEnvError, get_config_path, human_size
 
+def get_img_ext(img: bytes | BinaryIO) -> str:
+    """Get the extension of an image from a byte string or a binary file.
 
-def get_img_ext(img: bytes) -> str:
-    """Get the extension of an image from a byte string.
+    Only the header of the image is read, the position of the file is preserved.
 
     Args:
-        img: A byte string representing an image.
+        img: A byte string or a binary file representing an image.
 
     Returns:
         The extension of the image file.
     """
-    with BytesIO(img) as f:
-        ext = Image.open(f).format
-        return "" if ext is None else ext.lower()
+    return get_img_info(img).format
+
+
+# The extensions of the images picked from the directories and the glob matches.
+IMAGE_EXTENSIONS = frozenset(
+    {".avif", ".bmp", ".gif", ".jfif", ".jpe", ".jpeg", ".jpg", ".png", ".tif", ".tiff", ".webp"}
+)
+
+
+def is_image_file(path: Path) -> bool:
+    """Check if a file picked from a directory or a glob match is an image.
+
+    The files are filtered by extension, the files without an extension are identified by their header.
+
+    Args:
+        path: The path to the file.
+
+    Returns:
+        Whether the file is an image.
+    """
+    if path.suffix:
+        return path.suffix.lower() in IMAGE_EXTENSIONS
+
+    try:
+        with path.open("rb") as f:
+            return sniff_image(f.read(HEADER_SIZE)) is not None
+    except OSError:
+        return False
+
+
+def walk_images(path: Path) -> Iterator[Path]:
+    """Walk the directory recursively and yield the images, see `is_image_file`.
+
+    Each directory is listed when it is reached, the files and the subdirectories are sorted by name.
+
+    Args:
+        path: The path to the directory.
+
+    Yields:
+        The paths to the images.
+    """
+    for root, dirs, files in walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if is_image_file(img_path := Path(root, name)):
+                yield img_path
+
+
+def iter_images(paths: Iterable[Path]) -> Iterator[Path]:
+    """Expand the directories and the glob patterns into the images, lazily.
+
+    The files are yielded as is, the directories are walked recursively.
+    The glob patterns support `**` and are matched in the order of the file system,
+    the matched directories are skipped.
+    Only the images are picked from the directories and the glob matches, see `is_image_file`.
+
+    Args:
+        paths: The paths to the images and the directories, or the glob patterns.
+
+    Yields:
+        The paths to the images.
+    """
+    for path in paths:
+        if path.is_file():
+            yield path
+            continue
+
+        found = False
+        if path.is_dir():
+            img_paths = walk_images(path)
+        else:
+            # `Path.glob` doesn't accept absolute patterns.
+            matches = (Path(match) for match in iglob(str(path), recursive=True))  # noqa: PTH207
+            img_paths = (match for match in matches if match.is_file() and is_image_file(match))
+
+        for img_path in img_paths:
+            found = True
+            yield img_path
+
+        if not found:
+            logger.warning(f"No images found in '{path}'.")
+
+
+# The JPEG markers used by `strip_jpeg_metadata`.
+JPEG_MARKER_PREFIX = 0xFF
+JPEG_EOI = 0xD9
+JPEG_SOS = 0xDA
+JPEG_APP1 = 0xE1
+# The application segments and the comments.
+JPEG_METADATA_MARKERS = frozenset({*range(0xE0, 0xF0), 0xFE})
+# The JPEG application segments kept by `strip_jpeg_metadata`, by marker and signature.
+# The JFIF header, the color profile and the Adobe color transform affect how the image is rendered.
+JPEG_KEEP_SEGMENTS = ((0xE0, b"JFIF\x00"), (0xE2, b"ICC_PROFILE\x00"), (0xEE, b"Adobe"))
+# The next marker after the entropy-coded data of a JPEG scan,
+# skipping the stuffed zero bytes, the restart markers and the fill bytes.
+JPEG_MARKER_RE = re.compile(rb"\xff(?=[^\x00\xd0-\xd7\xff])")
+EXIF_ORIENTATION_TAG = 0x0112
+
+# The ancillary PNG chunks kept by `strip_png_metadata`,
+# the transparency, the color space and the animation of APNG affect how the image is rendered.
+PNG_KEEP_CHUNKS = frozenset(
+    {b"tRNS", b"gAMA", b"cHRM", b"sRGB", b"iCCP", b"sBIT", b"cICP", b"acTL", b"fcTL", b"fdAT"}
+)
+
+
+def read_exif_orientation(exif: bytes) -> int:
+    """Read the orientation tag from the first IFD of the EXIF data.
+
+    Args:
+        exif: The payload of the EXIF segment, starting with the `Exif` identifier.
+
+    Returns:
+        The orientation from 1 to 8, 1 if it is missing or invalid.
+    """
+    tiff = exif[6:]
+    endian = {b"II": "<", b"MM": ">"}.get(tiff[:2])
+    if endian is None or len(tiff) < 8:  # noqa: PLR2004
+        return 1
+
+    (offset,) = struct.unpack(f"{endian}I", tiff[4:8])
+    if len(tiff) < offset + 2:
+        return 1
+    (count,) = struct.unpack(f"{endian}H", tiff[offset : offset + 2])
+    for entry in range(offset + 2, min(offset + 2 + count * 12, len(tiff) - 11), 12):
+        tag, _, _, value = struct.unpack(f"{endian}HHIH", tiff[entry : entry + 10])
+        if tag == EXIF_ORIENTATION_TAG:
+            return value if 1 <= value <= 8 else 1  # noqa: PLR2004
+
+    return 1
+
+
+def make_orientation_segment(orientation: int) -> bytes:
+    """Make a minimal JPEG EXIF segment with only the orientation tag.
+
+    Args:
+        orientation: The orientation from 1 to 8.
+
+    Returns:
+        The EXIF segment, including its marker.
+    """
+    # The TIFF header, then the first IFD with a single SHORT entry and no next IFD.
+    payload = b"Exif\x00\x00MM\x00\x2a" + struct.pack(
+        ">IHHHIHHI", 8, 1, EXIF_ORIENTATION_TAG, 3, 1, orientation, 0, 0
+    )
+    return b"\xff\xe1" + struct.pack(">H", len(payload) + 2) + payload
+
+
+def strip_jpeg_metadata(img: bytes) -> bytes:
+    """Remove the metadata segments from a JPEG image without decoding it.
+
+    The EXIF, XMP, IPTC and MPF segments, the comments and the data after the end of the image,
+    e.g. the previews of the Multi-Picture Format, are removed.
+    The orientation is kept in a minimal EXIF segment, the segments affecting the rendering are kept.
+
+    Args:
+        img: The JPEG image in bytes format.
+
+    Returns:
+        The stripped image, or the input image if its structure is not recognized.
+    """
+    data = memoryview(img)
+    parts = [data[:2]]
+    pos = 2
+    while pos + 2 <= len(data):
+        if data[pos] != JPEG_MARKER_PREFIX:
+            return img
+        marker = data[pos + 1]
+        if marker == JPEG_MARKER_PREFIX:
+            # Fill byte.
+            pos += 1
+            continue
+        if marker == JPEG_EOI:
+            parts.append(data[pos : pos + 2])
+            return b"".join(parts)
 
+        if pos + 4 > len(data):
+            break
+        (length,) = struct.unpack(">H", data[pos + 2 : pos + 4])
+        end = pos + 2 + length
+        segment = data[pos:end]
+        if marker == JPEG_APP1 and segment[4:10] == b"Exif\x00\x00":
+            if (orientation := read_exif_orientation(bytes(segment[4:]))) != 1:
+                parts.append(memoryview(make_orientation_segment(orientation)))
+        elif marker not in JPEG_METADATA_MARKERS or any(
+            marker == keep_marker and segment[4 : 4 + len(signature)] == signature
+            for keep_marker, signature in JPEG_KEEP_SEGMENTS
+        ):
+            parts.append(segment)
+        pos = end
 
-def get_font(size: int = 14) -> ImageFont.FreeTypeFont:
+        if marker == JPEG_SOS:
+            # Copy the entropy-coded data of the scan up to the next marker.
+            match = JPEG_MARKER_RE.search(data, pos)
+            end = match.start() if match else len(data)
+            parts.append(data[pos:end])
+            pos = end
+
+    return img
+
+
+def strip_png_metadata(img: bytes) -> bytes:
+    """Remove the ancillary chunks from a PNG image without decoding it.
+
+    The text, EXIF, time and other ancillary chunks are removed,
+    the chunks affecting the rendering are kept, see `PNG_KEEP_CHUNKS`.
+
+    Args:
+        img: The PNG image in bytes format.
+
+    Returns:
+        The stripped image, or the input image if its structure is not recognized.
+    """
+    data = memoryview(img)
+    parts = [data[:8]]
+    pos = 8
+    while pos + 12 <= len(data):
+        length, chunk_type = struct.unpack(">I4s", data[pos : pos + 8])
+        end = pos + 12 + length
+        # Critical chunks start with an uppercase letter.
+        if chunk_type[:1].isupper() or chunk_type in PNG_KEEP_CHUNKS:
+            parts.append(data[pos:end])
+        pos = end
+        if chunk_type == b"IEND":
+            return b"".join(parts)
+
+    return img
+
+
+def strip_metadata(img: bytes) -> bytes:
+    """Remove the metadata from a JPEG or PNG image by rewriting its container, without decoding it.
+
+    The other formats are returned as is.
+
+    Args:
+        img: The input image in bytes format.
+
+    Returns:
+        The stripped image in bytes format.
+    """
+    if img.startswith(b"\xff\xd8\xff"):
+        return strip_jpeg_metadata(img)
+    if img.startswith(b"\x89PNG\r\n\x1a\n"):
+        return strip_png_metadata(img)
+    return img
+
+
+def get_font(size: int = 14) -> "ImageFont.FreeTypeFont":
     """Get font for thumbnail captions.
 
     Args:
@@ -32,7 +475,7 @@ def get_font(size: int = 14) -> ImageFont.FreeTypeFont:
         ImageFont.FreeTypeFont: Represents the font.
     """
     if font_name := getenv("CAPTION_FONT"):
-        return ImageFont.truetype(font_name, size=size)
+        return search_font(fonts=[font_name], size=size)
 
     default_fonts = [
         "Helvetica",
@@ -44,9 +487,59 @@ def get_font(size: int = 14) -> ImageFont.FreeTypeFont:
     return search_font(fonts=default_fonts, size=size)
 
 
-def search_font(fonts: list[str], size: int = 14) -> ImageFont.FreeTypeFont:
+@lru_cache
+def load_font(font: str, size: int) -> "ImageFont.FreeTypeFont":
+    """Load a TTF font, memoized by the font and the size.
+
+    Args:
+        font: The name of the font or the path to the font file.
+        size: The font size.
+
+    Returns:
+        ImageFont.FreeTypeFont: Represents the font.
+
+    Raises:
+        OSError: If the font is not found.
+    """
+    from PIL import ImageFont
+
+    return ImageFont.truetype(font, size=size)
+
+
+def read_font_index() -> dict[str, str]:
+    """Read the index of the resolved fonts.
+
+    Returns:
+        The paths of the resolved fonts by the searched font names, empty if the index can't be read.
+    """
+    try:
+        index = json.loads(get_font_index_path().read_text())
+    except (OSError, ValueError):
+        return {}
+
+    return index if isinstance(index, dict) else {}
+
+
+def write_font_index(index: dict[str, str]) -> None:
+    """Write the index of the resolved fonts. The index is not persisted if it can't be written.
+
+    Args:
+        index: The paths of the resolved fonts by the searched font names.
+    """
+    path = get_font_index_path()
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(index, indent=2))
+    except OSError:
+        pass
+
+
+def search_font(fonts: list[str], size: int = 14) -> "ImageFont.FreeTypeFont":
     """Attempt to retrieve a TTF font from the system.
 
+    The path of the found font is stored in the font index, so the next runs load it directly
+    instead of searching the system font directories for the missing fonts again.
+
     Args:
         fonts: A list of font names to search for.
         size: The font size. Defaults to 14.
@@ -57,12 +550,26 @@ def search_font(fonts: list[str], size: int = 14) -> ImageFont.FreeTypeFont:
     Raises:
         GetEnvError: If none of the default fonts are found.
     """
+    index = read_font_index()
+    key = ",".join(fonts)
+    # The entry is invalidated by a change of the searched fonts or the removal of the font file.
+    if (path := index.get(key)) and Path(path).is_file():
+        try:
+            return load_font(path, size)
+        except OSError:
+            pass
+
     for font_name in fonts:
         try:
-            return ImageFont.truetype(font_name, size=size)
-        except OSError:  # noqa: PERF203
+            font = load_font(font_name, size)
+        except OSError:
             continue
 
+        if isinstance(font.path, str):
+            index[key] = str(Path(font.path).resolve())
+            write_font_index(index)
+        return font
+
     msg = (
         f"None of the fonts were found: {fonts}.\n"
         f"Please setup CAPTION_FONT in environment variables or in '{get_config_path()}'.",
@@ -70,10 +577,17 @@ def search_font(fonts: list[str], size: int = 14) -> ImageFont.FreeTypeFont:
     raise GetEnvError(msg)
 
 
+# The thumbnail is first reduced to at most this many times its size by cheap integer scaling.
+THUMBNAIL_REDUCING_GAP = 2
+THUMBNAIL_SIZE = (300, 300)
+# The version of the thumbnail rendering. Bump it on changes, to invalidate the cached thumbnails.
+THUMBNAIL_VERSION = 1
+
+
 def make_thumbnail(
     img: bytes,
-    font: ImageFont.FreeTypeFont,
-    size: tuple[int, int] = (300, 300),
+    font: "ImageFont.FreeTypeFont",
+    size: tuple[int, int] = THUMBNAIL_SIZE,
 ) -> bytes:
     """Generate thumbnail for the image.
 
@@ -85,15 +599,23 @@ def make_thumbnail(
     Returns:
         The modified image in bytes format.
     """
-    # Open the input image and create a copy in RGB format.
-    im = Image.open(BytesIO(img))
-    pw = im.copy()
+    from PIL import Image, ImageDraw
+
+    im: Image.Image = Image.open(BytesIO(img))
+    # The caption is taken from the header, the image is not decoded yet.
+    caption = f"{im.width}x{im.height} ({im.format}) [{human_size(len(img))}]"
 
-    if pw.mode != "RGB":
-        pw = pw.convert("RGB")
+    # Let the JPEG decoder scale the image down by DCT scaling,
+    # to the smallest scale that is still `reducing_gap` times larger than the thumbnail.
+    im.draft("RGB", (size[0] * THUMBNAIL_REDUCING_GAP, size[1] * THUMBNAIL_REDUCING_GAP))
+    # Palette images are resized with the nearest neighbour, so convert them first.
+    if im.mode in {"1", "P"}:
+        im = im.convert("RGB")
 
-    # Resize the image to the desired size using Lanczos resampling.
-    pw.thumbnail(size=size, resample=Image.Resampling.LANCZOS)
+    # Reduce the image by an integer factor, then resize it using Lanczos resampling.
+    # The image is resized in place, the full-size frame is never copied.
+    im.thumbnail(size=size, resample=Image.Resampling.LANCZOS, reducing_gap=THUMBNAIL_REDUCING_GAP)
+    pw = im if im.mode == "RGB" else im.convert("RGB")
 
     # Create a blank image for the text
     pw_with_line = Image.new(
@@ -103,14 +625,11 @@ def make_thumbnail(
     )
     pw_with_line.paste(pw, box=(0, 0))
 
-    # Get the file size of the input image.
-    fsize = human_size(len(img))
-
     # Draw the text caption
     d = ImageDraw.Draw(pw_with_line)
     d.text(
         xy=(pw.width / 5, pw.height),
-        text=f"{im.width}x{im.height} ({im.format}) [{fsize}]",
+        text=caption,
         font=font,
         fill=(0, 0, 0),
     )
@@ -126,3 +645,186 @@ def make_thumbnail(
     )
 
     return buffer.getvalue()
+
+
+# The caption font of the thumbnail worker process, loaded once by `init_thumbnail_worker`.
+_worker_font: "ImageFont.FreeTypeFont | None" = None
+
+
+def init_thumbnail_worker(font: "ImageFont.FreeTypeFont | None") -> None:
+    """Initialize a thumbnail worker process.
+
+    Args:
+        font: The font to be used for the text captions, or `None` if thumbnails are disabled.
+    """
+    global _worker_font  # noqa: PLW0603
+    _worker_font = font
+
+
+def make_thumbnail_in_worker(img_path: Path, size: tuple[int, int] = THUMBNAIL_SIZE) -> bytes:
+    """Generate thumbnail for the image in a worker process initialized by `init_thumbnail_worker`.
+
+    The image is read by the worker, so it is never loaded into the memory of the main process.
+
+    Args:
+        img_path: The path to the input image.
+        size: The desired size of the thumbnail image. Defaults to (300, 300).
+
+    Returns:
+        The modified image in bytes format.
+    """
+    font = _worker_font or get_font()
+    return make_thumbnail(img_path.read_bytes(), font, size)
+
+
+# The formats the images can be re-encoded to before the upload.
+RECOMPRESS_FORMATS = ("avif", "jpeg", "webp")
+# The formats kept when an image is re-encoded without a target format, the others are re-encoded to PNG.
+KEEP_FORMATS = frozenset({*RECOMPRESS_FORMATS, "png"})
+# The formats of the animations, left as is. The other images with several frames, e.g. the MPO photos
+# of the cameras, are transformed from their first frame.
+ANIMATED_FORMATS = frozenset({"GIF", "PNG", "WEBP"})
+# To fit an image into the byte budget, the quality is lowered in steps down to the minimum,
+# then the image is downscaled by the factor until it fits or reaches the minimum dimension.
+MIN_QUALITY = 40
+QUALITY_STEP = 10
+DOWNSCALE_FACTOR = 0.75
+MIN_DIMENSION = 320
+
+
+class Transform(NamedTuple):
+    """The transformation applied to an image before the upload."""
+
+    max_dimension: int | None = None
+    """The maximum length of the longest side in pixels."""
+    max_bytes: int | None = None
+    """The maximum size of the encoded image in bytes."""
+    format: str | None = None
+    """The format to re-encode the image to, one of `RECOMPRESS_FORMATS`. Kept if `None`."""
+    quality: int = 80
+    """The initial encoder quality, from 1 to 100."""
+    strip_metadata: bool = False
+    """Whether to remove the metadata, see `strip_metadata`."""
+
+
+def encode_image(im: "Image.Image", fmt: str, quality: int, keep_exif: bool = True) -> bytes:
+    """Encode the image, keeping its color profile and optionally its EXIF data.
+
+    Args:
+        im: The image to be encoded.
+        fmt: The lowercase format of the encoded image.
+        quality: The encoder quality, ignored by the lossless formats.
+        keep_exif: Whether to keep the EXIF data.
+
+    Returns:
+        The encoded image in bytes format.
+    """
+    keys = ("exif", "icc_profile") if keep_exif else ("icc_profile",)
+    metadata = {key: im.info[key] for key in keys if im.info.get(key)}
+    buffer = BytesIO()
+    im.save(buffer, format=fmt.upper(), quality=quality, optimize=True, **metadata)
+    return buffer.getvalue()
+
+
+def transform_image(img: bytes, transform: Transform) -> bytes:
+    """Remove the metadata, downscale and re-encode the image before the upload.
+
+    The metadata is removed first, without decoding the image, which may be enough to fit the byte budget.
+    The image is not re-encoded if it is within the limits and no format is requested.
+    Animated images are always left as is, re-encoding would drop their frames.
+    The MPO images are JPEG images with extra frames, e.g. the depth maps, which are dropped.
+    The EXIF orientation is applied to the pixels, as the resized image may be displayed without it.
+
+    Args:
+        img: The input image in bytes format.
+        transform: The transformation to apply.
+
+    Returns:
+        The transformed image in bytes format.
+    """
+    from PIL import Image, ImageOps
+
+    if transform.strip_metadata:
+        img = strip_metadata(img)
+
+    im: Image.Image = Image.open(BytesIO(img))
+    max_dimension, max_bytes = transform.max_dimension, transform.max_bytes
+    oversized = max_dimension is not None and max(im.size) > max_dimension
+    animated = im.format in ANIMATED_FORMATS and getattr(im, "n_frames", 1) > 1
+    if animated or (
+        not oversized and transform.format is None and (max_bytes is None or len(img) <= max_bytes)
+    ):
+        return img
+
+    fmt = transform.format or ("jpeg" if im.format == "MPO" else (im.format or "").lower())
+    if fmt not in KEEP_FORMATS:
+        fmt = "png"
+
+    if max_dimension is not None:
+        # Let the JPEG decoder scale the image down by DCT scaling, as for the thumbnails.
+        im.draft("RGB", (max_dimension * THUMBNAIL_REDUCING_GAP,) * 2)
+    ImageOps.exif_transpose(im, in_place=True)
+
+    # JPEG has no alpha channel, palette images are resized with the nearest neighbour.
+    if fmt == "jpeg" and im.mode not in {"L", "RGB"}:
+        im = im.convert("RGB")
+    elif im.mode in {"1", "P"}:
+        im = im.convert("RGBA" if im.has_transparency_data else "RGB")
+
+    if max_dimension is not None:
+        im.thumbnail(
+            size=(max_dimension, max_dimension),
+            resample=Image.Resampling.LANCZOS,
+            reducing_gap=THUMBNAIL_REDUCING_GAP,
+        )
+
+    return fit_image(im, fmt, transform.quality, max_bytes, keep_exif=not transform.strip_metadata)
+
+
+def fit_image(
+    im: "Image.Image",
+    fmt: str,
+    quality: int,
+    max_bytes: int | None,
+    keep_exif: bool = True,
+) -> bytes:
+    """Encode the image, lowering the quality and then the dimensions until it fits the byte budget.
+
+    Args:
+        im: The image to be encoded.
+        fmt: The lowercase format of the encoded image.
+        quality: The initial encoder quality.
+        max_bytes: The maximum size of the encoded image. The image is encoded once if `None`.
+        keep_exif: Whether to keep the EXIF data.
+
+    Returns:
+        The encoded image in bytes format, larger than `max_bytes`
+        only if it can't be downscaled below `MIN_DIMENSION`.
+    """
+    from PIL import Image
+
+    while True:
+        data = encode_image(im, fmt, quality, keep_exif=keep_exif)
+        if max_bytes is None or len(data) <= max_bytes or max(im.size) <= MIN_DIMENSION:
+            return data
+
+        if fmt != "png" and quality > MIN_QUALITY:
+            quality = max(MIN_QUALITY, quality - QUALITY_STEP)
+        else:
+            size = (round(im.width * DOWNSCALE_FACTOR), round(im.height * DOWNSCALE_FACTOR))
+            im = im.resize(size, resample=Image.Resampling.LANCZOS)
+
+
+def transform_image_in_worker(img_path: Path, transform: Transform) -> bytes:
+    """Transform the image in a worker process.
+
+    The image is read by the worker, so only the transformed image is sent back to the main process.
+
+    Args:
+        img_path: The path to the input image.
+        transform: The transformation to apply.
+
+    Returns:
+        The transformed image in bytes format.
+    """
+    return transform_image(img_path.read_bytes(), transform)
@@ -0,0 +1,186 @@
+"""Append-only journal of the uploaded images, used to resume an interrupted run."""
+
+import json
+from collections.abc import AsyncIterable, AsyncIterator, Callable, Iterable, Sequence
+from io import SEEK_END
+from pathlib import Path
+
+from loguru import logger
+
+from images_upload_cli.main import UploadRecord, iter_batches
+
+# The number of images enumerated at once in a worker thread when skipping the journaled ones.
+SKIP_BATCH_SIZE = 100
+
+
+def read_journal(
+    path: Path,
+    hostings: Sequence[str],
+    thumbnail: bool,
+) -> dict[str, tuple[str, str, str | None]]:
+    """Read the uploads recorded in a journal.
+
+    The entries of the other hostings, and without a thumbnail if thumbnails are requested or vice versa, are ignored.
+    A truncated last entry, left by a killed run, is ignored too.
+
+    Args:
+        path: The path to the journal file.
+        hostings: The hostings of the run.
+        thumbnail: Whether the thumbnails are uploaded along with the images.
+
+    Returns:
+        The hosting and the links of the uploaded images by their absolute path, the last entry wins.
+    """
+    entries: dict[str, tuple[str, str, str | None]] = {}
+    try:
+        f = path.open(encoding="utf-8")
+    except FileNotFoundError:
+        return entries
+
+    with f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                key, hosting = entry["path"], entry["hosting"]
+                img_link, thumb_link = entry["url"], entry["thumbnail_url"]
+            except (ValueError, KeyError, TypeError):
+                logger.warning(f"Skipping the malformed entry of the journal '{path}'.")
+                continue
+            if hosting in hostings and (thumb_link is not None) == thumbnail:
+                entries[key] = (hosting, img_link, thumb_link)
+
+    return entries
+
+
+class UploadJournal:
+    """Append-only JSON Lines log of the uploaded images.
+
+    Each uploaded image is appended as soon as it is uploaded, so an interrupted run can be resumed:
+    the journaled images are skipped and their links are merged with the new ones in the order of the images.
+    When the links are streamed instead of collected, only the journaled images not seen yet are kept in memory,
+    so the memory use doesn't grow with the number of images.
+    """
+
+    def __init__(
+        self: "UploadJournal",
+        path: Path,
+        *,
+        resume: bool = False,
+        hostings: Sequence[str] = (),
+        thumbnail: bool = False,
+        on_upload: Callable[[UploadRecord], None] | None = None,
+        collect: bool = True,
+    ) -> None:
+        """Open the journal, creating it if necessary.
+
+        Args:
+            path: The path to the journal file.
+            resume: Whether to skip the images already recorded in the journal.
+            hostings: The hostings of the run, the entries of the other hostings are not reused.
+            thumbnail: Whether the thumbnails are uploaded along with the images.
+            on_upload: The function called with the record of each image, including the journaled ones.
+            collect: Whether to keep the links of the images for `links`.
+        """
+        self.path = path
+        self.on_upload = on_upload
+        self.collect = collect
+        self.entries = read_journal(path, hostings, thumbnail) if resume else {}
+        self.links_by_path: dict[str, tuple[str, str | None]] = {}
+        self.order: list[str] = []
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Unbuffered, so every entry reaches the file in a single write as soon as it is written.
+        self.file = path.open("ab", buffering=0)
+        # Terminate an entry truncated by a killed run, so it doesn't corrupt the next one.
+        if self.file.tell() > 0:
+            with path.open("rb") as f:
+                f.seek(-1, SEEK_END)
+                if f.read(1) != b"\n":
+                    self.file.write(b"\n")
+
+    def close(self: "UploadJournal") -> None:
+        """Close the journal file."""
+        self.file.close()
+
+    async def skip(
+        self: "UploadJournal", images: Iterable[Path] | AsyncIterable[Path]
+    ) -> AsyncIterator[Path]:
+        """Skip the journaled images, keeping track of the order of all the images.
+
+        An iterable is consumed in a worker thread, see `main.iter_batches`,
+        while the records of the journaled images are handed over in the event loop, like the uploaded ones.
+
+        Args:
+            images: The paths of the images, consumed lazily.
+
+        Yields:
+            The paths of the images not uploaded yet.
+        """
+        skipped = 0
+        async for img_path in flatten(iter_batches(images, SKIP_BATCH_SIZE)):
+            key = str(img_path.absolute())
+            if self.collect:
+                self.order.append(key)
+            # The entry is released once its image is seen.
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                yield img_path
+                continue
+
+            hosting, img_link, thumb_link = entry
+            if self.collect:
+                self.links_by_path[key] = img_link, thumb_link
+            skipped += 1
+            if self.on_upload is not None:
+                self.on_upload(
+                    UploadRecord(
+                        img_path, hosting, url=img_link, thumbnail_url=thumb_link, cached=True
+                    )
+                )
+
+        if skipped:
+            logger.info(f"Skipped {skipped} images found in the journal '{self.path}'.")
+
+    def write(self: "UploadJournal", record: UploadRecord) -> None:
+        """Append the uploaded image to the journal and hand over its record.
+
+        Args:
+            record: The record of the image, not journaled if the upload failed.
+        """
+        if record.links is not None:
+            key = str(record.path.absolute())
+            entry = {
+                "path": key,
+                "hosting": record.hosting,
+                "url": record.url,
+                "thumbnail_url": record.thumbnail_url,
+            }
+            self.file.write(json.dumps(entry).encode() + b"\n")
+            if self.collect:
+                self.links_by_path[key] = record.links
+
+        if self.on_upload is not None:
+            self.on_upload(record)
+
+    def links(self: "UploadJournal") -> list[tuple[str, str | None]]:
+        """Get the links of the journaled and the uploaded images.
+
+        Returns:
+            The links to the images and their thumbnails in the order of the images,
+            without the images failed to upload. Empty if the links are not collected.
+        """
+        return [self.links_by_path[key] for key in self.order if key in self.links_by_path]
+
+
+async def flatten(batches: AsyncIterable[Sequence[Path]]) -> AsyncIterator[Path]:
+    """Flatten the batches of the images.
+
+    Args:
+        batches: The batches of the images.
+
+    Yields:
+        The paths of the images.
+    """
+    async for batch in batches:
+        for img_path in batch:
+            yield img_path
@@ -1,13 +1,22 @@
 """Logger configuration."""
 
 import logging
+import sys
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
 
 from loguru import logger
-from rich.logging import RichHandler
+
+if TYPE_CHECKING:
+    from loguru import Message
 
 
 class ErrorHandler(logging.StreamHandler):
-    """Custom error handler for logging."""
+    """Custom error handler for logging.
+
+    Errors logged in the `recoverable` context, e.g. by an upload with a fallback hosting, are ignored.
+    """
 
     def __init__(self: "ErrorHandler") -> None:
         """Init."""
@@ -16,7 +25,8 @@ class ErrorHandler(logging.StreamHandler):
 
     def emit(self: "ErrorHandler", record: logging.LogRecord) -> None:
         """Emit a record."""
-        if record.levelno >= logging.ERROR:
+        extra = getattr(record, "extra", {})
+        if record.levelno >= logging.ERROR and not extra.get("recoverable"):
             self.error_occurred = True
 
     def has_error_occurred(self: "ErrorHandler") -> bool:
@@ -27,6 +37,8 @@ class ErrorHandler(logging.StreamHandler):
 def setup_logger(log_level: str) -> ErrorHandler:
     """Configure logger.
 
+    The console handler uses `rich` only if stderr is a terminal.
+
     Args:
         log_level: The log level to set for the logger.
 
@@ -35,13 +47,54 @@ def setup_logger(log_level: str) -> ErrorHandler:
     """
     logger.remove()
     # Console handler
-    logger.add(
-        sink=RichHandler(log_time_format="[%X]", rich_tracebacks=True),
-        level=log_level,
-        format=lambda _: "{message}",
-    )
+    if sys.stderr.isatty():
+        from rich.logging import RichHandler
+
+        logger.add(
+            sink=RichHandler(log_time_format="[%X]", rich_tracebacks=True),
+            level=log_level,
+            format=lambda _: "{message}",
+        )
+    else:
+        logger.add(
+            sink=sys.stderr,
+            level=log_level,
+            format="[{time:HH:mm:ss}] {level: <8} {message}",
+        )
     # Error handler
     error_handler = ErrorHandler()
     logger.add(sink=error_handler, level="ERROR")
 
     return error_handler
+
+
+@contextmanager
+def capture_errors() -> Iterator[list[str]]:
+    """Collect the reasons of the errors logged in the context, including the tasks started in it.
+
+    The errors are still handled by the other sinks.
+
+    Yields:
+        The list of the reasons, filled as the errors are logged.
+        The reason of a caught exception is its type and message.
+    """
+    errors: list[str] = []
+
+    def sink(message: "Message") -> None:
+        exception = message.record["exception"]
+        if exception is not None and exception.type is not None:
+            errors.append(f"{exception.type.__name__}: {exception.value}")
+        else:
+            errors.append(message.record["message"])
+
+    handler_id = logger.add(
+        sink,
+        level="ERROR",
+        format="{message}",
+        filter=lambda record: record["extra"].get("errors") is errors,
+    )
+    try:
+        with logger.contextualize(errors=errors):
+            yield errors
+    finally:
+        logger.remove(handler_id)
@@ -1,57 +1,1030 @@
 """Main logic for the images-upload-cli package."""
 
-from collections.abc import Awaitable, Callable, Sequence
+import asyncio
+import json
+import struct
+from collections.abc import (
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Coroutine,
+    Iterable,
+    Mapping,
+    Sequence,
+)
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import AsyncExitStack, ExitStack
+from dataclasses import asdict, dataclass, field
+from functools import partial
+from itertools import islice
+from operator import itemgetter
+from os import cpu_count, fstat
 from pathlib import Path
+from time import perf_counter
+from typing import TYPE_CHECKING, Any, BinaryIO, TypeVar, cast
 
-from httpx import AsyncClient
+from httpx import AsyncClient, Limits, Timeout
+from loguru import logger
 
-from images_upload_cli.image import get_font, make_thumbnail
+from images_upload_cli.cache import ThumbnailCache, UploadCache, derive_key, file_digest
+from images_upload_cli.image import (
+    HEADER_SIZE,
+    THUMBNAIL_SIZE,
+    THUMBNAIL_VERSION,
+    Transform,
+    get_font,
+    init_thumbnail_worker,
+    make_thumbnail_in_worker,
+    sniff_image,
+    transform_image_in_worker,
+)
+from images_upload_cli.logger import capture_errors
+from images_upload_cli.transport import DEFAULT_LIMITS, DEFAULT_TIMEOUT, make_client
+from images_upload_cli.upload import BATCH_UPLOAD, RATE_LIMITS, UPLOAD
+from images_upload_cli.util import TimedReader
+
+if TYPE_CHECKING:
+    from PIL import ImageFont
+
+# The number of batches in flight per concurrent request.
+MAX_PENDING_BATCHES = 2
+
+T = TypeVar("T")
+
+
+@dataclass
+class UploadRecord:
+    """The outcome of the upload of an image to a hosting, with the data sent and the time spent."""
+
+    path: Path
+    """The path of the image."""
+    hosting: str
+    """The hosting the image was uploaded to, the last one tried if the upload failed."""
+    url: str | None = None
+    """The link to the image, `None` if the upload failed."""
+    thumbnail_url: str | None = None
+    """The link to the thumbnail, `None` if thumbnails are disabled or the upload failed."""
+    format: str | None = None
+    """The format of the uploaded image, `None` if it is not recognized by its header."""
+    size: int | None = None
+    """The number of bytes of the uploaded image, after the transformation if any."""
+    thumbnail_size: int | None = None
+    """The number of bytes of the uploaded thumbnail."""
+    cached: bool = False
+    """Whether the links were found in the cache, so nothing was uploaded."""
+    timings: dict[str, float] = field(default_factory=dict)
+    """The seconds spent in the phases of the upload: `read`, `sniff`, `transform`, `thumbnail`, `http`
+    and `thumbnail_http`. The phases of a batch request are timed per request, the skipped phases are absent."""
+    error: str | None = None
+    """The reason of the failure, `None` if the upload succeeded."""
+
+    @property
+    def links(self: "UploadRecord") -> tuple[str, str | None] | None:
+        """The links to the image and its thumbnail, `None` if the upload failed."""
+        return None if self.url is None else (self.url, self.thumbnail_url)
 
 
 async def upload_images(
-    upload_func: Callable[[AsyncClient, bytes], Awaitable[str]],
-    images: tuple[Path],
+    hosting: str | Sequence[str],
+    images: Iterable[Path] | AsyncIterable[Path],
     thumbnail: bool,
+    *,
+    jobs: int = 4,
+    batch_size: int = 10,
+    race: Sequence[str] = (),
+    mirrors: bool = False,
+    cache: UploadCache | None = None,
+    thumbnail_cache: ThumbnailCache | None = None,
+    transform: Transform | None = None,
+    retries: int = 3,
+    http2: bool = False,
+    limits: Limits = DEFAULT_LIMITS,
+    timeout: Timeout = DEFAULT_TIMEOUT,
+    on_upload: Callable[[UploadRecord], None] | None = None,
+    clients: Mapping[str, AsyncClient] | None = None,
+    executor: Executor | None = None,
 ) -> Sequence[tuple[str, str | None]]:
-    """Upload images using the specified upload function and optionally generate thumbnails.
+    """Upload images to the specified hosting service and optionally generate thumbnails.
+
+    Up to `jobs` requests are sent concurrently, the order of the links matches the order of the images.
+    The images are consumed lazily, e.g. from `image.iter_images`,
+    so the enumeration of a large tree overlaps with the uploads.
+    With `on_upload`, the record of each image is handed over as soon as it is available
+    instead of the links being collected, so the memory use doesn't grow with the number of images.
+    If the hosting accepts several files per request, the images are sent in batches of `batch_size`,
+    otherwise one by one.
+    If several hostings are given, they form a fallback chain: the images failed to upload
+    are uploaded to the next hosting in order.
+    In race mode, each image is uploaded to all the `race` hostings concurrently
+    and the first successful upload wins. The slower uploads are cancelled,
+    or left to finish if `mirrors` is enabled.
+    Thumbnails are generated and the images are transformed in a pool of worker processes,
+    so they don't block the uploads.
+    Images found in the cache are not uploaded again, thumbnails found in the cache are not generated again.
+    The requests are paced according to the rate limit of the hosting,
+    the requests failed with transient errors are retried with exponential backoff.
+    A long-running caller, e.g. the daemon, can pass its own clients and executor,
+    so the connections and the workers stay warm between the calls.
 
     Args:
-        upload_func: The function used to upload the images.
-        images: The paths of the images to be uploaded.
+        hosting: The hosting service to use for uploading the images, or the fallback chain of hostings.
+        images: The paths of the images to be uploaded, an iterable consumed in a worker thread,
+            or an async iterable, e.g. from `watch.watch_images`.
         thumbnail: Indicates whether to generate thumbnails for the images.
+        jobs: The maximum number of requests sent concurrently to a hosting.
+        batch_size: The maximum number of images sent in a single request.
+        race: The hosting services to race the uploads across. Takes precedence over `hosting`.
+        mirrors: Whether to let the slower uploads of a race finish and log their links.
+        cache: The cache of the previously uploaded images. Disabled if `None`.
+        thumbnail_cache: The cache of the previously generated thumbnails. Disabled if `None`.
+        transform: The downscaling and re-encoding applied to the images before the upload.
+            The images are uploaded as is if `None`.
+        retries: The maximum number of retries of a request failed with a transient error.
+        http2: Whether to enable HTTP/2 for the connections to the hostings.
+        limits: The connection pool limits.
+        timeout: The timeouts of the connect, read, write and pool phases.
+        on_upload: The function called with the record of each image, including the failed ones,
+            in the order of completion. The links are collected if `None`.
+        clients: The open clients of the hostings, see `transport.make_client`.
+            The missing clients are created with the client options and closed on return.
+        executor: The executor generating the thumbnails and transforming the images,
+            initialized by `make_executor` with the caption font. Created and shut down on return if `None`.
 
     Returns:
-        The links to the uploaded images and their corresponding thumbnails.
+        The links to the uploaded images and their corresponding thumbnails,
+        empty if `on_upload` is given.
         The thumbnail link will be `None` if generation is disabled.
     """
-    links = []
+    hostings = tuple(dict.fromkeys(race or ([hosting] if isinstance(hosting, str) else hosting)))
+    if race or hostings[0] not in BATCH_UPLOAD:
+        batch_size = 1
 
-    if thumbnail:
-        font = get_font()
+    font = get_font() if thumbnail else None
+    owned_executor = None
+    if executor is None and (thumbnail or transform is not None):
+        executor = owned_executor = make_executor(jobs, font)
 
-    async with AsyncClient() as client:
-        for img_path in images:
-            img = img_path.read_bytes()
+    semaphores = {name: asyncio.Semaphore(jobs) for name in hostings}
+    mirror_tasks: dict[asyncio.Task[list[UploadRecord]], str] = {}
+
+    @split_batches
+    async def upload_limited(
+        hosting: str,
+        img_paths: Sequence[Path],
+        *,
+        digester: Callable[[Path], "asyncio.Future[str]"],
+        thumbnailer: Callable[[Path], "asyncio.Future[bytes]"] | None,
+        transformer: Callable[[Path], "asyncio.Future[bytes]"] | None,
+    ) -> list[UploadRecord]:
+        async with semaphores[hosting]:
+            # The failures are recoverable while another hosting can take over.
+            with logger.contextualize(recoverable=len(hostings) > 1):
+                return await upload_batch(
+                    hosting_clients[hosting],
+                    hosting,
+                    img_paths,
+                    thumbnailer=thumbnailer,
+                    transform=transform,
+                    transformer=transformer,
+                    cache=cache,
+                    digester=digester,
+                )
+
+    async def upload_hostings(img_paths: Sequence[Path]) -> list[UploadRecord]:
+        # The images are processed once for all the hostings of a batch, and released along with it.
+        # Their content hashes are shared by the upload cache and the thumbnail cache.
+        shared = len(hostings) > 1
+        digester = share_futures(file_digest_future, shared=True)
+        thumbnailer, transformer = make_processors(
+            executor, font, transform, thumbnail_cache, digester
+        )
+        upload = partial(
+            upload_limited,
+            digester=digester,
+            thumbnailer=share_futures(thumbnailer, shared) if thumbnailer is not None else None,
+            transformer=share_futures(transformer, shared) if transformer is not None else None,
+        )
+        if race:
+            return await upload_race(
+                upload, hostings, img_paths, mirror_tasks=mirror_tasks if mirrors else None
+            )
+        return await upload_chain(upload, hostings, img_paths)
+
+    try:
+        async with AsyncExitStack() as stack:
+            hosting_clients = await open_clients(
+                stack,
+                hostings,
+                clients or {},
+                retries=retries,
+                http2=http2,
+                limits=limits,
+                timeout=timeout,
+            )
+            results: list[tuple[int, list[UploadRecord]]] = []
+            async for start, records in upload_lazily(
+                upload_hostings, images, batch_size, MAX_PENDING_BATCHES * jobs
+            ):
+                if len(hostings) > 1:
+                    log_failures(records)
+                if on_upload is None:
+                    results.append((start, records))
+                else:
+                    hand_over(records, on_upload)
+
+            await log_mirrors(mirror_tasks)
+    finally:
+        if owned_executor is not None:
+            owned_executor.shutdown(cancel_futures=True)
+
+    results.sort(key=itemgetter(0))
+    return [
+        record.links for _, records in results for record in records if record.links is not None
+    ]
+
+
+async def open_clients(
+    stack: AsyncExitStack,
+    hostings: Sequence[str],
+    clients: Mapping[str, AsyncClient],
+    *,
+    retries: int,
+    http2: bool,
+    limits: Limits,
+    timeout: Timeout,
+) -> dict[str, AsyncClient]:
+    """Reuse the open clients of the hostings and open the missing ones.
+
+    Args:
+        stack: The exit stack closing the opened clients.
+        hostings: The hostings to get the clients of.
+        clients: The open clients of the hostings, kept open.
+        retries: The maximum number of retries of a request failed with a transient error.
+        http2: Whether to enable HTTP/2 for the connections to the hostings.
+        limits: The connection pool limits.
+        timeout: The timeouts of the connect, read, write and pool phases.
+
+    Returns:
+        The clients of the hostings.
+    """
+    return {
+        name: clients[name]
+        if name in clients
+        else await stack.enter_async_context(
+            make_client(
+                RATE_LIMITS[name], retries=retries, http2=http2, limits=limits, timeout=timeout
+            )
+        )
+        for name in hostings
+    }
+
+
+async def upload_lazily(
+    upload: Callable[[Sequence[Path]], Coroutine[Any, Any, list[UploadRecord]]],
+    images: Iterable[Path] | AsyncIterable[Path],
+    batch_size: int,
+    max_pending: int,
+) -> AsyncIterator[tuple[int, list[UploadRecord]]]:
+    """Upload the batches of the images as soon as they are enumerated, and yield them as soon as they are uploaded.
+
+    Args:
+        upload: The function uploading a batch of images.
+        images: The paths of the images, consumed lazily.
+        batch_size: The maximum number of images in a batch.
+        max_pending: The maximum number of batches in flight,
+            so the images are not enumerated far ahead of the uploads.
+
+    Yields:
+        The position of the first image of the batch in the enumeration and the records of the images.
+        The batches are yielded in the order of completion.
+    """
+    batches = iter_batches(images, batch_size)
+
+    async def pull() -> list[Path] | None:
+        return await anext(batches, None)
+
+    tasks: dict[asyncio.Task[list[UploadRecord]], int] = {}
+    next_batch: asyncio.Task[list[Path] | None] | None = asyncio.create_task(pull())
+    position = 0
+    try:
+        while tasks or next_batch is not None:
+            # Wait for the next batch only while there is room for it.
+            waiting: set[asyncio.Task[Any]] = set(tasks)
+            if next_batch is not None and len(tasks) < max_pending:
+                waiting.add(next_batch)
+            done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+
+            if next_batch in done:
+                batch = next_batch.result()
+                next_batch = None
+                if batch is not None:
+                    tasks[asyncio.create_task(upload(batch))] = position
+                    position += len(batch)
+                    next_batch = asyncio.create_task(pull())
+
+            for task in done & tasks.keys():
+                yield tasks.pop(task), task.result()
+    finally:
+        # Cancel the uploads if the enumeration or one of the uploads failed.
+        for task in tasks:
+            task.cancel()
+        if next_batch is not None:
+            next_batch.cancel()
+
+
+def log_failures(records: Sequence[UploadRecord]) -> None:
+    """Log the images failed to upload to all the hostings.
+
+    Args:
+        records: The records of the images.
+    """
+    for record in records:
+        if record.links is None:
+            logger.error(f"Failed to upload '{record.path}' to any of the hostings.")
+
+
+def hand_over(records: Sequence[UploadRecord], on_upload: Callable[[UploadRecord], None]) -> None:
+    """Hand over the records of the images, including the failed ones.
+
+    Args:
+        records: The records of the images.
+        on_upload: The function called with the record of each image.
+    """
+    for record in records:
+        on_upload(record)
+
+
+async def iter_batches(
+    images: Iterable[Path] | AsyncIterable[Path], batch_size: int
+) -> AsyncIterator[list[Path]]:
+    """Split the images into batches, consuming an iterable in a worker thread.
+
+    A slow enumeration, e.g. of a large directory tree or of the paths read from stdin,
+    doesn't block the event loop. An async iterable, e.g. of the images appearing in a watched directory,
+    is consumed in the event loop.
+
+    Args:
+        images: The paths of the images.
+        batch_size: The maximum number of images in a batch.
+
+    Yields:
+        The batches of the images, each complete when `batch_size` images are enumerated
+        or the iterable is exhausted.
+    """
+    if isinstance(images, AsyncIterable):
+        batch = []
+        async for img_path in images:
+            batch.append(img_path)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+        return
+
+    it = iter(images)
+    while batch := await asyncio.to_thread(list, islice(it, batch_size)):
+        yield batch
+
+
+def make_executor(jobs: int, font: "ImageFont.FreeTypeFont | None") -> ProcessPoolExecutor:
+    """Create the pool of worker processes generating the thumbnails and transforming the images.
+
+    Args:
+        jobs: The maximum number of concurrent requests, the pool doesn't exceed the number of CPUs.
+        font: The font of the thumbnail captions, or `None` if thumbnails are disabled.
+
+    Returns:
+        The process pool executor.
+    """
+    return ProcessPoolExecutor(
+        max_workers=min(jobs, cpu_count() or 1),
+        initializer=init_thumbnail_worker,
+        initargs=(font,),
+    )
 
-            img_link = await upload_func(client, img)
-            # If the upload fails, skip the current image and proceed with the next one.
-            if not img_link:
-                continue
 
-            if thumbnail:
-                thumb = make_thumbnail(img, font)  # pyright: ignore[reportPossiblyUnboundVariable]
-                thumb_link = await upload_func(client, thumb)
-                # If the upload fails, skip the current image and proceed with the next one.
-                if not thumb_link:
-                    continue
+def file_digest_future(img_path: Path) -> "asyncio.Future[str]":
+    """Start calculating the content hash of an image in a worker thread.
+
+    Args:
+        img_path: The path of the image.
+
+    Returns:
+        The future of the hex digest of the image.
+    """
+    return asyncio.ensure_future(asyncio.to_thread(file_digest, img_path))
+
+
+def make_processors(
+    executor: Executor | None,
+    font: "ImageFont.FreeTypeFont | None",
+    transform: Transform | None,
+    thumbnail_cache: ThumbnailCache | None,
+    digester: Callable[[Path], "asyncio.Future[str]"] = file_digest_future,
+) -> tuple[
+    Callable[[Path], "asyncio.Future[bytes]"] | None,
+    Callable[[Path], "asyncio.Future[bytes]"] | None,
+]:
+    """Create the functions starting the generation of the thumbnails and the transformation of the images.
+
+    Args:
+        executor: The executor processing the images, initialized with `font`.
+        font: The font of the thumbnail captions, or `None` if thumbnails are disabled.
+        transform: The transformation applied to the images, or `None` to upload them as is.
+        thumbnail_cache: The cache of the previously generated thumbnails. Disabled if `None`.
+        digester: The function starting the hashing of an image, for the thumbnail cache.
+
+    Returns:
+        The thumbnailer and the transformer, each `None` if disabled.
+    """
+    thumbnailer = transformer = None
+    if executor is not None and font is not None:
+        thumbnailer = make_thumbnailer(executor, font, cache=thumbnail_cache, digester=digester)
+    if executor is not None and transform is not None:
+        transformer = make_transformer(executor, transform)
+    return thumbnailer, transformer
+
+
+def make_thumbnailer(
+    executor: Executor,
+    font: "ImageFont.FreeTypeFont",
+    *,
+    cache: ThumbnailCache | None = None,
+    digester: Callable[[Path], "asyncio.Future[str]"] = file_digest_future,
+) -> Callable[[Path], "asyncio.Future[bytes]"]:
+    """Create the function starting the generation of the thumbnail of an image in the executor.
+
+    Args:
+        executor: The executor generating the thumbnails, initialized with `font`.
+        font: The font of the thumbnail captions.
+        cache: The cache of the previously generated thumbnails. Disabled if `None`.
+        digester: The function starting the hashing of an image, for the cache.
+
+    Returns:
+        The function returning the future of the thumbnail of an image.
+    """
+    loop = asyncio.get_running_loop()
+
+    async def generate(img_path: Path) -> bytes:
+        if cache is None:
+            return await loop.run_in_executor(executor, make_thumbnail_in_worker, img_path)
+
+        # The thumbnail is fully determined by the image, its size, the font and the rendering.
+        digest = await digester(img_path)
+        key = derive_key(digest, THUMBNAIL_SIZE, font.path, font.size, THUMBNAIL_VERSION)
+        if (thumb := cache.get(key)) is not None:
+            logger.debug(f"Thumbnail cache hit for '{img_path}'.")
+            return thumb
+
+        thumb = await loop.run_in_executor(executor, make_thumbnail_in_worker, img_path)
+        cache.set(key, thumb)
+        return thumb
+
+    return lambda img_path: asyncio.ensure_future(generate(img_path))
+
+
+def make_transformer(
+    executor: Executor,
+    transform: Transform,
+) -> Callable[[Path], "asyncio.Future[bytes]"]:
+    """Create the function starting the transformation of an image in the executor.
+
+    Args:
+        executor: The executor transforming the images.
+        transform: The transformation applied to the images.
+
+    Returns:
+        The function returning the future of the transformed image.
+    """
+    loop = asyncio.get_running_loop()
+    return lambda img_path: loop.run_in_executor(
+        executor, transform_image_in_worker, img_path, transform
+    )
+
+
+def split_batches(
+    upload: Callable[..., Coroutine[Any, Any, list[UploadRecord]]],
+) -> Callable[..., Coroutine[Any, Any, list[UploadRecord]]]:
+    """Split the batches sent to a hosting without a batch API into single images.
+
+    A batch reaches such a hosting when it falls back from a hosting with a batch API,
+    so each image takes a request slot of its own and the concurrency stays within the limit.
+
+    Args:
+        upload: The function uploading the images to a hosting, with the hosting and the paths
+            of the images as the first arguments.
+
+    Returns:
+        The function uploading the images to a hosting, one image per call for the hostings without a batch API.
+    """
+
+    async def upload_split(
+        hosting: str,
+        img_paths: Sequence[Path],
+        **kwargs: Any,  # noqa: ANN401
+    ) -> list[UploadRecord]:
+        if len(img_paths) == 1 or hosting in BATCH_UPLOAD:
+            return await upload(hosting, img_paths, **kwargs)
+        batches = await asyncio.gather(
+            *(upload(hosting, [img_path], **kwargs) for img_path in img_paths)
+        )
+        return [record for records in batches for record in records]
+
+    return upload_split
+
+
+def share_futures(
+    start: Callable[[Path], "asyncio.Future[T]"],
+    shared: bool,
+) -> Callable[[Path], "asyncio.Future[T]"]:
+    """Optionally share the futures started for an image between all the uploads of the image.
+
+    A shared future is not cancelled when one of the uploads fails or loses a race.
+    The futures are kept as long as the returned function, so it is created for each batch
+    rather than for a whole run, which can be endless, e.g. when watching a directory.
+
+    Args:
+        start: The function starting the processing of an image.
+        shared: Whether to start the processing of an image once.
+
+    Returns:
+        The function returning the future of the processed image.
+    """
+    if not shared:
+        return start
+
+    futures: dict[Path, asyncio.Future[T]] = {}
+
+    def get_future(img_path: Path) -> "asyncio.Future[T]":
+        if img_path not in futures:
+            futures[img_path] = start(img_path)
+        return asyncio.shield(futures[img_path])
+
+    return get_future
+
+
+async def upload_chain(
+    upload: Callable[[str, Sequence[Path]], Coroutine[Any, Any, list[UploadRecord]]],
+    hostings: Sequence[str],
+    img_paths: Sequence[Path],
+) -> list[UploadRecord]:
+    """Upload the images to the first hosting, falling back to the next ones for the failed images.
+
+    Args:
+        upload: The function uploading the images to a hosting.
+        hostings: The fallback chain of hostings.
+        img_paths: The paths of the images to be uploaded.
+
+    Returns:
+        The records of the images in the order of the images,
+        the record of the last hosting for the images failed to upload to all the hostings.
+    """
+    results: list[UploadRecord] = []
+    pending = list(range(len(img_paths)))
+    for n, hosting in enumerate(hostings):
+        if n > 0:
+            for i in pending:
+                logger.warning(f"Falling back to '{hosting}' for '{img_paths[i]}'.")
+
+        records = await upload(hosting, [img_paths[i] for i in pending])
+        if n == 0:
+            results = records
+        else:
+            for i, record in zip(pending, records, strict=True):
+                results[i] = record
+
+        pending = [i for i in pending if results[i].links is None]
+        if not pending:
+            break
+
+    return results
+
+
+async def upload_race(
+    upload: Callable[[str, Sequence[Path]], Coroutine[Any, Any, list[UploadRecord]]],
+    hostings: Sequence[str],
+    img_paths: Sequence[Path],
+    mirror_tasks: dict["asyncio.Task[list[UploadRecord]]", str] | None = None,
+) -> list[UploadRecord]:
+    """Upload the images to all the hostings concurrently and keep the first successful upload.
+
+    Args:
+        upload: The function uploading the images to a hosting.
+        hostings: The racing hostings.
+        img_paths: The paths of the images to be uploaded.
+        mirror_tasks: The collection of the uploads that lost the race, left to finish.
+            The slower uploads are cancelled if `None`.
+
+    Returns:
+        The records of the first successful upload, or of the last failed upload if all the uploads failed.
+    """
+    tasks = {asyncio.create_task(upload(hosting, img_paths)): hosting for hosting in hostings}
+    results: list[UploadRecord] = []
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                results = task.result()
+                if all(record.links is not None for record in results):
+                    logger.debug(f"Race won by '{tasks[task]}'.")
+                    return results
+    finally:
+        for task in pending:
+            if mirror_tasks is not None:
+                mirror_tasks[task] = tasks[task]
             else:
-                thumb_link = None
+                task.cancel()
+
+    return results
+
+
+async def log_mirrors(
+    tasks: dict["asyncio.Task[list[UploadRecord]]", str],
+) -> None:
+    """Wait for the uploads that lost a race and log their links.
+
+    Args:
+        tasks: The uploads that lost a race and their hostings.
+    """
+    for task, hosting in tasks.items():
+        for record in await task:
+            if record.url is not None:
+                logger.info(f"Mirror on '{hosting}': {record.url}")
+
+
+async def upload_files(
+    client: AsyncClient,
+    hosting: str,
+    imgs: Sequence[bytes | BinaryIO],
+) -> list[str]:
+    """Upload the images to the hosting, in a single request if the hosting supports it.
+
+    Otherwise, the images are uploaded concurrently, one per request.
 
-            links.append((img_link, thumb_link))
+    Args:
+        client: The async HTTP client used to make the API requests.
+        hosting: The hosting service to use for uploading the images.
+        imgs: The images data or the binary files to be uploaded.
+
+    Returns:
+        The URLs of the uploaded images in the order of the images.
+        The URL is an empty string if the upload of the image failed.
+    """
+    if not imgs:
+        return []
 
+    batch_func = BATCH_UPLOAD.get(hosting)
+    if batch_func is None or len(imgs) == 1:
+        upload_func = UPLOAD[hosting]
+        return list(await asyncio.gather(*(upload_func(client, img) for img in imgs)))
+
+    links = await batch_func(client, imgs)
+    # Treat a response that can't be mapped back to the images as a failure of the batch.
+    if len(links) != len(imgs):
+        return [""] * len(imgs)
+    return list(links)
+
+
+def track_future(
+    future: "asyncio.Future[bytes]", record: UploadRecord, phase: str
+) -> "asyncio.Future[bytes]":
+    """Record the time until the future is done as a phase of the upload.
+
+    Args:
+        future: The future processing the image.
+        record: The record of the image.
+        phase: The name of the phase.
+
+    Returns:
+        The same future.
+    """
+    started = perf_counter()
+    future.add_done_callback(lambda _: record.timings.__setitem__(phase, perf_counter() - started))
+    return future
+
+
+def sniff_record(record: UploadRecord, header: bytes) -> None:
+    """Record the format of the uploaded image, identified by its header.
+
+    Args:
+        record: The record of the image.
+        header: The first bytes of the image.
+    """
+    started = perf_counter()
+    info = sniff_image(header)
+    record.timings["sniff"] = perf_counter() - started
+    record.format = info.format if info is not None else None
+
+
+async def upload_timed(
+    client: AsyncClient,
+    hosting: str,
+    imgs: Sequence[bytes | BinaryIO],
+    records: Sequence[UploadRecord],
+    phase: str,
+) -> list[str]:
+    """Upload the images to the hosting, recording the time spent in the requests.
+
+    Args:
+        client: The async HTTP client used to make the API requests.
+        hosting: The hosting service to use for uploading the images.
+        imgs: The images data or the binary files to be uploaded.
+        records: The records of the images.
+        phase: The name of the phase.
+
+    Returns:
+        The URLs of the uploaded images in the order of the images.
+        The URL is an empty string if the upload of the image failed.
+    """
+    started = perf_counter()
+    links = await upload_files(client, hosting, imgs)
+    for record in records:
+        record.timings[phase] = perf_counter() - started
     return links
 
 
+async def upload_paths(
+    client: AsyncClient,
+    hosting: str,
+    records: Sequence[UploadRecord],
+    transformer: Callable[[Path], "asyncio.Future[bytes]"] | None = None,
+) -> list[str]:
+    """Upload the image files, transforming them first if requested.
+
+    The size, the format and the timings of the images are recorded along the way.
+
+    Args:
+        client: The async HTTP client used to make the API requests.
+        hosting: The hosting service to use for uploading the images.
+        records: The records of the images to be uploaded.
+        transformer: The function starting the transformation of an image.
+            The images are uploaded as is if `None`.
+
+    Returns:
+        The URLs of the uploaded images in the order of the images.
+        The URL is an empty string if the upload of the image failed.
+    """
+    if transformer is not None:
+        # Only the transformed images are loaded into memory, the originals are read by the workers.
+        transformed = await gather_images(
+            [track_future(transformer(record.path), record, "transform") for record in records],
+            records,
+        )
+        for record, img in transformed:
+            record.size = len(img)
+            sniff_record(record, img[:HEADER_SIZE])
+        links = await upload_timed(
+            client,
+            hosting,
+            [img for _, img in transformed],
+            [record for record, _ in transformed],
+            "http",
+        )
+        return spread_links(records, links)
+
+    # The files are streamed by the client, so they are never fully loaded into memory.
+    with ExitStack() as stack:
+        opened: list[tuple[UploadRecord, TimedReader]] = []
+        for record in records:
+            try:
+                f = stack.enter_context(record.path.open("rb"))
+                record.size = fstat(f.fileno()).st_size
+                sniff_record(record, f.read(HEADER_SIZE))
+                f.seek(0)
+            except (OSError, struct.error, ValueError) as exc:
+                fail_record(record, exc)
+                continue
+            opened.append((record, TimedReader(f)))
+
+        files = [timed_file for _, timed_file in opened]
+        links = await upload_timed(
+            client,
+            hosting,
+            cast("list[BinaryIO]", files),
+            [record for record, _ in opened],
+            "http",
+        )
+        for record, timed_file in opened:
+            record.timings["read"] = timed_file.elapsed
+        return spread_links(records, links)
+
+
+def fail_record(record: UploadRecord, exc: Exception) -> None:
+    """Fail the upload of an image that can't be read or processed, e.g. a missing or a corrupt file.
+
+    Args:
+        record: The record of the image.
+        exc: The reason of the failure.
+    """
+    record.error = f"{type(exc).__name__}: {exc}"
+    logger.error(f"Failed to process '{record.path}': {record.error}")
+
+
+async def gather_images(
+    futures: Sequence["asyncio.Future[bytes]"], records: Sequence[UploadRecord]
+) -> list[tuple[UploadRecord, bytes]]:
+    """Wait for the images being processed, failing the records of the images that can't be processed.
+
+    Args:
+        futures: The images being processed, one per image.
+        records: The records of the images, one per image.
+
+    Returns:
+        The records and the data of the processed images, in the order of the images.
+    """
+    results = await asyncio.gather(*futures, return_exceptions=True)
+    processed = []
+    for record, result in zip(records, results, strict=True):
+        if isinstance(result, Exception):
+            fail_record(record, result)
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            processed.append((record, result))
+    return processed
+
+
+def spread_links(records: Sequence[UploadRecord], links: Sequence[str]) -> list[str]:
+    """Spread the links of the uploaded images over the records, leaving out the failed ones.
+
+    Args:
+        records: The records of the images, the failed ones with an error.
+        links: The links of the images without an error, in the order of the images.
+
+    Returns:
+        The URLs of the images in the order of the records, empty for the failed ones.
+    """
+    remaining = iter(links)
+    return [next(remaining) if record.error is None else "" for record in records]
+
+
+async def find_cached(
+    records: Sequence[UploadRecord],
+    thumbnail: bool,
+    transform: Transform | None,
+    cache: UploadCache,
+    digester: Callable[[Path], "asyncio.Future[str]"] = file_digest_future,
+) -> list[str]:
+    """Fill the records of the previously uploaded images with the cached links.
+
+    Args:
+        records: The records of the images to be uploaded.
+        thumbnail: Whether the thumbnails are uploaded along with the images.
+        transform: The transformation applied to the images, part of the cache key.
+        cache: The cache of the previously uploaded images.
+        digester: The function starting the hashing of an image.
+
+    Returns:
+        The cache keys of the images in the order of the images, empty for the unreadable ones.
+    """
+    digests = []
+    for record in records:
+        try:
+            digest = await digester(record.path)
+        except OSError as exc:
+            fail_record(record, exc)
+            digest = ""
+        digests.append(digest)
+    if transform is not None:
+        digests = [derive_key(digest, transform) if digest else "" for digest in digests]
+    for record, digest in zip(records, digests, strict=True):
+        if digest and (links := cache.get(digest, record.hosting, thumbnail)) is not None:
+            logger.debug(f"Cache hit for '{record.path}'.")
+            record.url, record.thumbnail_url = links
+            record.cached = True
+
+    return digests
+
+
+async def upload_batch(
+    client: AsyncClient,
+    hosting: str,
+    img_paths: Sequence[Path],
+    *,
+    thumbnailer: Callable[[Path], "asyncio.Future[bytes]"] | None = None,
+    transform: Transform | None = None,
+    transformer: Callable[[Path], "asyncio.Future[bytes]"] | None = None,
+    cache: UploadCache | None = None,
+    digester: Callable[[Path], "asyncio.Future[str]"] = file_digest_future,
+) -> list[UploadRecord]:
+    """Upload a batch of images and their thumbnails.
+
+    The thumbnails are generated from the original images, not from the transformed ones.
+
+    Args:
+        client: The async HTTP client used to make the API requests.
+        hosting: The hosting service to use for uploading the images.
+        img_paths: The paths of the images to be uploaded.
+        thumbnailer: The function starting the generation of the thumbnail of an image.
+            Thumbnails are disabled if `None`.
+        transform: The transformation applied to the images, part of the cache key.
+        transformer: The function starting the transformation of an image.
+            The images are uploaded as is if `None`.
+        cache: The cache of the previously uploaded images. Disabled if `None`.
+        digester: The function starting the hashing of an image, for the cache.
+
+    Returns:
+        The records of the images in the order of the images, without links for the images failed to upload.
+    """
+    thumbnail = thumbnailer is not None
+    records = [UploadRecord(img_path, hosting) for img_path in img_paths]
+    digests: list[str] = []
+    if cache is not None:
+        digests = await find_cached(records, thumbnail, transform, cache, digester)
+
+    pending = [i for i, record in enumerate(records) if not record.cached and record.error is None]
+    if not pending:
+        return records
+
+    # Start generating the thumbnails while the images are being uploaded.
+    thumb_futures = [
+        track_future(thumbnailer(img_paths[i]), records[i], "thumbnail")
+        for i in pending
+        if thumbnailer is not None
+    ]
+
+    with capture_errors() as errors:
+        img_links = await upload_paths(client, hosting, [records[i] for i in pending], transformer)
+
+        # If the upload fails, skip the current image.
+        uploaded = [
+            (i, img_link) for i, img_link in zip(pending, img_links, strict=True) if img_link
+        ]
+        thumb_links: list[str | None] = [None] * len(uploaded)
+        if thumb_futures:
+            thumb_links = [
+                *await upload_thumbnails(
+                    client, hosting, thumb_futures, img_links, [records[i] for i in pending]
+                )
+            ]
+
+    for (i, img_link), thumb_link in zip(uploaded, thumb_links, strict=True):
+        # If the thumbnail upload fails, skip the current image.
+        if thumbnail and not thumb_link:
+            continue
+        records[i].url, records[i].thumbnail_url = img_link, thumb_link
+        if cache is not None:
+            cache.set(digests[i], hosting, thumbnail, (img_link, thumb_link))
+
+    for i in pending:
+        if records[i].url is None:
+            records[i].error = records[i].error or "; ".join(errors) or "The upload failed."
+
+    return records
+
+
+async def upload_thumbnails(
+    client: AsyncClient,
+    hosting: str,
+    thumb_futures: Sequence["asyncio.Future[bytes]"],
+    img_links: Sequence[str],
+    records: Sequence[UploadRecord],
+) -> list[str]:
+    """Upload the thumbnails of the uploaded images.
+
+    The thumbnails of the images failed to upload are cancelled,
+    the images whose thumbnail can't be generated are failed.
+
+    Args:
+        client: The async HTTP client used to make the API requests.
+        hosting: The hosting service to use for uploading the thumbnails.
+        thumb_futures: The thumbnails being generated, one per image.
+        img_links: The links to the images, empty for the images failed to upload.
+        records: The records of the images, one per image.
+
+    Returns:
+        The URLs of the thumbnails of the uploaded images.
+        The URL is an empty string if the upload of the thumbnail failed.
+    """
+    uploaded = []
+    uploaded_records = []
+    for future, img_link, record in zip(thumb_futures, img_links, records, strict=True):
+        if img_link:
+            uploaded.append(future)
+            uploaded_records.append(record)
+        else:
+            future.cancel()
+            # The error of the thumbnail of an unreadable image is the one of the image itself.
+            future.add_done_callback(lambda done: done.cancelled() or done.exception())
+
+    if not uploaded:
+        return []
+
+    thumbs = await gather_images(uploaded, uploaded_records)
+    for record, thumb in thumbs:
+        record.thumbnail_size = len(thumb)
+    links = await upload_timed(
+        client,
+        hosting,
+        [thumb for _, thumb in thumbs],
+        [record for record, _ in thumbs],
+        "thumbnail_http",
+    )
+    return spread_links(uploaded_records, links)
+
+
 def format_link(links: Sequence[tuple[str, str | None]], fmt: str) -> str:
     """Format the image links based on the specified format.
 
@@ -90,3 +1063,18 @@ def format_link(links: Sequence[tuple[str, str | None]], fmt: str) -> str:
         )
 
     return ""
+
+
+def format_record(record: UploadRecord) -> str:
+    """Format the record of an upload as a JSON line.
+
+    Args:
+        record: The record of the upload.
+
+    Returns:
+        The JSON object of the record, with the timings rounded to microseconds.
+    """
+    data = asdict(record)
+    data["path"] = str(record.path)
+    data["timings"] = {phase: round(seconds, 6) for phase, seconds in record.timings.items()}
+    return json.dumps(data)
@@ -0,0 +1,526 @@
+"""Upload daemon keeping the clients, the workers and the config warm between the uploads."""
+
+import asyncio
+import hmac
+import json
+import os
+import socket
+from collections.abc import Iterable, Sequence
+from contextlib import AsyncExitStack
+from http import HTTPStatus
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import TYPE_CHECKING, Any, NamedTuple
+from urllib.parse import parse_qs, urlsplit
+
+from httpx import AsyncClient, Limits, Timeout
+from loguru import logger
+
+from images_upload_cli.cache import ThumbnailCache, UploadCache
+from images_upload_cli.image import (
+    RECOMPRESS_FORMATS,
+    Transform,
+    get_font,
+    get_img_ext,
+    iter_images,
+)
+from images_upload_cli.main import (
+    UploadRecord,
+    format_link,
+    format_record,
+    make_executor,
+    open_clients,
+    upload_images,
+)
+from images_upload_cli.transport import DEFAULT_LIMITS, DEFAULT_TIMEOUT
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+# The maximum size of a request body.
+MAX_BODY_SIZE = 256 * 1024 * 1024
+
+# The formats of the links accepted by the `format` query parameter.
+LINK_FORMATS = ("plain", "bbcode", "html", "markdown", "jsonl")
+
+
+class UploadOptions(NamedTuple):
+    """The options of an upload request, read from the query of the request, see `parse_target`."""
+
+    format: str = "plain"
+    """The format of the links, one of `LINK_FORMATS`."""
+    thumbnail: bool = False
+    """Whether to upload the thumbnails along with the images."""
+    transform: Transform | None = None
+    """The transformation applied to the images, uploaded as is if `None`."""
+    cache: bool = True
+    """Whether to use the caches of the daemon."""
+
+
+class RequestError(Exception):
+    """Exception raised when a request to the daemon can't be served."""
+
+    def __init__(self: "RequestError", status: HTTPStatus, message: str) -> None:
+        """Init.
+
+        Args:
+            status: The status of the error response.
+            message: The reason of the error.
+        """
+        super().__init__(message)
+        self.status = status
+
+
+def bind_private(path: Path) -> socket.socket:
+    """Bind a Unix socket accessible to the current user only.
+
+    The socket is created with the permissions left by the umask, so it is restricted from the start
+    rather than after the bind, when another user could already connect.
+
+    Args:
+        path: The path of the socket.
+
+    Returns:
+        The bound socket.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0o177)
+    try:
+        sock.bind(os.fspath(path))
+    except OSError:
+        sock.close()
+        raise
+    finally:
+        os.umask(umask)
+    return sock
+
+
+async def read_request(reader: asyncio.StreamReader) -> tuple[str, str, dict[str, str], bytes]:
+    """Read an HTTP/1.1 request with a `Content-Length` body.
+
+    Args:
+        reader: The stream of the connection.
+
+    Returns:
+        The method, the target, the lowercase headers and the body of the request.
+
+    Raises:
+        RequestError: If the request is malformed or too large.
+    """
+    try:
+        method, target, _ = (await reader.readline()).decode("latin-1").split(" ", 2)
+        headers = {}
+        while (line := await reader.readline()).strip():
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", "0"))
+    except ValueError as exc:
+        raise RequestError(HTTPStatus.BAD_REQUEST, "Malformed request.") from exc
+
+    if length > MAX_BODY_SIZE:
+        raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large.")
+    try:
+        body = await reader.readexactly(length)
+    except asyncio.IncompleteReadError as exc:
+        raise RequestError(HTTPStatus.BAD_REQUEST, "Incomplete request body.") from exc
+
+    return method, target, headers, body
+
+
+def write_response(writer: asyncio.StreamWriter, status: HTTPStatus, data: dict[str, Any]) -> None:
+    """Write a JSON response and close the connection after it.
+
+    Args:
+        writer: The stream of the connection.
+        status: The status of the response.
+        data: The JSON object of the response.
+    """
+    body = json.dumps(data).encode()
+    writer.write(
+        f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "Connection: close\r\n\r\n".encode("latin-1")
+        + body
+    )
+
+
+class UploadServer:
+    """Local HTTP API uploading the images with warm clients, workers, caption font and config.
+
+    `POST /upload` uploads the images and responds with the formatted links as
+    `{"output": ..., "links": [[image, thumbnail], ...], "failed": ...}`.
+    The body is either a JSON object `{"paths": [...]}` with the absolute paths of the images,
+    directories or glob patterns, or the bytes of a single image.
+    The `format` and `thumbnail` query parameters select the format of the links and the thumbnails,
+    e.g. `/upload?format=markdown&thumbnail=1`. The images are transformed with the `max_dimension`,
+    `max_bytes`, `recompress`, `quality` and `strip_metadata` parameters, see `image.Transform`,
+    and `cache=0` bypasses the caches.
+    Only the images are uploaded, a request with a path to another file is rejected.
+
+    On TCP, any local user can connect, so the requests must carry the token of the daemon
+    as `Authorization: Bearer <token>`.
+    """
+
+    def __init__(
+        self: "UploadServer",
+        hosting: Sequence[str],
+        *,
+        jobs: int = 4,
+        batch_size: int = 10,
+        cache: bool = True,
+        cache_path: Path | None = None,
+        retries: int = 3,
+        http2: bool = False,
+        limits: Limits = DEFAULT_LIMITS,
+        timeout: Timeout = DEFAULT_TIMEOUT,
+        token: str | None = None,
+    ) -> None:
+        """Init, the clients and the workers are started by `start`.
+
+        Args:
+            hosting: The hosting, or the fallback chain of hostings.
+            jobs: The maximum number of requests sent concurrently to a hosting per upload.
+            batch_size: The maximum number of images sent in a single request.
+            cache: Whether to reuse the links of the previously uploaded images and the generated thumbnails.
+            cache_path: The path to the cache database, see `util.get_cache_path`.
+            retries: The maximum number of retries of a request failed with a transient error.
+            http2: Whether to enable HTTP/2 for the connections to the hostings.
+            limits: The connection pool limits.
+            timeout: The timeouts of the connect, read, write and pool phases.
+            token: The token the requests must carry, required to listen on TCP. Not checked if `None`.
+        """
+        self.hosting = hosting
+        self.token = token
+        self.jobs = jobs
+        self.batch_size = batch_size
+        self.cache = cache
+        self.cache_path = cache_path
+        self.client_options: dict[str, Any] = {
+            "retries": retries,
+            "http2": http2,
+            "limits": limits,
+            "timeout": timeout,
+        }
+        self.stack = AsyncExitStack()
+        self.clients: dict[str, AsyncClient] = {}
+        self.executor: ProcessPoolExecutor | None = None
+        self.upload_cache: UploadCache | None = None
+        self.thumbnail_cache: ThumbnailCache | None = None
+
+    async def start(self: "UploadServer") -> None:
+        """Open the clients and the caches, the workers are started by the first request needing them."""
+        self.clients = await open_clients(self.stack, self.hosting, {}, **self.client_options)
+        if self.cache and self.cache_path is not None:
+            self.upload_cache = UploadCache(self.cache_path)
+            self.thumbnail_cache = ThumbnailCache(self.cache_path)
+
+    async def aclose(self: "UploadServer") -> None:
+        """Close the clients and the caches and stop the workers."""
+        await self.stack.aclose()
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+        for cache in (self.upload_cache, self.thumbnail_cache):
+            if cache is not None:
+                cache.close()
+
+    async def listen(
+        self: "UploadServer",
+        socket_path: Path | None = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> asyncio.Server:
+        """Start accepting the connections.
+
+        Args:
+            socket_path: The path of the Unix socket to listen on. The TCP `host` and `port` are used if `None`.
+            host: The TCP host to listen on.
+            port: The TCP port to listen on, any free port if 0.
+
+        Returns:
+            The listening server.
+
+        Raises:
+            ValueError: If listening on TCP without a token.
+        """
+        if socket_path is not None:
+            # A socket left by a killed daemon would prevent binding.
+            await asyncio.to_thread(socket_path.unlink, missing_ok=True)
+            server = await asyncio.start_unix_server(self.handle, sock=bind_private(socket_path))
+            logger.info(f"Listening on '{socket_path}'.")
+        else:
+            if self.token is None:
+                msg = (
+                    "A token is required to listen on TCP, any local user could upload otherwise."
+                )
+                raise ValueError(msg)
+            server = await asyncio.start_server(self.handle, host, port)
+            host, port = server.sockets[0].getsockname()[:2]
+            logger.info(f"Listening on 'http://{host}:{port}'.")
+
+        return server
+
+    async def handle(
+        self: "UploadServer", reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Serve a request of a connection."""
+        try:
+            method, target, headers, body = await read_request(reader)
+            self.authorize(headers)
+            options = parse_target(method, target)
+            if headers.get("content-type", "").startswith("application/json"):
+                data = await self.upload_paths(parse_paths(body), options)
+            else:
+                data = await self.upload_bytes(body, options)
+            write_response(writer, HTTPStatus.OK, data)
+        except RequestError as exc:
+            write_response(writer, exc.status, {"error": str(exc)})
+        except Exception as exc:  # noqa: BLE001
+            # The daemon keeps serving, the client gets the reason instead of a dropped connection.
+            logger.exception("Failed to serve the request.")
+            write_response(writer, HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(exc)})
+        finally:
+            await writer.drain()
+            writer.close()
+
+    def authorize(self: "UploadServer", headers: dict[str, str]) -> None:
+        """Check the token of a request.
+
+        Args:
+            headers: The lowercase headers of the request.
+
+        Raises:
+            RequestError: If the request doesn't carry the token of the daemon.
+        """
+        if self.token is None:
+            return
+        scheme, _, token = headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not hmac.compare_digest(
+            token.strip().encode(), self.token.encode()
+        ):
+            raise RequestError(HTTPStatus.UNAUTHORIZED, "Missing or invalid token.")
+
+    def get_executor(self: "UploadServer", options: UploadOptions) -> "ProcessPoolExecutor | None":
+        """Start the workers on the first request needing them, and keep them for the next requests.
+
+        Args:
+            options: The options of the request.
+
+        Returns:
+            The executor, or `None` if the workers are not needed yet.
+        """
+        if self.executor is None and (options.thumbnail or options.transform is not None):
+            # The font is resolved once, the workers keep it loaded.
+            self.executor = make_executor(self.jobs, get_font() if options.thumbnail else None)
+        return self.executor
+
+    async def upload_paths(
+        self: "UploadServer", paths: Sequence[Path], options: UploadOptions
+    ) -> dict[str, Any]:
+        """Upload the images and format their links.
+
+        Args:
+            paths: The paths of the images, the directories or the glob patterns.
+            options: The options of the request.
+
+        Returns:
+            The JSON object of the response.
+        """
+        img_paths = await asyncio.to_thread(list, iter_images(paths))
+        await asyncio.to_thread(check_images, img_paths)
+        # The records are collected in the jsonl format, including the ones of the failed images.
+        records: list[UploadRecord] = []
+        fmt = options.format
+        links = await upload_images(
+            hosting=self.hosting,
+            images=img_paths,
+            thumbnail=options.thumbnail,
+            jobs=self.jobs,
+            batch_size=self.batch_size,
+            cache=self.upload_cache if options.cache else None,
+            thumbnail_cache=self.thumbnail_cache if options.cache else None,
+            transform=options.transform,
+            clients=self.clients,
+            executor=self.get_executor(options),
+            on_upload=records.append if fmt == "jsonl" else None,
+            **self.client_options,
+        )
+        if fmt == "jsonl":
+            links = [record.links for record in records if record.links is not None]
+            output = "\n".join(format_record(record) for record in records)
+        else:
+            output = format_link(links, "bbcode" if options.thumbnail and fmt == "plain" else fmt)
+        return {
+            "output": output,
+            "links": links,
+            "failed": len(img_paths) - len(links),
+        }
+
+    async def upload_bytes(
+        self: "UploadServer", img: bytes, options: UploadOptions
+    ) -> dict[str, Any]:
+        """Upload an image sent in the request body and format its links.
+
+        Args:
+            img: The image data.
+            options: The options of the request.
+
+        Returns:
+            The JSON object of the response.
+
+        Raises:
+            RequestError: If the body is not an image.
+        """
+        try:
+            ext = get_img_ext(img)
+        except OSError as exc:
+            raise RequestError(HTTPStatus.UNSUPPORTED_MEDIA_TYPE, "Unknown image format.") from exc
+
+        # The pipeline works on files, so the thumbnails are generated from a path by the workers.
+        with TemporaryDirectory(prefix="imgup-") as tmp_dir:
+            img_path = Path(tmp_dir) / f"image.{ext}"
+            await asyncio.to_thread(img_path.write_bytes, img)
+            return await self.upload_paths([img_path], options)
+
+
+def check_images(img_paths: Iterable[Path]) -> None:
+    """Check that the files are images by their header, so no other file is sent to the hostings.
+
+    Args:
+        img_paths: The paths of the files.
+
+    Raises:
+        RequestError: If a file is not an image or can't be read.
+    """
+    for img_path in img_paths:
+        if not is_image(img_path):
+            msg = f"'{img_path}' is not an image."
+            raise RequestError(HTTPStatus.UNSUPPORTED_MEDIA_TYPE, msg)
+
+
+def is_image(img_path: Path) -> bool:
+    """Check that a file is an image by its header.
+
+    Args:
+        img_path: The path of the file.
+
+    Returns:
+        Whether the file is a readable image.
+    """
+    try:
+        with img_path.open("rb") as f:
+            get_img_ext(f)
+    except OSError:
+        return False
+    return True
+
+
+def parse_target(method: str, target: str) -> UploadOptions:
+    """Parse the upload options from the request target.
+
+    Args:
+        method: The method of the request.
+        target: The path and the query of the request, e.g. `/upload?format=markdown&thumbnail=1`.
+
+    Returns:
+        The options of the upload.
+
+    Raises:
+        RequestError: If the request is not an upload or an option is invalid.
+    """
+    url = urlsplit(target)
+    if url.path != "/upload":
+        raise RequestError(HTTPStatus.NOT_FOUND, f"Unknown path '{url.path}'.")
+    if method != "POST":
+        raise RequestError(HTTPStatus.METHOD_NOT_ALLOWED, "Use POST.")
+
+    query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+    fmt = query.get("format", "plain")
+    if fmt not in LINK_FORMATS:
+        raise RequestError(HTTPStatus.BAD_REQUEST, f"Unknown format '{fmt}'.")
+    return UploadOptions(
+        format=fmt,
+        thumbnail=parse_flag(query, "thumbnail", default=False),
+        transform=parse_transform(query),
+        cache=parse_flag(query, "cache", default=True),
+    )
+
+
+def parse_flag(query: dict[str, str], name: str, *, default: bool) -> bool:
+    """Parse a boolean query parameter, false if `0`, `false` or empty.
+
+    Args:
+        query: The query parameters.
+        name: The name of the parameter.
+        default: The value of the missing parameter.
+
+    Returns:
+        The value of the parameter.
+    """
+    if name not in query:
+        return default
+    return query[name] not in {"", "0", "false"}
+
+
+def parse_transform(query: dict[str, str]) -> Transform | None:
+    """Parse the transformation of the images from the query parameters.
+
+    Args:
+        query: The query parameters, see `UploadServer`.
+
+    Returns:
+        The transformation, or `None` if the images are uploaded as is.
+
+    Raises:
+        RequestError: If a parameter is invalid.
+    """
+    try:
+        max_dimension, max_bytes = (
+            int(query[name]) if query.get(name) else None
+            for name in ("max_dimension", "max_bytes")
+        )
+        quality = int(query.get("quality", "80"))
+    except ValueError as exc:
+        raise RequestError(HTTPStatus.BAD_REQUEST, "Expected integer transform options.") from exc
+
+    recompress = query.get("recompress") or None
+    if recompress is not None and recompress not in RECOMPRESS_FORMATS:
+        raise RequestError(HTTPStatus.BAD_REQUEST, f"Unknown recompress format '{recompress}'.")
+    limits = (max_dimension, max_bytes)
+    if any(limit is not None and limit < 1 for limit in limits) or not 1 <= quality <= 100:  # noqa: PLR2004
+        raise RequestError(HTTPStatus.BAD_REQUEST, "Transform option out of range.")
+
+    transform = Transform(
+        max_dimension,
+        max_bytes,
+        recompress,
+        quality,
+        parse_flag(query, "strip_metadata", default=False),
+    )
+    if transform == Transform(quality=quality):
+        return None
+    return transform
+
+
+def parse_paths(body: bytes) -> list[Path]:
+    """Parse the paths of the images from a JSON request body.
+
+    Args:
+        body: The JSON object `{"paths": [...]}`.
+
+    Returns:
+        The paths.
+
+    Raises:
+        RequestError: If the body is not a JSON object with a list of absolute paths.
+    """
+    try:
+        paths = json.loads(body)["paths"]
+    except (KeyError, TypeError, ValueError) as exc:
+        raise RequestError(HTTPStatus.BAD_REQUEST, "Expected {'paths': [...]}.") from exc
+
+    if not isinstance(paths, list) or not all(isinstance(path, str) for path in paths):
+        raise RequestError(HTTPStatus.BAD_REQUEST, "Expected a list of paths.")
+    if not all(Path(path).is_absolute() for path in paths):
+        raise RequestError(HTTPStatus.BAD_REQUEST, "Expected absolute paths.")
+    return [Path(path) for path in paths]
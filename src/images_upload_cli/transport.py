@@ -0,0 +1,279 @@
+"""HTTP transports for the upload clients."""
+
+import asyncio
+from email.utils import parsedate_to_datetime
+from importlib.util import find_spec
+from random import uniform
+from time import monotonic, time
+from typing import NamedTuple
+
+from httpx import (
+    AsyncBaseTransport,
+    AsyncClient,
+    AsyncHTTPTransport,
+    Headers,
+    Limits,
+    NetworkError,
+    RemoteProtocolError,
+    Request,
+    Response,
+    Timeout,
+    TimeoutException,
+    codes,
+)
+from loguru import logger
+
+# Errors of the requests that may succeed if retried.
+TRANSIENT_ERRORS = (NetworkError, RemoteProtocolError, TimeoutException)
+
+# The `httpx` defaults.
+DEFAULT_LIMITS = Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=5.0)
+DEFAULT_TIMEOUT = Timeout(5.0)
+
+
+class RateLimit(NamedTuple):
+    """Token bucket parameters of a hosting."""
+
+    rate: float
+    """The sustained number of requests per second."""
+    burst: int
+    """The maximum number of requests sent at once."""
+
+
+def get_retry_after(headers: Headers) -> float | None:
+    """Get the delay requested by the server from the response headers.
+
+    Supports the `Retry-After` header, in seconds or as an HTTP date,
+    and exhausted `X-RateLimit-*-Remaining` headers with the matching `X-RateLimit-*-Reset` header,
+    as a delay or a Unix time.
+
+    Args:
+        headers: The response headers.
+
+    Returns:
+        The delay in seconds, or `None` if the server didn't request one.
+    """
+    if retry_after := headers.get("retry-after"):
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time())
+            except (TypeError, ValueError):
+                return None
+
+    for key, value in headers.items():
+        if not (key.startswith("x-ratelimit-") and key.endswith("remaining")) or value != "0":
+            continue
+        reset = headers.get(key.removesuffix("remaining") + "reset")
+        try:
+            reset_value = float(reset) if reset else None
+        except ValueError:
+            reset_value = None
+        if reset_value is not None:
+            # Large values are Unix times, small ones are delays.
+            return max(0.0, reset_value - time()) if reset_value > time() / 2 else reset_value
+
+    return None
+
+
+class TokenBucket:
+    """Token bucket rate limiter.
+
+    Tokens are refilled at `rate` per second up to `burst`, each request takes one token.
+    The bucket can be paused, e.g. when the server asks to retry later.
+    """
+
+    def __init__(self: "TokenBucket", rate_limit: RateLimit) -> None:
+        """Init.
+
+        Args:
+            rate_limit: The rate and the burst of the bucket.
+        """
+        self.rate = rate_limit.rate
+        self.burst = rate_limit.burst
+        self.tokens = float(rate_limit.burst)
+        self.updated = monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def pause(self: "TokenBucket", delay: float) -> None:
+        """Stop handing out tokens for the given time.
+
+        Args:
+            delay: The pause duration in seconds.
+        """
+        self.paused_until = max(self.paused_until, monotonic() + delay)
+
+    async def acquire(self: "TokenBucket") -> None:
+        """Wait until a token is available and take it."""
+        # The lock makes the waiters take the tokens in order of arrival.
+        async with self.lock:
+            while True:
+                now = monotonic()
+                if self.paused_until > now:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class RateLimitTransport(AsyncBaseTransport):
+    """Transport that paces the requests with a token bucket.
+
+    When the server asks to slow down, via `Retry-After` or `X-RateLimit-*` headers,
+    the bucket is paused for the requested time.
+    """
+
+    def __init__(
+        self: "RateLimitTransport",
+        transport: AsyncBaseTransport,
+        rate_limit: RateLimit,
+    ) -> None:
+        """Init.
+
+        Args:
+            transport: The transport used to send the requests.
+            rate_limit: The rate limit of the hosting.
+        """
+        self.transport = transport
+        self.bucket = TokenBucket(rate_limit)
+
+    async def handle_async_request(self: "RateLimitTransport", request: Request) -> Response:
+        """Send the request once a token is available."""
+        await self.bucket.acquire()
+        response = await self.transport.handle_async_request(request)
+
+        if (delay := get_retry_after(response.headers)) is not None:
+            logger.debug(f"Rate limited by '{request.url.host}' for {delay:.1f}s.")
+            self.bucket.pause(delay)
+
+        return response
+
+    async def aclose(self: "RateLimitTransport") -> None:
+        """Close the underlying transport."""
+        await self.transport.aclose()
+
+
+def is_transient(response: Response) -> bool:
+    """Check if the error response is worth retrying.
+
+    Server errors, `408 Request Timeout` and `429 Too Many Requests` are transient,
+    other client errors are permanent.
+
+    Args:
+        response: The HTTP response.
+
+    Returns:
+        Whether the request may succeed if retried.
+    """
+    return response.is_server_error or response.status_code in {
+        codes.REQUEST_TIMEOUT,
+        codes.TOO_MANY_REQUESTS,
+    }
+
+
+class RetryTransport(AsyncBaseTransport):
+    """Transport that retries the requests failed with transient errors.
+
+    Connection errors, timeouts and transient error responses are retried
+    with jittered exponential backoff, or after the delay requested by the server.
+    Permanent errors are returned at once.
+    """
+
+    def __init__(
+        self: "RetryTransport",
+        transport: AsyncBaseTransport,
+        retries: int = 3,
+        backoff: float = 0.5,
+        max_delay: float = 60.0,
+    ) -> None:
+        """Init.
+
+        Args:
+            transport: The transport used to send the requests.
+            retries: The maximum number of retries of a request.
+            backoff: The base delay between the retries in seconds, doubled on every retry.
+            max_delay: The maximum delay before a retry in seconds.
+                The request is not retried if the server asks to wait longer.
+        """
+        self.transport = transport
+        self.retries = retries
+        self.backoff = backoff
+        self.max_delay = max_delay
+
+    async def handle_async_request(self: "RetryTransport", request: Request) -> Response:
+        """Send the request, retrying on transient errors."""
+        attempt = 0
+        while True:
+            delay = uniform(0, min(self.max_delay, self.backoff * 2**attempt))  # noqa: S311
+            try:
+                response = await self.transport.handle_async_request(request)
+            except TRANSIENT_ERRORS as exc:
+                if attempt >= self.retries:
+                    raise
+                reason = f"{type(exc).__name__}: {exc}"
+            else:
+                if attempt >= self.retries or not is_transient(response):
+                    return response
+                retry_after = get_retry_after(response.headers)
+                if retry_after is not None and retry_after > self.max_delay:
+                    return response
+                delay = max(delay, retry_after or 0.0)
+                reason = f"'{response.status_code} {response.reason_phrase}'"
+                await response.aclose()
+
+            attempt += 1
+            logger.warning(
+                f"Retrying request to '{request.url}' in {delay:.1f}s after {reason} "
+                f"({attempt}/{self.retries})."
+            )
+            await asyncio.sleep(delay)
+
+    async def aclose(self: "RetryTransport") -> None:
+        """Close the underlying transport."""
+        await self.transport.aclose()
+
+
+def make_client(
+    rate_limit: RateLimit,
+    retries: int = 3,
+    http2: bool = False,
+    limits: Limits = DEFAULT_LIMITS,
+    timeout: Timeout = DEFAULT_TIMEOUT,
+    *,
+    transport: AsyncBaseTransport | None = None,
+) -> AsyncClient:
+    """Create the HTTP client used to upload images to a hosting.
+
+    Every attempt of a request is paced by the rate limiter.
+    With HTTP/2, the concurrent requests to the hosting are multiplexed over a single connection.
+
+    Args:
+        rate_limit: The rate limit of the hosting.
+        retries: The maximum number of retries of a request failed with a transient error.
+        http2: Whether to enable HTTP/2. Requires the `http2` extra.
+        limits: The connection pool limits.
+        timeout: The timeouts of the connect, read, write and pool phases.
+        transport: The transport sending the requests, e.g. to a stand-in of the hostings in the tests.
+            A connection pool with `http2` and `limits` if `None`.
+
+    Returns:
+        The async HTTP client.
+    """
+    if http2 and find_spec("h2") is None:
+        logger.warning(
+            "HTTP/2 support is not installed, falling back to HTTP/1.1. "
+            "Install 'images-upload-cli[http2]' to enable it."
+        )
+        http2 = False
+
+    base = transport or AsyncHTTPTransport(http2=http2, limits=limits)
+    limited = RateLimitTransport(base, rate_limit)
+    return AsyncClient(transport=RetryTransport(limited, retries=retries), timeout=timeout)
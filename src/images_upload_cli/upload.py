@@ -1,24 +1,26 @@
 """Upload images to various hosting services."""
 
-from collections.abc import Awaitable, Callable
+from collections.abc import Awaitable, Callable, Sequence
 from os import getenv
 from re import search
+from typing import BinaryIO
 from urllib.parse import urlparse
 
 from httpx import AsyncClient, BasicAuth
 from loguru import logger
 
-from images_upload_cli.image import get_img_ext
+from images_upload_cli.image import get_img_ext, get_img_info
+from images_upload_cli.transport import RateLimit
 from images_upload_cli.util import get_env, log_on_error
 
 
 @logger.catch(default="")
-async def anhmoe_upload(client: AsyncClient, img: bytes) -> str:
+async def anhmoe_upload(client: AsyncClient, img: bytes | BinaryIO) -> str:
     """Uploads an image to the `anh.mo`.
 
     Args:
         client: The async HTTP client used to make the API request.
-        img: The image data to be uploaded.
+        img: The image data or the binary file to be uploaded.
 
     Returns:
         The URL of the uploaded image, or an empty string if the upload failed.
@@ -38,23 +40,22 @@ async def anhmoe_upload(client: AsyncClient, img: bytes) -> str:
 
 
 @logger.catch(default="")
-async def beeimg_upload(client: AsyncClient, img: bytes) -> str:
+async def beeimg_upload(client: AsyncClient, img: bytes | BinaryIO) -> str:
     """Uploads an image to the `beeimg.com`.
 
     Args:
         client: The async HTTP client used to make the API request.
-        img: The image data to be uploaded.
+        img: The image data or the binary file to be uploaded.
 
     Returns:
         The URL of the uploaded image, or an empty string if the upload failed.
     """
-    ext = get_img_ext(img)
-    name = f"img.{ext}"
-    content_type = f"image/{ext}"
+    info = get_img_info(img)
+    name = f"img.{info.format}"
 
     response = await client.post(
         url="https://beeimg.com/api/upload/file/json/",
-        files={"file": (name, img, content_type)},
+        files={"file": (name, img, info.mime)},
     )
     if response.is_error:
         log_on_error(response)
@@ -64,12 +65,12 @@ async def beeimg_upload(client: AsyncClient, img: bytes) -> str:
 
 
 @logger.catch(default="")
-async def catbox_upload(client: AsyncClient, img: bytes) -> str:
+async def catbox_upload(client: AsyncClient, img: bytes | BinaryIO) -> str:
     """Uploads an image to the `catbox.moe`.
 
     Args:
         client: The async HTTP client used to make the API request.
-        img: The image data to be uploaded.
+        img: The image data or the binary file to be uploaded.
 
     Returns:
         The URL of the uploaded image, or an empty string if the upload failed.
@@ -87,12 +88,12 @@ async def catbox_upload(client: AsyncClient, img: bytes) -> str:
 
 
 @logger.catch(default="")
-async def fastpic_upload(client: AsyncClient, img: bytes) -> str:
+async def fastpic_upload(client: AsyncClient, img: bytes | BinaryIO) -> str:
     """Uploads an image to the `fastpic.org`.
 
     Args:
         client: The async HTTP client used to make the API request.
-        img: The image data to be uploaded.
+        img: The image data or the binary file to be uploaded.
 
     Returns:
         The URL of the uploaded image, or an empty string if the upload failed.
@@ -120,12 +121,12 @@ async def fastpic_upload(client: AsyncClient, img: bytes) -> str:
 
 
 @logger.catch(default="")
-async def filecoffee_upload(client: AsyncClient, img: bytes) -> str:
+async def filecoffee_upload(client: AsyncClient, img: bytes | BinaryIO) -> str:
     """Uploads an image to the `file.coffee`.
 
     Args:
         client: The async HTTP client used to make the API request.
-        img: The image data to be uploaded.
+        img: The image data or the binary file to be uploaded.
 
     Returns:
         The URL of the uploaded image, or an empty string if the upload failed.
@@ -142,12 +143,12 @@ async def filecoffee_upload(client: AsyncClient, img: bytes) -> str:
 
 
 @logger.catch(default="")
-async def freeimage_upload(client: AsyncClient, img: bytes) -> str:
+async def freeimage_upload(client: AsyncClient, img: bytes | BinaryIO) -> str:
     """Uploads an image to the `freeimage.host`.
 
     Args:
         client: The async HTTP client used to make the API request.
-        img: The image data to be uploaded.
+        img: The image data or the binary file to be uploaded.
 
     Returns:
         The URL of the uploaded image, or an empty string if the upload failed.
@@ -167,12 +168,12 @@ async def freeimage_upload(client: AsyncClient, img: bytes) -> str:
 
 
 @logger.catch(default="")
-async def gyazo_upload(client: AsyncClient, img: bytes) -> str:
+async def gyazo_upload(client: AsyncClient, img: bytes | BinaryIO) -> str:
     """Uploads an image to the `gyazo.com`.
 
     Args:
         client: The async HTTP client used to make the API request.
-        img: The image data to be uploaded.
+        img: The image data or the binary file to be uploaded.
 
     Returns:
         The URL of the uploaded image, or an empty string if the upload failed.
@@ -191,12 +192,12 @@ async def gyazo_upload(client: AsyncClient, img: bytes) -> str:
 
 
 @logger.catch(default="")
-async def imageban_upload(client: AsyncClient, img: bytes) -> str:
+async def imageban_upload(client: AsyncClient, img: bytes | BinaryIO) -> str:
     """Uploads an image to the `imageban.ru`.
 
     Args:
         client: The async HTTP client used to make the API request.
-        img: The image data to be uploaded.
+        img: The image data or the binary file to be uploaded.
 
     Returns:
         The URL of the uploaded image, or an empty string if the upload failed.
@@ -216,12 +217,12 @@ async def imageban_upload(client: AsyncClient, img: bytes) -> str:
 
 
 @logger.catch(default="")
-async def imagebin_upload(client: AsyncClient, img: bytes) -> str:
+async def imagebin_upload(client: AsyncClient, img: bytes | BinaryIO) -> str:
     """Uploads an image to the `imagebin.ca`.
 
     Args:
         client: The async HTTP client used to make the API request.
-        img: The image data to be uploaded.
+        img: The image data or the binary file to be uploaded.
 
     Returns:
         The URL of the uploaded image, or an empty string if the upload failed.
@@ -244,12 +245,12 @@ async def imagebin_upload(client: AsyncClient, img: bytes) -> str:
 
 
 @logger.catch(default="")
-async def imgbb_upload(client: AsyncClient, img: bytes) -> str:
+async def imgbb_upload(client: AsyncClient, img: bytes | BinaryIO) -> str:
     """Uploads an image to the `imgbb.com`.
 
     Args:
         client: The async HTTP client used to make the API request.
-        img: The image data to be uploaded.
+        img: The image data or the binary file to be uploaded.
 
     Returns:
         The URL of the uploaded image, or an empty string if the upload failed.
@@ -269,12 +270,12 @@ async def imgbb_upload(client: AsyncClient, img: bytes) -> str:
 
 
 @logger.catch(default="")
-async def imgchest_upload(client: AsyncClient, img: bytes) -> str:
+async def imgchest_upload(client: AsyncClient, img: bytes | BinaryIO) -> str:
     """Uploads an image to the `imgchest.com`.
 
     Args:
         client: The async HTTP client used to make the API request.
-        img: The image data to be uploaded.
+        img: The image data or the binary file to be uploaded.
 
     Returns:
         The URL of the uploaded image, or an empty string if the upload failed.
@@ -294,13 +295,41 @@ async def imgchest_upload(client: AsyncClient, img: bytes) -> str:
     return response.json()["data"]["images"][0]["link"]
 
 
+@logger.catch(default=())
+async def imgchest_upload_batch(
+    client: AsyncClient, imgs: Sequence[bytes | BinaryIO]
+) -> tuple[str, ...]:
+    """Uploads several images to the `imgchest.com` in a single request.
+
+    Args:
+        client: The async HTTP client used to make the API request.
+        imgs: The images data or the binary files to be uploaded.
+
+    Returns:
+        The URLs of the uploaded images in the order of the images, or an empty tuple if the upload failed.
+    """
+    key = get_env("IMGCHEST_KEY")
+
+    response = await client.post(
+        url="https://api.imgchest.com/v1/post",
+        headers={"Authorization": f"Bearer {key}"},
+        files=[("images[]", (f"img.{get_img_ext(img)}", img)) for img in imgs],
+    )
+    if response.is_error:
+        log_on_error(response)
+        return ()
+
+    images = sorted(response.json()["data"]["images"], key=lambda image: image["position"])
+    return tuple(image["link"] for image in images)
+
+
 @logger.catch(default="")
-async def imgur_upload(client: AsyncClient, img: bytes) -> str:
+async def imgur_upload(client: AsyncClient, img: bytes | BinaryIO) -> str:
     """Uploads an image to the `imgur.com`.
 
     Args:
         client: The async HTTP client used to make the API request.
-        img: The image data to be uploaded.
+        img: The image data or the binary file to be uploaded.
 
     Returns:
         The URL of the uploaded image, or an empty string if the upload failed.
@@ -320,12 +349,12 @@ async def imgur_upload(client: AsyncClient, img: bytes) -> str:
 
 
 @logger.catch(default="")
-async def lensdump_upload(client: AsyncClient, img: bytes) -> str:
+async def lensdump_upload(client: AsyncClient, img: bytes | BinaryIO) -> str:
     """Uploads an image to the `lensdump.com`.
 
     Args:
         client: The async HTTP client used to make the API request.
-        img: The image data to be uploaded.
+        img: The image data or the binary file to be uploaded.
 
     Returns:
         The URL of the uploaded image, or an empty string if the upload failed.
@@ -345,12 +374,12 @@ async def lensdump_upload(client: AsyncClient, img: bytes) -> str:
 
 
 @logger.catch(default="")
-async def pixeldrain_upload(client: AsyncClient, img: bytes) -> str:
+async def pixeldrain_upload(client: AsyncClient, img: bytes | BinaryIO) -> str:
     """Uploads an image to the `pixeldrain.com`.
 
     Args:
         client: The async HTTP client used to make the API request.
-        img: The image data to be uploaded.
+        img: The image data or the binary file to be uploaded.
 
     Returns:
         The URL of the uploaded image, or an empty string if the upload failed.
@@ -370,12 +399,12 @@ async def pixeldrain_upload(client: AsyncClient, img: bytes) -> str:
 
 
 @logger.catch(default="")
-async def pixhost_upload(client: AsyncClient, img: bytes) -> str:
+async def pixhost_upload(client: AsyncClient, img: bytes | BinaryIO) -> str:
     """Uploads an image to the `pixhost.to`.
 
     Args:
         client: The async HTTP client used to make the API request.
-        img: The image data to be uploaded.
+        img: The image data or the binary file to be uploaded.
 
     Returns:
         The URL of the uploaded image, or an empty string if the upload failed.
@@ -404,12 +433,12 @@ async def pixhost_upload(client: AsyncClient, img: bytes) -> str:
 
 
 @logger.catch(default="")
-async def ptpimg_upload(client: AsyncClient, img: bytes) -> str:
+async def ptpimg_upload(client: AsyncClient, img: bytes | BinaryIO) -> str:
     """Uploads an image to the `ptpimg.me`.
 
     Args:
         client: The async HTTP client used to make the API request.
-        img: The image data to be uploaded.
+        img: The image data or the binary file to be uploaded.
 
     Returns:
         The URL of the uploaded image, or an empty string if the upload failed.
@@ -428,13 +457,40 @@ async def ptpimg_upload(client: AsyncClient, img: bytes) -> str:
     return f"https://ptpimg.me/{response.json()[0]['code']}.{response.json()[0]['ext']}"
 
 
+@logger.catch(default=())
+async def ptpimg_upload_batch(
+    client: AsyncClient, imgs: Sequence[bytes | BinaryIO]
+) -> tuple[str, ...]:
+    """Uploads several images to the `ptpimg.me` in a single request.
+
+    Args:
+        client: The async HTTP client used to make the API request.
+        imgs: The images data or the binary files to be uploaded.
+
+    Returns:
+        The URLs of the uploaded images in the order of the images, or an empty tuple if the upload failed.
+    """
+    key = get_env("PTPIMG_KEY")
+
+    response = await client.post(
+        url="https://ptpimg.me/upload.php",
+        data={"api_key": key},
+        files=[(f"file-upload[{i}]", img) for i, img in enumerate(imgs)],
+    )
+    if response.is_error:
+        log_on_error(response)
+        return ()
+
+    return tuple(f"https://ptpimg.me/{image['code']}.{image['ext']}" for image in response.json())
+
+
 @logger.catch(default="")
-async def smms_upload(client: AsyncClient, img: bytes) -> str:
+async def smms_upload(client: AsyncClient, img: bytes | BinaryIO) -> str:
     """Uploads an image to the `sm.ms`.
 
     Args:
         client: The async HTTP client used to make the API request.
-        img: The image data to be uploaded.
+        img: The image data or the binary file to be uploaded.
 
     Returns:
         The URL of the uploaded image, or an empty string if the upload failed.
@@ -456,16 +512,18 @@ async def smms_upload(client: AsyncClient, img: bytes) -> str:
 
 
 @logger.catch(default="")
-async def sxcu_upload(client: AsyncClient, img: bytes) -> str:
+async def sxcu_upload(client: AsyncClient, img: bytes | BinaryIO) -> str:
     """Uploads an image to the `sxcu.net`.
 
     Args:
         client: The async HTTP client used to make the API request.
-        img: The image data to be uploaded.
+        img: The image data or the binary file to be uploaded.
 
     Returns:
         The URL of the uploaded image, or an empty string if the upload failed.
     """
+    ext = get_img_ext(img)
+
     response = await client.post(
         url="https://sxcu.net/api/files/create",
         headers={"user-agent": "python-https/1.0.0"},
@@ -475,16 +533,16 @@ async def sxcu_upload(client: AsyncClient, img: bytes) -> str:
         log_on_error(response)
         return ""
 
-    return f"{response.json()['url']}.{get_img_ext(img)}"
+    return f"{response.json()['url']}.{ext}"
 
 
 @logger.catch(default="")
-async def telegraph_upload(client: AsyncClient, img: bytes) -> str:
+async def telegraph_upload(client: AsyncClient, img: bytes | BinaryIO) -> str:
     """Uploads an image to the `telegra.ph`.
 
     Args:
         client: The async HTTP client used to make the API request.
-        img: The image data to be uploaded.
+        img: The image data or the binary file to be uploaded.
 
     Returns:
         The URL of the uploaded image, or an empty string if the upload failed.
@@ -501,12 +559,12 @@ async def telegraph_upload(client: AsyncClient, img: bytes) -> str:
 
 
 @logger.catch(default="")
-async def thumbsnap_upload(client: AsyncClient, img: bytes) -> str:
+async def thumbsnap_upload(client: AsyncClient, img: bytes | BinaryIO) -> str:
     """Uploads an image to the `thumbsnap.com`.
 
     Args:
         client: The async HTTP client used to make the API request.
-        img: The image data to be uploaded.
+        img: The image data or the binary file to be uploaded.
 
     Returns:
         The URL of the uploaded image, or an empty string if the upload failed.
@@ -526,12 +584,12 @@ async def thumbsnap_upload(client: AsyncClient, img: bytes) -> str:
 
 
 @logger.catch(default="")
-async def tixte_upload(client: AsyncClient, img: bytes) -> str:
+async def tixte_upload(client: AsyncClient, img: bytes | BinaryIO) -> str:
     """Uploads an image to the `tixte.com`.
 
     Args:
         client: The async HTTP client used to make the API request.
-        img: The image data to be uploaded.
+        img: The image data or the binary file to be uploaded.
 
     Returns:
         The URL of the uploaded image, or an empty string if the upload failed.
@@ -553,12 +611,12 @@ async def tixte_upload(client: AsyncClient, img: bytes) -> str:
 
 
 @logger.catch(default="")
-async def up2sha_upload(client: AsyncClient, img: bytes) -> str:
+async def up2sha_upload(client: AsyncClient, img: bytes | BinaryIO) -> str:
     """Uploads an image to the `up2sha.re`.
 
     Args:
         client: The async HTTP client used to make the API request.
-        img: The image data to be uploaded.
+        img: The image data or the binary file to be uploaded.
 
     Returns:
         The URL of the uploaded image, or an empty string if the upload failed.
@@ -580,12 +638,12 @@ async def up2sha_upload(client: AsyncClient, img: bytes) -> str:
 
 
 @logger.catch(default="")
-async def uplio_upload(client: AsyncClient, img: bytes) -> str:
+async def uplio_upload(client: AsyncClient, img: bytes | BinaryIO) -> str:
     """Uploads an image to the `upl.io`.
 
     Args:
         client: The async HTTP client used to make the API request.
-        img: The image data to be uploaded.
+        img: The image data or the binary file to be uploaded.
 
     Returns:
         The URL of the uploaded image, or an empty string if the upload failed.
@@ -608,12 +666,12 @@ async def uplio_upload(client: AsyncClient, img: bytes) -> str:
 
 
 @logger.catch(default="")
-async def uploadcare_upload(client: AsyncClient, img: bytes) -> str:
+async def uploadcare_upload(client: AsyncClient, img: bytes | BinaryIO) -> str:
     """Uploads an image to the `uploadcare.com`.
 
     Args:
         client: The async HTTP client used to make the API request.
-        img: The image data to be uploaded.
+        img: The image data or the binary file to be uploaded.
 
     Returns:
         The URL of the uploaded image, or an empty string if the upload failed.
@@ -637,12 +695,12 @@ async def uploadcare_upload(client: AsyncClient, img: bytes) -> str:
 
 
 @logger.catch(default="")
-async def vgy_upload(client: AsyncClient, img: bytes) -> str:
+async def vgy_upload(client: AsyncClient, img: bytes | BinaryIO) -> str:
     """Uploads an image to the `vgy.me`.
 
     Args:
         client: The async HTTP client used to make the API request.
-        img: The image data to be uploaded.
+        img: The image data or the binary file to be uploaded.
 
     Returns:
         The URL of the uploaded image, or an empty string if the upload failed.
@@ -662,7 +720,7 @@ async def vgy_upload(client: AsyncClient, img: bytes) -> str:
     return response.json()["image"]
 
 
-UPLOAD: dict[str, Callable[[AsyncClient, bytes], Awaitable[str]]] = {
+UPLOAD: dict[str, Callable[[AsyncClient, bytes | BinaryIO], Awaitable[str]]] = {
     "anhmoe": anhmoe_upload,
     "beeimg": beeimg_upload,
     "catbox": catbox_upload,
@@ -690,4 +748,20 @@ UPLOAD: dict[str, Callable[[AsyncClient, bytes], Awaitable[str]]] = {
     "vgy": vgy_upload,
 }
 
+# Hostings whose API accepts several files per request.
+BATCH_UPLOAD: dict[
+    str, Callable[[AsyncClient, Sequence[bytes | BinaryIO]], Awaitable[tuple[str, ...]]]
+] = {
+    "imgchest": imgchest_upload_batch,
+    "ptpimg": ptpimg_upload_batch,
+}
+
+RATE_LIMITS: dict[str, RateLimit] = {
+    **dict.fromkeys(UPLOAD, RateLimit(rate=5, burst=10)),
+    # Hostings known to throttle aggressively.
+    "imgbb": RateLimit(rate=1, burst=3),
+    "imgur": RateLimit(rate=1, burst=5),
+    "smms": RateLimit(rate=0.5, burst=2),
+}
+
 HOSTINGS = tuple(UPLOAD.keys())
@@ -1,13 +1,26 @@
 """Utility functions for the package."""
 
-from os import getenv
+from collections.abc import Iterator
+from os import fsdecode, getenv
 from pathlib import Path
 from shutil import which
 from subprocess import Popen
+from time import perf_counter
+from typing import TYPE_CHECKING, BinaryIO
 
 import click
-from httpx import Response
-from loguru import logger
+
+if TYPE_CHECKING:
+    from io import BufferedIOBase
+
+    from httpx import Response
+
+
+# The maximum number of bytes read from a stream at once.
+READ_CHUNK_SIZE = 64 * 1024
+
+# The binary units of the sizes, by their lowercase prefix.
+SIZE_UNITS = {"": 1, "k": 1024, "m": 1024**2, "g": 1024**3}
 
 
 class GetEnvError(Exception):
@@ -24,6 +37,36 @@ def get_config_path() -> Path:
     return Path(app_dir) / ".env"
 
 
+def get_cache_path() -> Path:
+    """Get the path to the app upload cache.
+
+    Returns:
+       The path to the app upload cache.
+    """
+    app_dir = click.get_app_dir("images-upload-cli")
+    return Path(app_dir) / "cache.sqlite"
+
+
+def get_socket_path() -> Path:
+    """Get the path to the socket of the upload daemon.
+
+    Returns:
+       The path to the socket of the upload daemon.
+    """
+    app_dir = click.get_app_dir("images-upload-cli")
+    return Path(app_dir) / "imgup.sock"
+
+
+def get_font_index_path() -> Path:
+    """Get the path to the app font index.
+
+    Returns:
+       The path to the app font index.
+    """
+    app_dir = click.get_app_dir("images-upload-cli")
+    return Path(app_dir) / "fonts.json"
+
+
 def get_env(variable: str) -> str:
     """Get the value of an environment variable.
 
@@ -64,6 +107,87 @@ def human_size(num: float, suffix: str = "B") -> str:
     return f"{num:.1f} Yi{suffix}"
 
 
+class ByteSizeParamType(click.ParamType):
+    """Size in bytes with an optional binary unit, e.g. `500000`, `500K` or `1.5MiB`."""
+
+    name = "size"
+
+    def convert(
+        self: "ByteSizeParamType",
+        value: str | int,
+        param: click.Parameter | None,
+        ctx: click.Context | None,
+    ) -> int:
+        """Convert the value to the number of bytes."""
+        if isinstance(value, int):
+            return value
+
+        number = value.strip().lower().removesuffix("b").removesuffix("i")
+        unit = number[-1:] if number[-1:] in SIZE_UNITS else ""
+        try:
+            size = round(float(number.removesuffix(unit)) * SIZE_UNITS[unit])
+        except (OverflowError, ValueError):
+            self.fail(f"'{value}' is not a valid size.", param, ctx)
+
+        if size < 1:
+            self.fail(f"'{value}' is not a positive size.", param, ctx)
+        return size
+
+
+def read_paths(stream: "BufferedIOBase", delimiter: bytes = b"\n") -> Iterator[Path]:
+    """Read the paths from a binary stream as they arrive, e.g. from stdin.
+
+    Each path is yielded as soon as its delimiter is read, the empty entries are skipped.
+    The paths are decoded as file names, so any file name can be passed with the NUL delimiter.
+
+    Args:
+        stream: The binary stream to read.
+        delimiter: The delimiter of the paths, e.g. NUL for the output of `find -print0`.
+
+    Yields:
+        The paths.
+    """
+    # Tolerate the Windows line endings.
+    strip = b"\r" if delimiter == b"\n" else b""
+    pending = b""
+    while chunk := stream.read1(READ_CHUNK_SIZE):
+        *entries, pending = (pending + chunk).split(delimiter)
+        for entry in entries:
+            if path := entry.rstrip(strip):
+                yield Path(fsdecode(path))
+
+    if path := pending.rstrip(strip):
+        yield Path(fsdecode(path))
+
+
+class TimedReader:
+    """Binary file wrapper measuring the time spent reading the file.
+
+    The other attributes are delegated to the file, so the wrapper can be streamed by `httpx`.
+    """
+
+    def __init__(self: "TimedReader", file: BinaryIO) -> None:
+        """Init.
+
+        Args:
+            file: The binary file to read.
+        """
+        self.file = file
+        self.elapsed = 0.0
+
+    def read(self: "TimedReader", size: int = -1) -> bytes:
+        """Read up to `size` bytes, adding the time spent to `elapsed`."""
+        started = perf_counter()
+        try:
+            return self.file.read(size)
+        finally:
+            self.elapsed += perf_counter() - started
+
+    def __getattr__(self: "TimedReader", name: str) -> object:
+        """Delegate the other attributes to the file."""
+        return getattr(self.file, name)
+
+
 def notify_send(text_to_print: str) -> None:
     """Send desktop notifications via libnotify.
 
@@ -74,12 +198,14 @@ def notify_send(text_to_print: str) -> None:
         Popen([notify_send, "-a", "images-upload-cli", text_to_print])  # noqa: S603
 
 
-def log_on_error(response: Response) -> None:
+def log_on_error(response: "Response") -> None:
     """Logs an error message based on the HTTP response.
 
     Args:
         response: The HTTP response object.
     """
+    from loguru import logger
+
     status_class = response.status_code // 100
     error_types = {
         1: "Informational response",
@@ -0,0 +1,231 @@
+"""Watch a directory for the new images, e.g. the screenshots dropped by a screenshot tool."""
+
+import asyncio
+import ctypes
+import os
+import stat
+import struct
+import sys
+from collections.abc import AsyncGenerator, Iterable
+from contextlib import suppress
+from pathlib import Path
+from time import monotonic
+
+from loguru import logger
+
+from images_upload_cli.image import is_image_file
+
+# The inotify events of a file written, moved in or removed, see `man 7 inotify`.
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# The header of an inotify event: the watch descriptor, the mask, the cookie and the length of the name.
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class Inotify:
+    """Minimal inotify binding, waking the watcher up on the changes of a directory instead of polling it."""
+
+    def __init__(self: "Inotify", directory: Path) -> None:
+        """Start watching the directory.
+
+        Args:
+            directory: The directory to watch.
+
+        Raises:
+            OSError: If inotify is not available.
+        """
+        libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, os.strerror(errno), str(directory))
+
+    def close(self: "Inotify") -> None:
+        """Stop watching."""
+        os.close(self.fd)
+
+    async def wait(self: "Inotify", timeout: float | None) -> set[str] | None:
+        """Wait for the changes of the directory.
+
+        Args:
+            timeout: The maximum time to wait in seconds, or `None` to wait indefinitely.
+
+        Returns:
+            The names of the changed files, empty if the timeout expired,
+            or `None` if the events overflowed the queue and the whole directory must be rescanned.
+        """
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        loop.add_reader(self.fd, ready.set)
+        try:
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(ready.wait(), timeout)
+        finally:
+            loop.remove_reader(self.fd)
+
+        names: set[str] | None = set()
+        with suppress(BlockingIOError):
+            while data := os.read(self.fd, 64 * 1024):
+                offset = 0
+                while offset < len(data):
+                    _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                    offset += EVENT_HEADER.size
+                    name = data[offset : offset + length].rstrip(b"\0")
+                    offset += length
+                    if mask & IN_Q_OVERFLOW:
+                        names = None
+                    elif names is not None:
+                        names.add(os.fsdecode(name))
+        return names
+
+
+def scan(directory: Path, names: Iterable[str] | None = None) -> dict[str, tuple[int, int]]:
+    """Get the sizes and the modification times of the files of a directory.
+
+    Args:
+        directory: The directory.
+        names: The names of the files to check, all the files of the directory if `None`.
+
+    Returns:
+        The size and the modification time in nanoseconds of the regular files by their name,
+        without the missing ones.
+    """
+    stats = {}
+    if names is None:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                with suppress(OSError):
+                    if entry.is_file():
+                        result = entry.stat()
+                        stats[entry.name] = (result.st_size, result.st_mtime_ns)
+        return stats
+
+    for name in names:
+        with suppress(OSError):
+            result = (directory / name).stat()
+            if stat.S_ISREG(result.st_mode):
+                stats[name] = (result.st_size, result.st_mtime_ns)
+    return stats
+
+
+async def watch_images(
+    directory: Path,
+    *,
+    settle: float = 1.0,
+    interval: float = 1.0,
+    use_inotify: bool = True,
+) -> AsyncGenerator[Path, None]:
+    """Watch a directory for the new and the overwritten images, not descending into the subdirectories.
+
+    The images present at the start are not yielded. A file is yielded once it has stopped changing for
+    `settle` seconds, so the partially written files are not uploaded.
+    The directory is watched with inotify on Linux and polled every `interval` seconds otherwise.
+
+    Args:
+        directory: The directory to watch.
+        settle: The time in seconds a file must stay unchanged before it is yielded.
+        interval: The time in seconds between the scans of the directory when it is polled.
+        use_inotify: Whether to use inotify where it is available.
+
+    Yields:
+        The paths of the images, as soon as they are completely written.
+    """
+    inotify = None
+    if use_inotify and sys.platform == "linux":
+        try:
+            inotify = Inotify(directory)
+        except (OSError, AttributeError) as exc:
+            logger.debug(f"Polling '{directory}', inotify is not available: {exc}")
+
+    # The stats of the settled files, and of the pending ones along with the time of their last change.
+    known = await asyncio.to_thread(scan, directory)
+    pending: dict[str, tuple[tuple[int, int], float]] = {}
+    logger.info(f"Watching '{directory}' for new images.")
+    try:
+        while True:
+            if inotify is not None:
+                # Wake up on a change, or when the earliest pending file may have settled.
+                timeout = (
+                    max(min(since for _, since in pending.values()) + settle - monotonic(), 0)
+                    if pending
+                    else None
+                )
+                changed = await inotify.wait(timeout)
+                names = None if changed is None else changed | pending.keys()
+            else:
+                await asyncio.sleep(interval)
+                changed = names = None
+            stats = await asyncio.to_thread(scan, directory, names)
+
+            # Forget the removed files, so a file recreated with the same name is uploaded again.
+            for name in (known.keys() if changed is None else changed) - stats.keys():
+                known.pop(name, None)
+            pending = {name: item for name, item in pending.items() if name in stats}
+
+            for path in settle_files(stats, known, pending, settle):
+                img_path = directory / path
+                if await asyncio.to_thread(check_image_file, img_path):
+                    yield img_path
+    finally:
+        if inotify is not None:
+            inotify.close()
+
+
+def check_image_file(path: Path) -> bool:
+    """Check if a settled file is an image, skipping a file whose header can't be parsed.
+
+    Args:
+        path: The path to the file.
+
+    Returns:
+        Whether the file is an image, see `is_image_file`.
+    """
+    try:
+        return is_image_file(path)
+    except (struct.error, ValueError) as exc:
+        logger.warning(f"Skipping '{path}', its header can't be parsed: {exc}")
+        return False
+
+
+def settle_files(
+    stats: dict[str, tuple[int, int]],
+    known: dict[str, tuple[int, int]],
+    pending: dict[str, tuple[tuple[int, int], float]],
+    settle: float,
+) -> list[str]:
+    """Track the changes of the files and pick the settled ones.
+
+    Args:
+        stats: The current stats of the changed and the pending files.
+        known: The stats of the settled files, updated in place.
+        pending: The stats of the pending files with the time of their last change, updated in place.
+        settle: The time in seconds a file must stay unchanged to be settled.
+
+    Returns:
+        The names of the newly settled non-empty files.
+    """
+    now = monotonic()
+    settled = []
+    for name, file_stat in stats.items():
+        if known.get(name) == file_stat:
+            continue
+        if name not in pending or pending[name][0] != file_stat:
+            pending[name] = (file_stat, now)
+        elif now - pending[name][1] >= settle:
+            del pending[name]
+            known[name] = file_stat
+            # An empty file is likely created before being written.
+            if file_stat[0] > 0:
+                settled.append(name)
+    return settled
@@ -0,0 +1,416 @@
+"""End-to-end throughput benchmark of `upload_images` against a local stand-in of the hostings.
+
+The real pipeline runs, with the files read, the thumbnails generated and the requests sent over the loopback,
+while the stand-in server answers with the canned responses of `tests.mock` after the configured latency
+and at the configured bandwidth. Each configuration runs in a fresh process, so its peak RSS is its own.
+The stand-in answers every request, `fakehost.FakeHost` is the one injecting the faults for the chaos testing.
+
+Run with `python -m tests.benchmark`, e.g.
+`python -m tests.benchmark --images 100 --batch-sizes 1,10 --image-sizes 256,2048 --latency 0.05 --bandwidth 10M`.
+"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import sys
+from collections.abc import Sequence
+from itertools import product
+from multiprocessing.connection import Connection
+from pathlib import Path
+from statistics import quantiles
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import NamedTuple
+
+import click
+from dotenv import load_dotenv
+from httpx import AsyncBaseTransport, AsyncClient, AsyncHTTPTransport, Request, Response, Timeout
+from PIL import Image
+
+from images_upload_cli.fakehost import SharedLink, read_request
+from images_upload_cli.logger import setup_logger
+from images_upload_cli.main import UploadRecord, upload_images
+from images_upload_cli.transport import RetryTransport
+from images_upload_cli.upload import BATCH_UPLOAD
+from images_upload_cli.util import ByteSizeParamType, human_size
+from tests.mock import RESPONSE
+
+# The header naming the hosting of a request sent to the stand-in server.
+HOSTING_HEADER = "X-Hosting"
+
+
+class Config(NamedTuple):
+    """A configuration of the benchmark."""
+
+    hosting: str
+    images: int
+    image_size: int
+    """The side of the square images in pixels."""
+    batch_size: int
+    thumbnail: bool
+    jobs: int
+
+
+class Result(NamedTuple):
+    """The measurements of a configuration."""
+
+    config: Config
+    seconds: float
+    images_per_second: float
+    mb_per_second: float
+    """The megabytes of the images and the thumbnails uploaded per second."""
+    p50: float
+    p95: float
+    p99: float
+    """The percentiles of the upload request latency of the images in seconds."""
+    peak_rss: int
+    """The peak resident set size of the process or of a thumbnail worker in bytes."""
+    failed: int
+
+
+def make_response(hosting: str, count: int) -> bytes:
+    """Make the response of a hosting from its canned response.
+
+    Args:
+        hosting: The hosting.
+        count: The number of the images of the request.
+
+    Returns:
+        The response body, listing `count` images for the hostings accepting several files per request.
+    """
+    text = RESPONSE[hosting][0]
+    if count > 1 and hosting == "ptpimg":
+        text = json.dumps(json.loads(text) * count)
+    elif count > 1 and hosting == "imgchest":
+        data = json.loads(text)
+        image = data["data"]["images"][0]
+        data["data"]["images"] = [{**image, "position": i + 1} for i in range(count)]
+        text = json.dumps(data)
+    return text.encode()
+
+
+class StandInServer:
+    """HTTP/1.1 server answering the uploads with the canned responses of the hostings.
+
+    The request bodies are received at `bandwidth` bytes per second, shared by all the connections,
+    and each response is sent `latency` seconds after its request is received.
+    """
+
+    def __init__(
+        self: "StandInServer", latency: float = 0.0, bandwidth: int | None = None
+    ) -> None:
+        """Init.
+
+        Args:
+            latency: The delay of the responses in seconds.
+            bandwidth: The bandwidth of the uploads in bytes per second, unlimited if `None`.
+        """
+        self.latency = latency
+        self.link = SharedLink(bandwidth)
+        self.requests = 0
+
+    async def listen(self: "StandInServer") -> asyncio.Server:
+        """Start accepting the connections on a free port of the loopback."""
+        return await asyncio.start_server(self.handle, "127.0.0.1", 0)
+
+    async def handle(
+        self: "StandInServer", reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Serve the requests of a keep-alive connection."""
+        try:
+            while (request := await read_request(reader, self.link)) is not None:
+                _, _, headers, body = request
+                hosting = headers.get(HOSTING_HEADER.lower(), "")
+                self.requests += 1
+                await asyncio.sleep(self.latency)
+                files = body.count(b'; filename="') if hosting in BATCH_UPLOAD else 1
+                data = make_response(hosting, files)
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n" % len(data) + data)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+class StandInTransport(AsyncBaseTransport):
+    """Transport sending the requests of a hosting to the stand-in server."""
+
+    def __init__(self: "StandInTransport", hosting: str, port: int) -> None:
+        """Init.
+
+        Args:
+            hosting: The hosting of the requests.
+            port: The port of the stand-in server on the loopback.
+        """
+        self.hosting = hosting
+        self.port = port
+        self.transport = AsyncHTTPTransport()
+
+    async def handle_async_request(self: "StandInTransport", request: Request) -> Response:
+        """Send the request to the stand-in server."""
+        request.url = request.url.copy_with(scheme="http", host="127.0.0.1", port=self.port)
+        request.headers[HOSTING_HEADER] = self.hosting
+        return await self.transport.handle_async_request(request)
+
+    async def aclose(self: "StandInTransport") -> None:
+        """Close the underlying transport."""
+        await self.transport.aclose()
+
+
+def make_images(directory: Path, count: int, size: int) -> list[Path]:
+    """Generate the images of random noise, so they don't compress.
+
+    Args:
+        directory: The directory to save the images to.
+        count: The number of the images.
+        size: The side of the square images in pixels.
+
+    Returns:
+        The paths of the JPEG images.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(count):
+        img_path = directory / f"{i}.jpg"
+        Image.frombytes("RGB", (size, size), os.urandom(size * size * 3)).save(
+            img_path, quality=90
+        )
+        paths.append(img_path)
+    return paths
+
+
+async def measure(config: Config, port: int, paths: Sequence[Path]) -> Result:
+    """Upload the images to the stand-in server and measure the throughput.
+
+    The hostings are not rate limited, so the pipeline is measured rather than the pacing of the requests.
+
+    Args:
+        config: The configuration.
+        port: The port of the stand-in server.
+        paths: The paths of the images.
+
+    Returns:
+        The measurements.
+    """
+    records: list[UploadRecord] = []
+    transport = RetryTransport(StandInTransport(config.hosting, port))
+    async with AsyncClient(transport=transport, timeout=Timeout(60.0)) as client:
+        started = perf_counter()
+        await upload_images(
+            config.hosting,
+            paths,
+            config.thumbnail,
+            jobs=config.jobs,
+            batch_size=config.batch_size,
+            clients={config.hosting: client},
+            on_upload=records.append,
+        )
+        seconds = perf_counter() - started
+
+    uploaded = [record for record in records if record.links is not None]
+    size = sum((record.size or 0) + (record.thumbnail_size or 0) for record in uploaded)
+    # Two points at least, the percentiles of a single one are the point itself.
+    latencies = [record.timings.get("http", 0.0) for record in uploaded] * 2 or [0.0, 0.0]
+    percentiles = quantiles(latencies, n=100, method="inclusive")
+    return Result(
+        config=config,
+        seconds=seconds,
+        images_per_second=len(uploaded) / seconds,
+        mb_per_second=size / seconds / 1e6,
+        p50=percentiles[49],
+        p95=percentiles[94],
+        p99=percentiles[98],
+        peak_rss=get_peak_rss(),
+        failed=len(paths) - len(uploaded),
+    )
+
+
+def get_peak_rss() -> int:
+    """Get the peak RSS of the process and of its finished children, e.g. the thumbnail workers.
+
+    Returns:
+        The peak resident set size in bytes.
+    """
+    if sys.platform == "darwin":
+        return max(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        )
+
+    # `ru_maxrss` of the process includes the RSS of the parent it was forked from before `exec`,
+    # the high water mark of its own memory doesn't.
+    with Path("/proc/self/status").open() as f:
+        peak = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+    return max(peak, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * 1024
+
+
+def measure_in_child(
+    config: Config, port: int, paths: Sequence[Path], log_level: str, sender: Connection
+) -> None:
+    """Run `measure` in a child process and send the result to the parent."""
+    setup_logger(log_level=log_level)
+    sender.send(asyncio.run(measure(config, port, paths)))
+
+
+def measure_in_process(config: Config, port: int, paths: Sequence[Path], log_level: str) -> Result:
+    """Run `measure` in a fresh process, so the peak RSS is of the configuration only.
+
+    Raises:
+        RuntimeError: If the process failed.
+    """
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(
+        target=measure_in_child, args=(config, port, paths, log_level, sender)
+    )
+    process.start()
+    sender.close()
+    try:
+        return receiver.recv()
+    except EOFError as exc:
+        msg = f"The benchmark of {config} failed with the exit code {process.exitcode}."
+        raise RuntimeError(msg) from exc
+    finally:
+        process.join()
+
+
+def format_result(result: Result) -> str:
+    """Format the measurements as a row of the report."""
+    config = result.config
+    return (
+        f"{config.hosting:<10} {config.batch_size:>5} {config.image_size:>6} {config.thumbnail!s:>6} "
+        f"{result.images_per_second:>9.1f} {result.mb_per_second:>8.2f} "
+        f"{result.p50 * 1000:>8.1f} {result.p95 * 1000:>8.1f} {result.p99 * 1000:>8.1f} "
+        f"{human_size(result.peak_rss):>10} {result.failed:>6}"
+    )
+
+
+def parse_list(_ctx: click.Context, _param: click.Parameter, value: str) -> list[str]:
+    """Split a comma-separated option."""
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def parse_int_list(ctx: click.Context, param: click.Parameter, value: str) -> list[int]:
+    """Split a comma-separated option of positive integers."""
+    try:
+        numbers = [int(item) for item in parse_list(ctx, param, value)]
+    except ValueError:
+        numbers = []
+    if not numbers or min(numbers) < 1:
+        msg = f"'{value}' is not a comma-separated list of positive integers."
+        raise click.BadParameter(msg)
+    return numbers
+
+
+@click.command(context_settings={"max_content_width": 120, "show_default": True})
+@click.option(
+    "--hostings",
+    callback=parse_list,
+    default="imgur,ptpimg",
+    help=f"The emulated hostings, of {', '.join(RESPONSE)}.",
+)
+@click.option(
+    "--images", type=click.IntRange(min=1), default=50, help="The number of images per run."
+)
+@click.option(
+    "--image-sizes",
+    callback=parse_int_list,
+    default="256,1024",
+    help="The sides of the square noise images in pixels.",
+)
+@click.option("--batch-sizes", callback=parse_int_list, default="1,10", help="The batch sizes.")
+@click.option(
+    "--thumbnail",
+    type=click.Choice(("off", "on", "both")),
+    default="both",
+    help="Whether to upload the thumbnails.",
+)
+@click.option(
+    "-j", "--jobs", type=click.IntRange(min=1), default=4, help="The concurrent requests."
+)
+@click.option(
+    "--latency", type=click.FloatRange(min=0), default=0.05, help="The server latency in seconds."
+)
+@click.option(
+    "--bandwidth",
+    type=ByteSizeParamType(),
+    help="The upload bandwidth per second, shared by the connections, e.g. '10M'.  [default: unlimited]",
+)
+@click.option(
+    "--json",
+    "json_path",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="Also write the results to this JSON file, e.g. to compare them between the commits.",
+)
+@click.option(
+    "--log-level",
+    type=click.Choice(("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")),
+    default="WARNING",
+)
+def main(
+    *,
+    hostings: list[str],
+    images: int,
+    image_sizes: list[int],
+    batch_sizes: list[int],
+    thumbnail: str,
+    jobs: int,
+    latency: float,
+    bandwidth: int | None,
+    json_path: Path | None,
+    log_level: str,
+) -> None:
+    """Benchmark the upload pipeline against a local stand-in of the hostings."""
+    if unknown := set(hostings) - RESPONSE.keys():
+        msg = f"Unknown hostings: {', '.join(sorted(unknown))}."
+        raise click.BadParameter(msg, param_hint="'--hostings'")
+
+    load_dotenv(dotenv_path="tests/data/.env.sample")
+    thumbnails = {"off": [False], "on": [True], "both": [False, True]}[thumbnail]
+    configs = [
+        Config(hosting, images, image_size, batch_size, thumb, jobs)
+        for hosting, image_size, batch_size, thumb in product(
+            hostings, image_sizes, batch_sizes, thumbnails
+        )
+    ]
+
+    async def run(tmp_dir: Path) -> list[Result]:
+        server = StandInServer(latency, bandwidth)
+        results = []
+        async with await server.listen() as listener:
+            port = listener.sockets[0].getsockname()[1]
+            paths_by_size = {}
+            for config in configs:
+                if config.image_size not in paths_by_size:
+                    paths_by_size[config.image_size] = await asyncio.to_thread(
+                        make_images, tmp_dir / str(config.image_size), images, config.image_size
+                    )
+                paths = paths_by_size[config.image_size]
+                result = await asyncio.to_thread(
+                    measure_in_process, config, port, paths, log_level
+                )
+                click.echo(format_result(result))
+                results.append(result)
+        return results
+
+    click.echo(
+        f"{'hosting':<10} {'batch':>5} {'size':>6} {'thumb':>6} {'images/s':>9} {'MB/s':>8} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'peak RSS':>10} {'failed':>6}"
+    )
+    with TemporaryDirectory(prefix="imgup-bench-") as tmp_dir:
+        results = asyncio.run(run(Path(tmp_dir)))
+
+    if json_path is not None:
+        json_path.write_text(
+            json.dumps(
+                [{**result._asdict(), "config": result.config._asdict()} for result in results],
+                indent=2,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ from pathlib import Path
 
 import pytest
 from logot.loguru import LoguruCapturer
+from pytest_mock import MockerFixture
 
 
 @pytest.fixture
@@ -15,3 +16,17 @@ def img() -> bytes:
 @pytest.fixture(scope="session")
 def logot_capturer() -> Callable[[], LoguruCapturer]:
     return LoguruCapturer
+
+
+@pytest.fixture(autouse=True)
+def cache_path(tmp_path: Path, mocker: MockerFixture) -> Path:
+    path = tmp_path / "cache.sqlite"
+    mocker.patch("images_upload_cli.util.get_cache_path", return_value=path)
+    return path
+
+
+@pytest.fixture(autouse=True)
+def font_index_path(tmp_path: Path, mocker: MockerFixture) -> Path:
+    path = tmp_path / "fonts.json"
+    mocker.patch("images_upload_cli.image.get_font_index_path", return_value=path)
+    return path
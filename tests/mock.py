@@ -87,3 +87,19 @@ RESPONSE: dict[str, tuple[str, str]] = {
 }
 
 MOCK_HOSTINGS = tuple(RESPONSE.keys())
+
+# Responses to the requests with two images.
+imgchest_batch = """{"data":{"id":"qe4g522b7j2","images":[{"id":"9pgb2kxmgyz","link":"https:\\/\\/cdn.imgchest.com\\/files\\/9pgb2kxmgyz.png","position":2},{"id":"3yrgcr3jpp4","link":"https:\\/\\/cdn.imgchest.com\\/files\\/3yrgcr3jpp4.png","position":1}]}}"""
+ptpimg_batch = """[{"code": "8i531v", "ext": "png"}, {"code": "k2u7p0", "ext": "png"}]"""
+
+
+BATCH_RESPONSE: dict[str, tuple[str, list[str]]] = {
+    "imgchest": (
+        imgchest_batch,
+        [
+            "https://cdn.imgchest.com/files/3yrgcr3jpp4.png",
+            "https://cdn.imgchest.com/files/9pgb2kxmgyz.png",
+        ],
+    ),
+    "ptpimg": (ptpimg_batch, ["https://ptpimg.me/8i531v.png", "https://ptpimg.me/k2u7p0.png"]),
+}
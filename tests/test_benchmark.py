@@ -0,0 +1,39 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from tests.benchmark import Config, StandInServer, make_images, make_response, measure
+from tests.mock import RESPONSE
+
+
+def test_make_response() -> None:
+    assert make_response("imgur", 1) == RESPONSE["imgur"][0].encode()
+    assert len(json.loads(make_response("ptpimg", 3))) == 3
+    images = json.loads(make_response("imgchest", 2))["data"]["images"]
+    assert [image["position"] for image in images] == [1, 2]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("hosting", "batch_size", "thumbnail"),
+    [("imgur", 1, False), ("ptpimg", 2, False), ("catbox", 1, True)],
+)
+async def test_measure(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, hosting: str, batch_size: int, thumbnail: bool
+) -> None:
+    """Test that the real pipeline uploads to the stand-in server at its bandwidth."""
+    monkeypatch.setenv("PTPIMG_KEY", "key")
+    paths = make_images(tmp_path, 3, 32)
+    server = StandInServer(latency=0.01, bandwidth=10 * 1024 * 1024)
+
+    async with await server.listen() as listener:
+        port = listener.sockets[0].getsockname()[1]
+        result = await measure(Config(hosting, 3, 32, batch_size, thumbnail, 2), port, paths)
+
+    assert result.failed == 0
+    assert server.requests == (2 if batch_size == 2 else 3) * (2 if thumbnail else 1)
+    assert result.images_per_second > 0
+    assert result.mb_per_second > 0
+    assert 0.01 <= result.p50 <= result.p95 <= result.p99
+    assert result.peak_rss > 0
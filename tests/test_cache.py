@@ -0,0 +1,129 @@
+from contextlib import closing
+from hashlib import blake2b
+from pathlib import Path
+
+from pytest_mock import MockerFixture
+
+from images_upload_cli.cache import ThumbnailCache, UploadCache, derive_key, file_digest
+
+
+def test_file_digest(tmp_path: Path) -> None:
+    path = tmp_path / "file"
+    data = b"x" * 3_000_000
+    path.write_bytes(data)
+
+    assert file_digest(path) == blake2b(data, digest_size=20).hexdigest()
+
+
+def test_upload_cache(cache_path: Path) -> None:
+    links = ("https://example.com/image.png", "https://example.com/thumb.png")
+
+    with closing(UploadCache(cache_path)) as cache:
+        assert cache.get("digest", "imgur", thumbnail=True) is None
+        cache.set("digest", "imgur", thumbnail=True, links=links)
+        assert cache.get("digest", "imgur", thumbnail=True) == links
+        # The hosting and the thumbnail flag are part of the key.
+        assert cache.get("digest", "imgur", thumbnail=False) is None
+        assert cache.get("digest", "catbox", thumbnail=True) is None
+
+    # The cache is persistent.
+    with closing(UploadCache(cache_path)) as cache:
+        assert cache.get("digest", "imgur", thumbnail=True) == links
+
+
+def test_upload_cache_evict_expired(cache_path: Path, mocker: MockerFixture) -> None:
+    with closing(UploadCache(cache_path)) as cache:
+        cache.set("digest", "imgur", thumbnail=False, links=("link", None))
+
+    mock_time = mocker.patch("images_upload_cli.cache.time")
+    mock_time.return_value = 10**12
+
+    with closing(UploadCache(cache_path, max_age=60)) as cache:
+        assert cache.get("digest", "imgur", thumbnail=False) is None
+
+
+def test_upload_cache_evict_least_recently_used(cache_path: Path, mocker: MockerFixture) -> None:
+    mock_time = mocker.patch("images_upload_cli.cache.time", return_value=1000)
+
+    with closing(UploadCache(cache_path)) as cache:
+        for i in range(3):
+            mock_time.return_value = 1000 + i
+            cache.set(f"digest{i}", "imgur", thumbnail=False, links=(f"link{i}", None))
+        # Access the oldest entry, so it becomes the most recently used.
+        mock_time.return_value = 1010
+        cache.get("digest0", "imgur", thumbnail=False)
+
+    with closing(UploadCache(cache_path, max_entries=2, max_age=10**12)) as cache:
+        assert cache.get("digest0", "imgur", thumbnail=False) == ("link0", None)
+        assert cache.get("digest1", "imgur", thumbnail=False) is None
+        assert cache.get("digest2", "imgur", thumbnail=False) == ("link2", None)
+
+
+def test_upload_cache_evict_on_store(cache_path: Path, mocker: MockerFixture) -> None:
+    mock_time = mocker.patch("images_upload_cli.cache.time", return_value=1000)
+
+    with closing(UploadCache(cache_path, max_entries=1, evict_interval=60)) as cache:
+        cache.set("digest0", "imgur", thumbnail=False, links=("link0", None))
+        mock_time.return_value = 1001
+        cache.set("digest1", "imgur", thumbnail=False, links=("link1", None))
+        # The eviction is throttled.
+        assert cache.get("digest0", "imgur", thumbnail=False) == ("link0", None)
+
+        mock_time.return_value = 1100
+        cache.set("digest2", "imgur", thumbnail=False, links=("link2", None))
+        # The cache is trimmed without being reopened.
+        assert cache.get("digest0", "imgur", thumbnail=False) is None
+        assert cache.get("digest1", "imgur", thumbnail=False) is None
+        assert cache.get("digest2", "imgur", thumbnail=False) == ("link2", None)
+
+
+def test_thumbnail_cache(cache_path: Path) -> None:
+    with closing(ThumbnailCache(cache_path)) as cache:
+        assert cache.get("key") is None
+        cache.set("key", b"thumb")
+        assert cache.get("key") == b"thumb"
+
+    # The cache is persistent and shares the database with the upload cache.
+    with closing(UploadCache(cache_path)), closing(ThumbnailCache(cache_path)) as cache:
+        assert cache.get("key") == b"thumb"
+
+
+def test_thumbnail_cache_evict_least_recently_used(
+    cache_path: Path, mocker: MockerFixture
+) -> None:
+    mock_time = mocker.patch("images_upload_cli.cache.time", return_value=1000)
+
+    with closing(ThumbnailCache(cache_path)) as cache:
+        for i in range(3):
+            mock_time.return_value = 1000 + i
+            cache.set(f"key{i}", bytes(100))
+        # Access the oldest thumbnail, so it becomes the most recently used.
+        mock_time.return_value = 1010
+        cache.get("key0")
+
+    with closing(ThumbnailCache(cache_path, max_bytes=250)) as cache:
+        assert cache.get("key0") == bytes(100)
+        assert cache.get("key1") is None
+        assert cache.get("key2") == bytes(100)
+
+
+def test_thumbnail_cache_evict_on_store(cache_path: Path, mocker: MockerFixture) -> None:
+    mock_time = mocker.patch("images_upload_cli.cache.time", return_value=1000)
+
+    with closing(ThumbnailCache(cache_path, max_bytes=150, evict_interval=60)) as cache:
+        cache.set("key0", bytes(100))
+        mock_time.return_value = 1100
+        cache.set("key1", bytes(100))
+
+        # The cache is trimmed without being reopened.
+        assert cache.get("key0") is None
+        assert cache.get("key1") == bytes(100)
+
+
+def test_derive_key() -> None:
+    key = derive_key("digest", (300, 300), "font.ttf", 14)
+
+    assert key == derive_key("digest", (300, 300), "font.ttf", 14)
+    assert key != derive_key("other", (300, 300), "font.ttf", 14)
+    assert key != derive_key("digest", (200, 200), "font.ttf", 14)
+    assert key != derive_key("digest", (300, 300), "font.ttf", 16)
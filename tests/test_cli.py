@@ -1,12 +1,33 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any
+
+import click
 import pytest
 from click.testing import CliRunner
+from httpx import Limits, Timeout
 from pytest_httpx import HTTPXMock
 from pytest_mock import MockerFixture
 
 from images_upload_cli.__main__ import cli
+from images_upload_cli._cli import HOSTINGS as CLI_HOSTINGS
+from images_upload_cli._cli import RECOMPRESS_FORMATS as CLI_RECOMPRESS_FORMATS
+from images_upload_cli._cli import (
+    ByteSizeParamType,
+    HostingsParamType,
+    RecompressParamType,
+    TimeoutParamType,
+)
+from images_upload_cli.image import RECOMPRESS_FORMATS, Transform
+from images_upload_cli.main import UploadRecord
 from images_upload_cli.upload import HOSTINGS
 from tests.mock import MOCK_HOSTINGS, RESPONSE
 
+# The budget of the cli module import time, checked against `python -X importtime`.
+STARTUP_BUDGET_MS = 150
+
 
 @pytest.fixture
 def runner():
@@ -25,6 +46,398 @@ def test_cli_error(runner: CliRunner) -> None:
     assert runner.invoke(cli=cli, args=args).exit_code == 2
 
 
+def test_cli_hostings() -> None:
+    """Test that the hostings listed in the cli match the upload functions."""
+    assert CLI_HOSTINGS == HOSTINGS
+
+
+def test_cli_recompress_formats() -> None:
+    """Test that the recompress formats listed in the cli match the image module."""
+    assert CLI_RECOMPRESS_FORMATS == RECOMPRESS_FORMATS
+
+
+def test_cli_startup_imports() -> None:
+    """Test that the cli module doesn't import heavy dependencies and fits the startup budget."""
+    code = (
+        "import sys, images_upload_cli._cli; "
+        "print(*(m for m in ('PIL', 'httpx', 'loguru', 'rich', 'pyperclip', 'dotenv') if m in sys.modules))"
+    )
+    result = subprocess.run(  # noqa: PLW1510
+        [sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True
+    )
+    assert result.returncode == 0
+    assert result.stdout.strip() == ""
+
+    # The last line of the import time report is the cumulative time of the cli module in microseconds.
+    cumulative_us = int(result.stderr.strip().splitlines()[-1].split("|")[1])
+    assert cumulative_us < STARTUP_BUDGET_MS * 1000
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [
+        ("imgur", ("imgur",)),
+        ("imgur, catbox,", ("imgur", "catbox")),
+    ],
+)
+def test_hostings_param_type(value: str, expected: tuple[str, ...]) -> None:
+    assert HostingsParamType().convert(value, None, None) == expected
+
+
+@pytest.mark.parametrize("value", ["", " , ", "imgur,unknown"])
+def test_hostings_param_type_error(value: str) -> None:
+    with pytest.raises(click.BadParameter):
+        HostingsParamType().convert(value, None, None)
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [
+        ("10", Timeout(10.0)),
+        ("connect=3", Timeout(5.0, connect=3.0)),
+        ("30, connect=3,pool=1", Timeout(30.0, connect=3.0, pool=1.0)),
+    ],
+)
+def test_timeout_param_type(value: str, expected: Timeout) -> None:
+    assert TimeoutParamType().convert(value, None, None) == expected
+
+
+@pytest.mark.parametrize("value", ["ten", "connect=", "total=10"])
+def test_timeout_param_type_error(value: str) -> None:
+    with pytest.raises(click.BadParameter):
+        TimeoutParamType().convert(value, None, None)
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [
+        ("500000", 500_000),
+        ("500K", 500 * 1024),
+        ("1.5MiB", 3 * 512 * 1024),
+        ("2mb", 2 * 1024 * 1024),
+    ],
+)
+def test_byte_size_param_type(value: str, expected: int) -> None:
+    assert ByteSizeParamType().convert(value, None, None) == expected
+
+
+@pytest.mark.parametrize("value", ["", "MiB", "ten", "0", "-1K", "inf"])
+def test_byte_size_param_type_error(value: str) -> None:
+    with pytest.raises(click.BadParameter):
+        ByteSizeParamType().convert(value, None, None)
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [
+        ("webp", ("webp", 80)),
+        ("JPEG:95", ("jpeg", 95)),
+    ],
+)
+def test_recompress_param_type(value: str, expected: tuple[str, int]) -> None:
+    assert RecompressParamType().convert(value, None, None) == expected
+
+
+@pytest.mark.parametrize("value", ["png", "webp:", "webp:0", "avif:101", "jpeg:high"])
+def test_recompress_param_type_error(value: str) -> None:
+    with pytest.raises(click.BadParameter):
+        RecompressParamType().convert(value, None, None)
+
+
+def test_cli_transform_options(runner: CliRunner, mocker: MockerFixture) -> None:
+    """Test that the transform options are passed to upload_images."""
+    mock_upload_images = mocker.patch("images_upload_cli.main.upload_images", return_value=[])
+
+    assert runner.invoke(cli=cli, args=["tests/data/pic.png"]).exit_code == 0
+    assert mock_upload_images.call_args.kwargs["transform"] is None
+
+    args = ["tests/data/pic.png", "--max-dimension", "2048", "--max-bytes", "2MiB"]
+    assert runner.invoke(cli=cli, args=[*args, "--recompress", "webp:75"]).exit_code == 0
+    assert mock_upload_images.call_args.kwargs["transform"] == Transform(
+        max_dimension=2048, max_bytes=2 * 1024 * 1024, format="webp", quality=75
+    )
+
+    assert runner.invoke(cli=cli, args=["tests/data/pic.png", "--strip-metadata"]).exit_code == 0
+    assert mock_upload_images.call_args.kwargs["transform"] == Transform(strip_metadata=True)
+
+
+def test_cli_image_paths(runner: CliRunner, mocker: MockerFixture, tmp_path: Path) -> None:
+    """Test that the directories and the glob patterns are expanded into the images."""
+    mock_upload_images = mocker.patch("images_upload_cli.main.upload_images", return_value=[])
+    for name in ("a.png", "b/c.jpg", "b/d.txt"):
+        (tmp_path / name).parent.mkdir(exist_ok=True)
+        (tmp_path / name).write_bytes(b"")
+
+    args = [str(tmp_path / "b"), str(tmp_path / "*.png")]
+    assert runner.invoke(cli=cli, args=args).exit_code == 0
+    assert list(mock_upload_images.call_args.kwargs["images"]) == [
+        tmp_path / "b" / "c.jpg",
+        tmp_path / "a.png",
+    ]
+
+    # The paths that are not glob patterns must exist.
+    result = runner.invoke(cli=cli, args=[str(tmp_path / "missing.png")])
+    assert result.exit_code == 2
+    assert "does not exist" in result.output
+
+
+def test_cli_from_stdin(runner: CliRunner, mocker: MockerFixture) -> None:
+    """Test that the paths are read from stdin after the arguments."""
+    mock_upload_images = mocker.patch("images_upload_cli.main.upload_images", return_value=[])
+
+    args = ["tests/data/pic.png", "--from-stdin", "-0"]
+    result = runner.invoke(cli=cli, args=args, input="tests/data/pic.png\0tests/data\0")
+
+    assert result.exit_code == 0
+    assert list(mock_upload_images.call_args.kwargs["images"]) == [
+        Path("tests/data/pic.png"),
+        Path("tests/data/pic.png"),
+        Path("tests/data/pic.png"),
+    ]
+
+
+def test_cli_missing_images(runner: CliRunner) -> None:
+    result = runner.invoke(cli=cli, args=[])
+
+    assert result.exit_code == 2
+    assert "Missing argument 'IMAGES...' or option '--from-stdin'." in result.output
+
+
+def test_cli_stream(runner: CliRunner, mocker: MockerFixture) -> None:
+    """Test that the links are printed one by one as they are uploaded, and not copied."""
+
+    async def upload_images(**kwargs: Any) -> list[tuple[str, str | None]]:
+        for i, img_path in enumerate(kwargs["images"]):
+            kwargs["on_upload"](
+                UploadRecord(img_path, "imgur", url=f"https://example.com/{i}.png")
+            )
+        kwargs["on_upload"](UploadRecord(Path("failed.png"), "imgur", error="Failed."))
+        return []
+
+    mocker.patch("images_upload_cli.main.upload_images", side_effect=upload_images)
+    mock_copy = mocker.patch("pyperclip.copy")
+
+    args = ["tests/data/pic.png", "tests/data/pic.png", "--stream", "-f", "markdown"]
+    result = runner.invoke(cli=cli, args=args)
+
+    assert result.exit_code == 0
+    assert result.output.splitlines() == [
+        "![image](https://example.com/0.png)",
+        "![image](https://example.com/1.png)",
+    ]
+    mock_copy.assert_not_called()
+
+
+def test_cli_jsonl(runner: CliRunner, mocker: MockerFixture) -> None:
+    """Test that a JSON record is printed for each image, including the failed ones."""
+
+    async def upload_images(**kwargs: Any) -> list[tuple[str, str | None]]:
+        for img_path in kwargs["images"]:
+            kwargs["on_upload"](UploadRecord(img_path, "imgur", url="https://example.com/0.png"))
+        kwargs["on_upload"](UploadRecord(Path("failed.png"), "imgur", error="Failed."))
+        return []
+
+    mocker.patch("images_upload_cli.main.upload_images", side_effect=upload_images)
+
+    result = runner.invoke(cli=cli, args=["tests/data/pic.png", "-t", "-f", "jsonl"])
+
+    assert result.exit_code == 0
+    records = [json.loads(line) for line in result.output.splitlines()]
+    assert [(record["path"], record["url"], record["error"]) for record in records] == [
+        (str(Path("tests/data/pic.png")), "https://example.com/0.png", None),
+        ("failed.png", None, "Failed."),
+    ]
+
+
+def test_cli_resume(runner: CliRunner, mocker: MockerFixture, tmp_path: Path) -> None:
+    """Test that the images journaled by an interrupted run are skipped and their links merged."""
+    images = [tmp_path / "a.png", tmp_path / "b.png"]
+    for img_path in images:
+        img_path.write_bytes(Path("tests/data/pic.png").read_bytes())
+    uploaded: list[list[Path]] = []
+
+    async def upload_images(**kwargs: Any) -> list[tuple[str, str | None]]:
+        img_paths = [img_path async for img_path in kwargs["images"]]
+        uploaded.append(img_paths)
+        # The first run is interrupted after the first image.
+        for img_path in img_paths[:1]:
+            link = f"https://example.com/{img_path.name}"
+            kwargs["on_upload"](UploadRecord(img_path, "imgur", url=link))
+        return []
+
+    mocker.patch("images_upload_cli.main.upload_images", side_effect=upload_images)
+    args = [*map(str, images), "--journal", str(tmp_path / "journal.jsonl"), "--no-clipboard"]
+
+    result = runner.invoke(cli=cli, args=args)
+    assert result.output.splitlines() == ["https://example.com/a.png"]
+
+    result = runner.invoke(cli=cli, args=[*args, "--resume"])
+    assert result.exit_code == 0
+    assert uploaded[1] == images[1:]
+    assert result.stdout.splitlines() == ["https://example.com/a.png https://example.com/b.png"]
+
+
+def test_cli_resume_without_journal(runner: CliRunner) -> None:
+    result = runner.invoke(cli=cli, args=["tests/data/pic.png", "--resume"])
+
+    assert result.exit_code == 2
+    assert "Option '--resume' requires '--journal'." in result.output
+
+
+def test_cli_serve_help(runner: CliRunner) -> None:
+    """Test that the subcommands are dispatched by name and listed in the help."""
+    result = runner.invoke(cli=cli, args=["serve", "--help"], prog_name="imgup")
+    assert result.exit_code == 0
+    assert result.output.startswith("Usage: imgup serve [OPTIONS]")
+
+    result = runner.invoke(cli=cli, args=["--help"])
+    assert "serve  Run the upload daemon." in result.output
+    assert "watch  Upload the new images of a directory as they appear." in result.output
+
+
+def test_cli_serve_port_requires_token(runner: CliRunner) -> None:
+    """Test that the daemon doesn't listen on TCP without a token."""
+    result = runner.invoke(
+        cli=cli, args=["serve", "--port", "0"], env={"IMGUP_SERVER_TOKEN": None}
+    )
+    assert result.exit_code == 2
+    assert "Option '--port' requires '--token'." in result.output
+
+
+def test_cli_watch(
+    runner: CliRunner, mocker: MockerFixture, tmp_path: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    """Test that the watched images are uploaded in a single run of the pipeline."""
+    upload_images = mocker.patch("images_upload_cli.main.upload_images", return_value=[])
+    watch_images = mocker.patch("images_upload_cli.watch.watch_images")
+
+    args = [
+        "watch",
+        str(tmp_path),
+        "-t",
+        "--poll",
+        "--settle",
+        "0.5",
+        "--no-clipboard",
+        "--no-cache",
+    ]
+    result = runner.invoke(cli=cli, args=args)
+    assert result.exit_code == 0
+
+    watch_images.assert_called_once_with(tmp_path, settle=0.5, interval=1.0, use_inotify=False)
+    kwargs = upload_images.call_args.kwargs
+    assert kwargs["images"] is watch_images.return_value
+    assert kwargs["batch_size"] == 1
+
+    # The link of each image is printed as soon as it is uploaded.
+    kwargs["on_upload"](
+        UploadRecord(tmp_path / "pic.png", "imgur", url="url", thumbnail_url="thumb")
+    )
+    assert capsys.readouterr().out == "[url=url][img]thumb[/img][/url]\n"
+
+    # A failed image is skipped.
+    kwargs["on_upload"](UploadRecord(tmp_path / "bad.png", "imgur", error="corrupt"))
+    assert capsys.readouterr().out == ""
+
+
+@pytest.mark.parametrize(("failed", "exit_code"), [(0, 0), (1, 1)])
+def test_cli_server(runner: CliRunner, mocker: MockerFixture, failed: int, exit_code: int) -> None:
+    """Test that the images are uploaded through the daemon and the links are output locally."""
+    mock_request_upload = mocker.patch(
+        "images_upload_cli.client.request_upload",
+        return_value={"output": "[img]link[/img]", "links": [["link", None]], "failed": failed},
+    )
+    mock_copy = mocker.patch("pyperclip.copy")
+
+    args = ["tests/data/pic.png", "--server", "/tmp/imgup.sock", "-f", "bbcode"]
+    result = runner.invoke(cli=cli, args=args)
+
+    assert result.exit_code == exit_code
+    assert result.stdout == "[img]link[/img]\n"
+    mock_request_upload.assert_called_once_with(
+        "/tmp/imgup.sock",
+        [Path("tests/data/pic.png")],
+        "bbcode",
+        thumbnail=False,
+        transform=None,
+        cache=True,
+        token=None,
+    )
+    mock_copy.assert_called_once_with("[img]link[/img]")
+
+
+def test_cli_server_forwarded_options(runner: CliRunner, mocker: MockerFixture) -> None:
+    """Test that the transform and the cache options are forwarded to the daemon."""
+    mock_request_upload = mocker.patch(
+        "images_upload_cli.client.request_upload",
+        return_value={"output": "link", "links": [["link", None]], "failed": 0},
+    )
+
+    args = ["tests/data/pic.png", "--server", "/tmp/imgup.sock", "--no-clipboard"]
+    args += ["--max-dimension", "600", "--recompress", "webp:75", "--no-cache"]
+    result = runner.invoke(cli=cli, args=args)
+
+    assert result.exit_code == 0
+    kwargs = mock_request_upload.call_args.kwargs
+    assert kwargs["transform"] == Transform(600, None, "webp", 75)
+    assert kwargs["cache"] is False
+
+
+@pytest.mark.parametrize(
+    ("args", "options"),
+    [
+        (["-h", "catbox"], "--hosting"),
+        (["-j", "8", "--journal", "journal.jsonl"], "--jobs, --journal"),
+        (["--no-http2"], "--http2"),
+    ],
+)
+def test_cli_server_daemon_options(
+    runner: CliRunner, mocker: MockerFixture, args: list[str], options: str
+) -> None:
+    """Test that the options set by the daemon are rejected instead of being ignored."""
+    mock_request_upload = mocker.patch("images_upload_cli.client.request_upload")
+
+    result = runner.invoke(cli=cli, args=["tests/data/pic.png", "--server", "/tmp/s", *args])
+
+    assert result.exit_code == 2
+    assert f"can't be used with {options}," in result.output
+    mock_request_upload.assert_not_called()
+
+
+def test_cli_server_jsonl(runner: CliRunner, mocker: MockerFixture) -> None:
+    """Test that the records returned by the daemon are printed, not copied to the clipboard."""
+    mocker.patch(
+        "images_upload_cli.client.request_upload",
+        return_value={"output": '{"url": "link"}', "links": [["link", None]], "failed": 0},
+    )
+    mock_copy = mocker.patch("pyperclip.copy")
+
+    args = ["tests/data/pic.png", "--server", "/tmp/imgup.sock", "-f", "jsonl"]
+    result = runner.invoke(cli=cli, args=args)
+
+    assert result.exit_code == 0
+    assert result.stdout == '{"url": "link"}\n'
+    mock_copy.assert_not_called()
+
+
+def test_cli_client_options(runner: CliRunner, mocker: MockerFixture, tmp_path: Path) -> None:
+    """Test that the client options are read from the command line and the environment file."""
+    env_file = tmp_path / ".env"
+    env_file.write_text("IMGUP_HTTP2=1\nIMGUP_MAX_CONNECTIONS=8\nIMGUP_TIMEOUT=30\n")
+    mocker.patch.dict("os.environ")
+    mock_upload_images = mocker.patch("images_upload_cli.main.upload_images", return_value=[])
+
+    args = ["tests/data/pic.png", "--env-file", str(env_file), "--max-keepalive-connections", "2"]
+    assert runner.invoke(cli=cli, args=args).exit_code == 0
+
+    kwargs = mock_upload_images.call_args.kwargs
+    assert kwargs["http2"] is True
+    assert kwargs["limits"] == Limits(
+        max_connections=8, max_keepalive_connections=2, keepalive_expiry=5.0
+    )
+    assert kwargs["timeout"] == Timeout(30.0)
+
+
 @pytest.mark.parametrize(
     ("hosting", "mock_text", "mock_link"),
     [
@@ -60,8 +473,8 @@ def test_cli(
     # Mock response.
     httpx_mock.add_response(text=mock_text)
     # Mock functions.
-    mock_copy = mocker.patch("images_upload_cli._cli.copy", return_value=None)
-    mock_notify_send = mocker.patch("images_upload_cli._cli.notify_send", return_value=None)
+    mock_copy = mocker.patch("pyperclip.copy", return_value=None)
+    mock_notify_send = mocker.patch("images_upload_cli.util.notify_send", return_value=None)
     # Mock image extension to be matched with mock_link.
     mocker.patch("images_upload_cli.upload.get_img_ext", return_value="png")
 
@@ -95,6 +508,41 @@ def test_cli(
         mock_notify_send.assert_called_once_with(mock_link)
 
 
+@pytest.mark.parametrize(
+    ("responses", "exit_code"),
+    [
+        pytest.param((400, 200), 0, id="fallback"),
+        pytest.param((400, 400), 1, id="failure"),
+    ],
+)
+def test_cli_failover(
+    runner: CliRunner,
+    httpx_mock: HTTPXMock,
+    responses: tuple[int, int],
+    exit_code: int,
+) -> None:
+    """Test that the cli succeeds if the image is uploaded to a fallback hosting."""
+    httpx_mock.add_response(url="https://api.imgur.com/3/image", status_code=responses[0])
+    httpx_mock.add_response(
+        url="https://catbox.moe/user/api.php",
+        status_code=responses[1],
+        text=RESPONSE["catbox"][0],
+    )
+
+    args = [
+        "tests/data/pic.png",
+        "--no-clipboard",
+        "--log-level",
+        "CRITICAL",
+        "-h",
+        "imgur,catbox",
+    ]
+    result = runner.invoke(cli=cli, args=args)
+
+    assert result.exit_code == exit_code
+    assert result.output.strip() == (RESPONSE["catbox"][1] if exit_code == 0 else "")
+
+
 @pytest.mark.online
 @pytest.mark.parametrize("hosting", HOSTINGS)
 def test_cli_online(runner: CliRunner, hosting: str) -> None:
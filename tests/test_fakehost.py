@@ -0,0 +1,174 @@
+import asyncio
+from collections.abc import AsyncIterator
+from time import perf_counter
+
+import pytest
+import pytest_asyncio
+from dotenv import load_dotenv
+from httpx import AsyncClient
+
+from images_upload_cli.fakehost import (
+    HOSTS,
+    FakeHost,
+    FakeHostTransport,
+    Faults,
+    SharedLink,
+    read_request,
+)
+from images_upload_cli.transport import TRANSIENT_ERRORS, RetryTransport, make_client
+from images_upload_cli.upload import BATCH_UPLOAD, RATE_LIMITS, UPLOAD
+
+
+@pytest_asyncio.fixture
+async def fakehost(request: pytest.FixtureRequest) -> AsyncIterator[tuple[FakeHost, str]]:
+    """Run a fake host with the faults passed by indirect parametrization."""
+    server = FakeHost(getattr(request, "param", None), seed=0)
+    async with await server.listen() as listener:
+        yield server, f"http://127.0.0.1:{listener.sockets[0].getsockname()[1]}"
+
+
+@pytest.mark.asyncio
+async def test_read_request() -> None:
+    """Test that the chunked and the sized bodies of a keep-alive connection are read."""
+    reader = asyncio.StreamReader()
+    reader.feed_data(
+        b"POST /upload HTTP/1.1\r\nHost: vgy.me\r\nTransfer-Encoding: chunked\r\n\r\n"
+        b"3\r\nabc\r\n2;ext\r\nde\r\n0\r\n\r\n"
+        b"GET /show HTTP/1.1\r\nContent-Length: 2\r\n\r\nfg"
+    )
+    reader.feed_eof()
+    link = SharedLink()
+
+    assert await read_request(reader, link) == (
+        "POST",
+        "/upload",
+        {"host": "vgy.me", "transfer-encoding": "chunked"},
+        b"abcde",
+    )
+    assert await read_request(reader, link) == ("GET", "/show", {"content-length": "2"}, b"fg")
+    assert await read_request(reader, link) is None
+
+
+@pytest.mark.asyncio
+async def test_shared_link() -> None:
+    """Test that the concurrent bodies share the bandwidth of the link."""
+    link = SharedLink(bandwidth=10_000)
+    readers = [asyncio.StreamReader() for _ in range(2)]
+    for reader in readers:
+        reader.feed_data(bytes(1000))
+
+    started = perf_counter()
+    await asyncio.gather(*(link.receive(reader, 1000) for reader in readers))
+
+    assert perf_counter() - started >= 0.19
+
+
+def test_fakehost_hosts() -> None:
+    """Test that all the hostings are emulated."""
+    assert sorted(HOSTS.values()) == sorted(UPLOAD)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("hosting", UPLOAD)
+async def test_fakehost_upload(fakehost: tuple[FakeHost, str], hosting: str, img: bytes) -> None:
+    """Test that the responses are parsed by the upload functions."""
+    server, address = fakehost
+    load_dotenv(dotenv_path="tests/data/.env.sample")
+    async with AsyncClient(transport=FakeHostTransport(address)) as client:
+        link = await UPLOAD[hosting](client, img)
+
+    assert link.startswith("https://")
+    assert "fake000001" in link
+    assert server.stats["uploads"] == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("hosting", BATCH_UPLOAD)
+async def test_fakehost_upload_batch(
+    fakehost: tuple[FakeHost, str], hosting: str, img: bytes
+) -> None:
+    _, address = fakehost
+    load_dotenv(dotenv_path="tests/data/.env.sample")
+    async with AsyncClient(transport=FakeHostTransport(address)) as client:
+        links = await BATCH_UPLOAD[hosting](client, [img, img, img])
+
+    assert [link.rsplit("/", 1)[-1].split(".")[0] for link in links] == [
+        "fake000001",
+        "fake000002",
+        "fake000003",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_fakehost_client(fakehost: tuple[FakeHost, str], img: bytes) -> None:
+    """Test that the clients send the requests to the fake host through its transport."""
+    server, address = fakehost
+    async with make_client(RATE_LIMITS["catbox"], transport=FakeHostTransport(address)) as client:
+        assert await UPLOAD["catbox"](client, img) == "https://files.catbox.moe/fake000001.png"
+    assert server.stats["requests"] == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fakehost", [Faults(throttle_rate=1.0, retry_after=0.25)], indirect=True)
+async def test_fakehost_throttle(fakehost: tuple[FakeHost, str]) -> None:
+    server, address = fakehost
+    async with AsyncClient(transport=FakeHostTransport(address)) as client:
+        response = await client.post("https://catbox.moe/user/api.php")
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "0.25"
+    assert server.stats["throttled"] == 1
+
+
+@pytest.mark.asyncio
+async def test_fakehost_error_burst(fakehost: tuple[FakeHost, str]) -> None:
+    """Test that a burst of server errors is retried through."""
+    server, address = fakehost
+    server.burst_left = 3
+    transport = RetryTransport(FakeHostTransport(address), retries=3, backoff=0.01)
+    async with AsyncClient(transport=transport) as client:
+        response = await client.post("https://catbox.moe/user/api.php")
+
+    assert response.status_code == 200
+    assert server.stats["errors"] == 3
+    assert server.stats["requests"] == 4
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fakehost", [Faults(slow_rate=1.0, slow_duration=0.2)], indirect=True)
+async def test_fakehost_slow_body(fakehost: tuple[FakeHost, str]) -> None:
+    _, address = fakehost
+    async with AsyncClient(transport=FakeHostTransport(address)) as client:
+        started = perf_counter()
+        response = await client.post("https://catbox.moe/user/api.php")
+
+    assert perf_counter() - started >= 0.2
+    assert response.text == "https://files.catbox.moe/fake000001.png"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fakehost", [Faults(reset_rate=1.0)], indirect=True)
+async def test_fakehost_reset(fakehost: tuple[FakeHost, str]) -> None:
+    server, address = fakehost
+    async with AsyncClient(transport=FakeHostTransport(address)) as client:
+        with pytest.raises(TRANSIENT_ERRORS):
+            await client.post("https://catbox.moe/user/api.php")
+    assert server.stats["resets"] == 1
+
+
+@pytest.mark.asyncio
+async def test_fakehost_not_found(fakehost: tuple[FakeHost, str]) -> None:
+    _, address = fakehost
+    async with AsyncClient(transport=FakeHostTransport(address)) as client:
+        response = await client.post("https://example.com/upload")
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fakehost", [Faults(error_rate=1.0, error_burst=2)], indirect=True)
+async def test_fakehost_error_rate(fakehost: tuple[FakeHost, str]) -> None:
+    server, address = fakehost
+    async with AsyncClient(transport=FakeHostTransport(address)) as client:
+        for _ in range(3):
+            assert (await client.post("https://catbox.moe/user/api.php")).status_code == 503
+    assert server.stats["errors"] == 3
@@ -1,10 +1,32 @@
+import json
 from io import BytesIO
+from pathlib import Path
 
 import pytest
-from PIL import Image, ImageFont
+from logot import Logot, logged
+from PIL import ExifTags, Image, ImageDraw, ImageFont, PngImagePlugin
+from PIL.JpegImagePlugin import JpegImageFile
 from pytest_mock import MockerFixture
 
-from images_upload_cli.image import get_font, get_img_ext, make_thumbnail, search_font
+import images_upload_cli.image
+from images_upload_cli.image import (
+    HEADER_SIZE,
+    ImageInfo,
+    Transform,
+    get_font,
+    get_img_ext,
+    get_img_info,
+    init_thumbnail_worker,
+    iter_images,
+    load_font,
+    make_thumbnail,
+    make_thumbnail_in_worker,
+    search_font,
+    sniff_image,
+    strip_metadata,
+    transform_image,
+    transform_image_in_worker,
+)
 from images_upload_cli.util import GetEnvError
 
 
@@ -32,10 +54,105 @@ def test_make_thumbnail(font_name: str):
     assert thumbnail_image.format == "JPEG"
 
 
+def test_make_thumbnail_draft(font_name: str, mocker: MockerFixture) -> None:
+    image = Image.new("RGB", (4000, 3000))
+    image_bytes = BytesIO()
+    image.save(image_bytes, format="JPEG")
+    font = ImageFont.truetype(font_name, size=12)
+
+    spy_draft = mocker.spy(JpegImageFile, "draft")
+    spy_copy = mocker.spy(Image.Image, "copy")
+    spy_text = mocker.spy(ImageDraw.ImageDraw, "text")
+
+    thumbnail = make_thumbnail(image_bytes.getvalue(), font, size=(300, 300))
+
+    thumbnail_image = Image.open(BytesIO(thumbnail))
+    assert thumbnail_image.size == (300, 225 + 16)
+    # The JPEG is decoded at a reduced scale and the full-size frame is never copied.
+    assert spy_draft.spy_return_list[0] is not None
+    spy_copy.assert_not_called()
+    # The caption describes the source image.
+    assert spy_text.call_args.kwargs["text"].startswith("4000x3000 (JPEG)")
+
+
 def test_get_img_ext(img: bytes) -> None:
     assert get_img_ext(img) == "png"
 
 
+def test_get_img_ext_file() -> None:
+    with Path("tests/data/pic.png").open("rb") as f:
+        f.seek(10)
+        assert get_img_ext(f) == "png"
+        # The position of the file is preserved.
+        assert f.tell() == 10
+
+
+def make_image(fmt: str, mode: str = "RGB", **params: object) -> bytes:
+    buffer = BytesIO()
+    Image.new(mode, (123, 45)).save(buffer, format=fmt, **params)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize(
+    ("img", "expected"),
+    [
+        pytest.param(make_image("PNG"), "png", id="png"),
+        pytest.param(make_image("JPEG"), "jpeg", id="jpeg"),
+        pytest.param(
+            make_image("JPEG", exif=b"Exif\x00\x00" + bytes(1000)), "jpeg", id="jpeg-exif"
+        ),
+        pytest.param(make_image("JPEG", progressive=True), "jpeg", id="jpeg-progressive"),
+        pytest.param(make_image("GIF"), "gif", id="gif"),
+        pytest.param(make_image("WEBP"), "webp", id="webp"),
+        pytest.param(make_image("WEBP", lossless=True), "webp", id="webp-lossless"),
+        pytest.param(make_image("WEBP", "RGBA"), "webp", id="webp-extended"),
+        pytest.param(make_image("BMP"), "bmp", id="bmp"),
+    ],
+)
+def test_sniff_image(img: bytes, expected: str) -> None:
+    with Image.open(BytesIO(img)) as im:
+        mime = Image.MIME[im.format or ""]
+        assert sniff_image(img[:HEADER_SIZE]) == ImageInfo(expected, mime, *im.size)
+
+
+@pytest.mark.parametrize(
+    "header",
+    [
+        pytest.param(b"", id="empty"),
+        pytest.param(b"not an image", id="unknown"),
+        pytest.param(make_image("JPEG")[:100], id="truncated"),
+        pytest.param(make_image("PNG")[:16], id="truncated-png"),
+        pytest.param(make_image("PNG")[:20], id="truncated-png-ihdr"),
+        pytest.param(make_image("GIF")[:8], id="truncated-gif"),
+        pytest.param(make_image("WEBP")[:28], id="truncated-webp"),
+        pytest.param(make_image("WEBP", lossless=True)[:23], id="truncated-webp-lossless"),
+        pytest.param(make_image("WEBP", "RGBA")[:28], id="truncated-webp-extended"),
+        pytest.param(make_image("BMP")[:16], id="truncated-bmp"),
+        pytest.param(make_image("BMP")[:22], id="truncated-bmp-dimensions"),
+    ],
+)
+def test_sniff_image_unknown(header: bytes) -> None:
+    assert sniff_image(header) is None
+
+
+def test_get_img_info(img: bytes, mocker: MockerFixture) -> None:
+    mock_open = mocker.patch("PIL.Image.open")
+    assert get_img_info(img) == ImageInfo("png", "image/png", 100, 100)
+    # The header is enough to identify the image.
+    mock_open.assert_not_called()
+
+
+def test_get_img_info_fallback() -> None:
+    img = make_image("TIFF")
+    assert get_img_info(img) == ImageInfo("tiff", "image/tiff", 123, 45)
+
+    with BytesIO(img) as f:
+        f.seek(10)
+        assert get_img_info(f) == ImageInfo("tiff", "image/tiff", 123, 45)
+        # The position of the file is preserved.
+        assert f.tell() == 10
+
+
 def test_get_font() -> None:
     font = get_font()
     assert isinstance(font, ImageFont.FreeTypeFont)
@@ -68,3 +185,248 @@ def test_search_font_not_found():
     fonts = ["NonExistentFont1", "NonExistentFont2"]
     with pytest.raises(GetEnvError):
         search_font(fonts)
+
+
+def test_search_font_index(font_name: str, font_index_path: Path, mocker: MockerFixture) -> None:
+    fonts = ["NonExistentFont", font_name]
+    search_font(fonts)
+
+    # The resolved path is stored in the index.
+    index = json.loads(font_index_path.read_text())
+    assert index == {",".join(fonts): str(Path(font_name).resolve())}
+
+    # The next search loads the indexed font directly.
+    spy_load_font = mocker.spy(images_upload_cli.image, "load_font")
+    font = search_font(fonts, size=20)
+    spy_load_font.assert_called_once_with(str(Path(font_name).resolve()), 20)
+    assert font.size == 20
+
+
+def test_search_font_index_invalidated(
+    font_name: str,
+    font_index_path: Path,
+    tmp_path: Path,
+) -> None:
+    fonts = ["NonExistentFont", font_name]
+    # The indexed font file doesn't exist anymore.
+    font_index_path.write_text(json.dumps({",".join(fonts): str(tmp_path / "removed.ttf")}))
+
+    font = search_font(fonts)
+    assert font.path == font_name
+    assert json.loads(font_index_path.read_text()) == {
+        ",".join(fonts): str(Path(font_name).resolve())
+    }
+
+
+def test_search_font_index_corrupted(font_name: str, font_index_path: Path) -> None:
+    font_index_path.write_text("not json")
+
+    font = search_font([font_name])
+    assert font.path == font_name
+
+
+def test_load_font(font_name: str) -> None:
+    # The fonts are memoized per size.
+    assert load_font(font_name, 12) is load_font(font_name, 12)
+    assert load_font(font_name, 12) is not load_font(font_name, 16)
+
+
+def test_make_thumbnail_in_worker(font_name: str):
+    font = ImageFont.truetype(font_name, size=12)
+    init_thumbnail_worker(font)
+
+    thumbnail = make_thumbnail_in_worker(Path("tests/data/pic.png"), size=(50, 50))
+
+    thumbnail_image = Image.open(BytesIO(thumbnail))
+    assert thumbnail_image.size == (50, 50 + 16)
+    assert thumbnail_image.format == "JPEG"
+
+
+def test_transform_image_unchanged() -> None:
+    img = make_image("PNG")
+
+    # The image within the limits is uploaded as is.
+    assert transform_image(img, Transform(max_dimension=123, max_bytes=len(img))) is img
+
+
+def test_transform_image_max_dimension() -> None:
+    img = make_image("PNG")
+
+    with Image.open(BytesIO(transform_image(img, Transform(max_dimension=41)))) as im:
+        assert im.size == (41, 15)
+        assert im.format == "PNG"
+
+
+@pytest.mark.parametrize("fmt", ["avif", "jpeg", "webp"])
+def test_transform_image_recompress(fmt: str) -> None:
+    img = make_image("PNG", mode="RGBA")
+
+    transformed = transform_image(img, Transform(format=fmt, quality=50))
+
+    with Image.open(BytesIO(transformed)) as im:
+        assert im.size == (123, 45)
+        assert im.format == fmt.upper()
+
+
+def test_transform_image_max_bytes(tmp_path: Path) -> None:
+    img_path = tmp_path / "noise.png"
+    Image.effect_noise((1000, 1000), sigma=100).save(img_path)
+    max_bytes = 100_000
+
+    transformed = transform_image_in_worker(img_path, Transform(max_bytes=max_bytes))
+
+    # The quality of PNG can't be lowered, so the image is downscaled until it fits.
+    assert len(transformed) <= max_bytes
+    with Image.open(BytesIO(transformed)) as im:
+        assert im.format == "PNG"
+        assert im.width < 1000
+
+
+def test_transform_image_exif_orientation() -> None:
+    exif = Image.Exif()
+    # Rotated 90 degrees clockwise.
+    exif[ExifTags.Base.Orientation] = 6
+    img = make_image("JPEG", exif=exif)
+
+    transformed = transform_image(img, Transform(max_dimension=90))
+
+    # The orientation is applied to the pixels and removed from the metadata.
+    with Image.open(BytesIO(transformed)) as im:
+        assert im.size == (33, 90)
+        assert ExifTags.Base.Orientation not in im.getexif()
+
+
+def test_transform_image_animated() -> None:
+    frames = [Image.new("RGB", (123, 45), color) for color in ("red", "blue")]
+    buffer = BytesIO()
+    frames[0].save(buffer, format="GIF", save_all=True, append_images=frames[1:])
+    img = buffer.getvalue()
+
+    assert transform_image(img, Transform(max_dimension=10, format="webp")) is img
+
+
+def test_transform_image_mpo() -> None:
+    """Test that the MPO photos, JPEG images with extra frames, are not mistaken for animations."""
+    frames = [Image.new("RGB", (1200, 800), color) for color in ("red", "blue")]
+    buffer = BytesIO()
+    frames[0].save(buffer, format="MPO", save_all=True, append_images=frames[1:])
+
+    transformed = transform_image(buffer.getvalue(), Transform(max_dimension=600))
+
+    with Image.open(BytesIO(transformed)) as im:
+        assert im.size == (600, 400)
+        assert im.format == "JPEG"
+        assert im.getpixel((0, 0)) == pytest.approx((254, 0, 0), abs=2)
+
+
+@pytest.mark.parametrize("progressive", [False, True])
+@pytest.mark.parametrize("orientation", [1, 6])
+def test_strip_metadata_jpeg(progressive: bool, orientation: int) -> None:
+    exif = Image.Exif()
+    exif[ExifTags.Base.Orientation] = orientation
+    exif[ExifTags.Base.Make] = "Camera" * 100
+    source = Image.effect_noise((64, 48), sigma=50).convert("RGB")
+    buffer = BytesIO()
+    source.save(
+        buffer,
+        format="JPEG",
+        progressive=progressive,
+        exif=exif,
+        comment=b"comment",
+        icc_profile=b"profile",
+    )
+    img = buffer.getvalue() + b"preview"
+
+    stripped = strip_metadata(img)
+
+    assert len(stripped) < len(img)
+    assert stripped.endswith(b"\xff\xd9")
+    with Image.open(BytesIO(img)) as im, Image.open(BytesIO(stripped)) as stripped_im:
+        # The pixels are not re-encoded.
+        assert stripped_im.tobytes() == im.tobytes()
+        assert stripped_im.info["icc_profile"] == b"profile"
+        assert "comment" not in stripped_im.info
+        # Only the orientation is kept from the EXIF data.
+        assert dict(stripped_im.getexif()) == (
+            {} if orientation == 1 else {ExifTags.Base.Orientation: orientation}
+        )
+
+
+def test_strip_metadata_png() -> None:
+    pnginfo = PngImagePlugin.PngInfo()
+    pnginfo.add_text("comment", "text" * 100)
+    buffer = BytesIO()
+    Image.new("P", (123, 45)).save(buffer, format="PNG", pnginfo=pnginfo, transparency=0)
+    img = buffer.getvalue()
+
+    stripped = strip_metadata(img)
+
+    assert len(stripped) < len(img)
+    with Image.open(BytesIO(img)) as im, Image.open(BytesIO(stripped)) as stripped_im:
+        assert stripped_im.tobytes() == im.tobytes()
+        assert "comment" not in stripped_im.info
+        # The transparency is not metadata.
+        assert stripped_im.info["transparency"] == 0
+
+
+@pytest.mark.parametrize(
+    "img",
+    [
+        pytest.param(make_image("GIF"), id="gif"),
+        pytest.param(make_image("JPEG")[:100], id="truncated-jpeg"),
+        pytest.param(b"\xff\xd8\xff\xe0\x00\x10JFIF\x00garbage", id="malformed-jpeg"),
+    ],
+)
+def test_strip_metadata_unchanged(img: bytes) -> None:
+    assert strip_metadata(img) is img
+
+
+def test_transform_image_strip_metadata() -> None:
+    exif = Image.Exif()
+    exif[ExifTags.Base.Make] = "Camera" * 1000
+    img = make_image("JPEG", exif=exif)
+
+    # Removing the metadata is enough to fit the budget, so the image is not re-encoded.
+    transformed = transform_image(img, Transform(max_bytes=len(img) // 2, strip_metadata=True))
+
+    assert transformed == strip_metadata(img)
+
+
+@pytest.fixture
+def image_tree(tmp_path: Path) -> Path:
+    png = make_image("PNG")
+    for name in ("b/2.png", "b/1.JPG", "a/c/3.webp", "a/4", "a/notes.txt", "a/blob", "0.gif"):
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"text" if name.endswith(("txt", "blob")) else png)
+    return tmp_path
+
+
+def test_iter_images_directory(image_tree: Path) -> None:
+    img_paths = iter_images([image_tree])
+
+    # The tree is walked in sorted order, the files without an extension are identified by their header.
+    assert [path.relative_to(image_tree).as_posix() for path in img_paths] == [
+        "0.gif",
+        "a/4",
+        "a/c/3.webp",
+        "b/1.JPG",
+        "b/2.png",
+    ]
+
+
+def test_iter_images_glob(image_tree: Path) -> None:
+    img_paths = iter_images([image_tree / "**" / "*.png", image_tree / "a" / "*"])
+
+    assert sorted(path.relative_to(image_tree).as_posix() for path in img_paths) == [
+        "a/4",
+        "b/2.png",
+    ]
+
+
+def test_iter_images_files(image_tree: Path, logot: Logot) -> None:
+    img_paths = iter_images([image_tree / "a" / "notes.txt", image_tree / "*.jpg"])
+
+    # The files are taken as is, the patterns without images are reported.
+    assert list(img_paths) == [image_tree / "a" / "notes.txt"]
+    logot.assert_logged(logged.warning(f"No images found in '{image_tree / '*.jpg'}'."))
@@ -0,0 +1,15 @@
+import pytest
+
+import images_upload_cli
+from images_upload_cli import image, main, upload
+
+
+def test_lazy_exports() -> None:
+    assert images_upload_cli.image is image
+    assert images_upload_cli.upload_images is main.upload_images
+    assert images_upload_cli.UPLOAD is upload.UPLOAD
+
+
+def test_lazy_exports_unknown() -> None:
+    with pytest.raises(AttributeError):
+        _ = images_upload_cli.unknown
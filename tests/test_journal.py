@@ -0,0 +1,149 @@
+import threading
+from contextlib import closing
+from pathlib import Path
+
+import pytest
+
+from images_upload_cli.journal import UploadJournal, read_journal
+from images_upload_cli.main import UploadRecord
+
+
+def record(img_path: Path, hosting: str = "imgur", thumb: str | None = None) -> UploadRecord:
+    return UploadRecord(
+        img_path, hosting, url=f"https://{hosting}.com/{img_path.name}", thumbnail_url=thumb
+    )
+
+
+@pytest.mark.asyncio
+async def test_journal_resume(tmp_path: Path) -> None:
+    journal_path = tmp_path / "journal.jsonl"
+    images = [tmp_path / f"{i}.png" for i in range(4)]
+
+    with closing(UploadJournal(journal_path)) as journal:
+        assert [img_path async for img_path in journal.skip(images)] == images
+        journal.write(record(images[2]))
+        journal.write(record(images[0]))
+        # The failed uploads are not journaled.
+        journal.write(UploadRecord(images[1], "imgur", error="Failed."))
+
+    handed_over: list[UploadRecord] = []
+    with closing(
+        UploadJournal(journal_path, resume=True, hostings=("imgur",), on_upload=handed_over.append)
+    ) as journal:
+        assert [img_path async for img_path in journal.skip(images)] == [images[1], images[3]]
+        journal.write(record(images[3]))
+
+        assert journal.links() == [(f"https://imgur.com/{i}.png", None) for i in (0, 2, 3)]
+    assert [item.path for item in handed_over] == [images[0], images[2], images[3]]
+    assert handed_over[0].cached
+
+
+@pytest.mark.asyncio
+async def test_journal_stream(tmp_path: Path) -> None:
+    """Test that a streaming journal writes the entries without keeping the links in memory."""
+    journal_path = tmp_path / "journal.jsonl"
+    images = [tmp_path / f"{i}.png" for i in range(3)]
+    with closing(UploadJournal(journal_path)) as journal:
+        journal.write(record(images[0]))
+
+    handed_over: list[UploadRecord] = []
+    with closing(
+        UploadJournal(
+            journal_path,
+            resume=True,
+            hostings=("imgur",),
+            on_upload=handed_over.append,
+            collect=False,
+        )
+    ) as journal:
+        assert [img_path async for img_path in journal.skip(images)] == images[1:]
+        journal.write(record(images[2]))
+
+        # Only the journaled images not seen yet are kept.
+        assert not journal.entries
+        assert not journal.order
+        assert not journal.links_by_path
+        assert journal.links() == []
+
+    assert [item.path for item in handed_over] == [images[0], images[2]]
+    assert read_journal(journal_path, ("imgur",), thumbnail=False).keys() == {
+        str(images[i].absolute()) for i in (0, 2)
+    }
+
+
+@pytest.mark.asyncio
+async def test_journal_without_resume(tmp_path: Path) -> None:
+    journal_path = tmp_path / "journal.jsonl"
+    img_path = tmp_path / "pic.png"
+    with closing(UploadJournal(journal_path)) as journal:
+        journal.write(record(img_path))
+
+    with closing(UploadJournal(journal_path, hostings=("imgur",))) as journal:
+        assert [img_path async for img_path in journal.skip([img_path])] == [img_path]
+
+
+def test_journal_truncated_entry(tmp_path: Path) -> None:
+    """Test that an entry truncated by a killed run is skipped and doesn't corrupt the next one."""
+    journal_path = tmp_path / "journal.jsonl"
+    images = [tmp_path / "0.png", tmp_path / "1.png"]
+    with closing(UploadJournal(journal_path)) as journal:
+        journal.write(record(images[0]))
+    journal_path.write_bytes(journal_path.read_bytes() + b'{"path": "/trunc')
+
+    with closing(UploadJournal(journal_path)) as journal:
+        journal.write(record(images[1]))
+
+    assert read_journal(journal_path, ("imgur",), thumbnail=False).keys() == {
+        str(img_path.absolute()) for img_path in images
+    }
+
+
+@pytest.mark.asyncio
+async def test_journal_skip_hands_over_in_event_loop(tmp_path: Path) -> None:
+    """Test that the records of the journaled images are handed over in the event loop."""
+    journal_path = tmp_path / "journal.jsonl"
+    img_path = tmp_path / "0.png"
+    with closing(UploadJournal(journal_path)) as journal:
+        journal.write(record(img_path))
+
+    threads: list[threading.Thread] = []
+    with closing(
+        UploadJournal(
+            journal_path,
+            resume=True,
+            hostings=("imgur",),
+            on_upload=lambda _: threads.append(threading.current_thread()),
+        )
+    ) as journal:
+        assert [path async for path in journal.skip(iter([img_path]))] == []
+
+    assert threads == [threading.main_thread()]
+
+
+def test_read_journal_malformed(tmp_path: Path) -> None:
+    """Test that the entries that are not objects with the expected keys are skipped."""
+    journal_path = tmp_path / "journal.jsonl"
+    img_path = tmp_path / "0.png"
+    with closing(UploadJournal(journal_path)) as journal:
+        journal.write(record(img_path))
+    with journal_path.open("a") as f:
+        f.write('[1, 2]\n"entry"\n42\n{"path": "/missing/keys.png"}\n')
+
+    assert read_journal(journal_path, ("imgur",), thumbnail=False).keys() == {
+        str(img_path.absolute())
+    }
+
+
+def test_read_journal_filter(tmp_path: Path) -> None:
+    """Test that the entries of the other hostings and thumbnail settings are not reused."""
+    journal_path = tmp_path / "journal.jsonl"
+    images = [tmp_path / f"{i}.png" for i in range(3)]
+    with closing(UploadJournal(journal_path)) as journal:
+        journal.write(record(images[0], "catbox"))
+        journal.write(record(images[1], "imgur", thumb="https://imgur.com/thumb.png"))
+        journal.write(record(images[2], "imgur"))
+
+    assert read_journal(journal_path, ("imgur",), thumbnail=False) == {
+        str(images[2].absolute()): ("imgur", "https://imgur.com/2.png", None)
+    }
+    assert read_journal(tmp_path / "missing.jsonl", ("imgur",), thumbnail=False) == {}
@@ -1,8 +1,10 @@
+import asyncio
 import logging
 
+import pytest
 from loguru import logger
 
-from images_upload_cli.logger import ErrorHandler, setup_logger
+from images_upload_cli.logger import ErrorHandler, capture_errors, setup_logger
 
 
 def test_errorhandler_emit():
@@ -23,9 +25,47 @@ def test_errorhandler_emit_no_error():
     assert handler.has_error_occurred() is False
 
 
+def test_errorhandler_emit_recoverable():
+    handler = ErrorHandler()
+    record = logging.LogRecord(
+        "test", logging.ERROR, "test_logger.py", 10, "Error message", None, None
+    )
+    record.extra = {"recoverable": True}
+    handler.emit(record)
+    assert handler.has_error_occurred() is False
+
+
+def test_setup_logger_recoverable():
+    error_handler = setup_logger("CRITICAL")
+
+    with logger.contextualize(recoverable=True):
+        logger.error("Recoverable error")
+    assert error_handler.has_error_occurred() is False
+
+    logger.error("Error")
+    assert error_handler.has_error_occurred() is True
+
+
 def test_setup_logger():
     log_level = "DEBUG"
     error_handler = setup_logger(log_level)
 
     assert isinstance(error_handler, ErrorHandler)
     assert logger.level(log_level).name == log_level
+
+
+@pytest.mark.asyncio
+async def test_capture_errors():
+    @logger.catch
+    async def fail() -> None:
+        msg = "Boom"
+        raise ValueError(msg)
+
+    logger.error("Before")
+    with capture_errors() as errors:
+        logger.warning("Warning")
+        logger.error("Error")
+        await asyncio.gather(fail())
+    logger.error("After")
+
+    assert errors == ["Error", "ValueError: Boom"]
@@ -1,11 +1,30 @@
+import asyncio
+import json
+from collections.abc import AsyncIterator, Callable, Iterator, Sequence
+from contextlib import closing
 from pathlib import Path
+from typing import BinaryIO
 
 import pytest
+from httpx import AsyncClient, Request, Response
+from logot import Logot, logged
 from pytest_httpx import HTTPXMock
+from pytest_mock import MockerFixture
 
-from images_upload_cli.main import format_link, upload_images
-from images_upload_cli.upload import UPLOAD
-from tests.mock import RESPONSE
+from images_upload_cli import main
+from images_upload_cli.cache import ThumbnailCache, UploadCache, derive_key, file_digest
+from images_upload_cli.image import THUMBNAIL_SIZE, THUMBNAIL_VERSION, Transform, get_font
+from images_upload_cli.main import (
+    UploadRecord,
+    format_link,
+    format_record,
+    share_futures,
+    upload_images,
+    upload_lazily,
+)
+from images_upload_cli.transport import RateLimit
+from images_upload_cli.upload import BATCH_UPLOAD, RATE_LIMITS, UPLOAD
+from tests.mock import BATCH_RESPONSE, RESPONSE
 
 
 @pytest.mark.asyncio
@@ -34,7 +53,7 @@ async def test_upload_images_coroutine(httpx_mock: HTTPXMock, thumbnail: bool) -
 
     # Upload the image
     result = await upload_images(
-        upload_func=UPLOAD[hosting],
+        hosting=hosting,
         images=images,
         thumbnail=thumbnail,
     )
@@ -50,26 +69,755 @@ async def test_upload_images_coroutine(httpx_mock: HTTPXMock, thumbnail: bool) -
     "thumbnail",
     [pytest.param(False, id="default"), pytest.param(True, id="thumbnail")],
 )
-async def test_upload_images_upload_failure(httpx_mock: HTTPXMock, thumbnail: bool) -> None:
+@pytest.mark.httpx_mock(can_send_already_matched_responses=True)
+async def test_upload_images_upload_failure(
+    httpx_mock: HTTPXMock,
+    mocker: MockerFixture,
+    thumbnail: bool,
+) -> None:
     """Test the upload_images coroutine when the upload fails for an image.
 
     Args:
         httpx_mock: An instance of the HTTPXMock class used for mocking HTTP responses.
+        mocker: An instance of MockerFixture used for mocking.
+        thumbnail: A boolean flag indicating whether to generate thumbnail images for the uploaded images.
     """
     images = (Path("tests/data/pic.png"),)
     hosting = "imgur"
+    retries = 2
 
     # Mock the response
     httpx_mock.add_response(text="Upload failed.", status_code=500)
+    # Skip the backoff delays.
+    mocker.patch("images_upload_cli.transport.uniform", return_value=0)
 
     # Upload the image
     result = await upload_images(
-        upload_func=UPLOAD[hosting],
+        hosting=hosting,
+        images=images,
+        thumbnail=thumbnail,
+        retries=retries,
+    )
+
+    assert result == []
+    # The server error is retried.
+    assert len(httpx_mock.get_requests()) == retries + 1
+
+
+@pytest.mark.asyncio
+async def test_upload_images_concurrency(tmp_path: Path, mocker: MockerFixture) -> None:
+    """Test that upload_images limits concurrency and preserves the order of the links.
+
+    Args:
+        tmp_path: A temporary directory for the test images.
+        mocker: An instance of MockerFixture used for mocking.
+    """
+    images = []
+    for i in range(6):
+        img_path = tmp_path / f"{i}.png"
+        img_path.write_bytes(str(i).encode())
+        images.append(img_path)
+
+    jobs = 2
+    in_flight = 0
+    max_in_flight = 0
+
+    async def upload_func(_client: AsyncClient, f: BinaryIO) -> str:
+        img = f.read()
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        # Later images finish first.
+        await asyncio.sleep(0.01 * (6 - int(img)))
+        in_flight -= 1
+        # Simulate a failed upload.
+        return "" if img == b"3" else f"https://example.com/{img.decode()}.png"
+
+    mocker.patch.dict(UPLOAD, {"test": upload_func})
+    mocker.patch.dict(RATE_LIMITS, {"test": RateLimit(rate=100, burst=100)})
+
+    result = await upload_images(
+        hosting="test",
+        images=tuple(images),
+        thumbnail=False,
+        jobs=jobs,
+    )
+
+    assert result == [(f"https://example.com/{i}.png", None) for i in (0, 1, 2, 4, 5)]
+    assert max_in_flight == jobs
+
+
+@pytest.mark.asyncio
+async def test_upload_images_failover_concurrency(mocker: MockerFixture) -> None:
+    """Test that a fallback hosting without a batch API gets the images of a batch within the jobs limit.
+
+    Args:
+        mocker: An instance of MockerFixture used for mocking.
+    """
+    images = (Path("tests/data/pic.png"),) * 6
+    jobs = 2
+    in_flight = 0
+    max_in_flight = 0
+
+    async def batch_func(_client: AsyncClient, imgs: Sequence[BinaryIO]) -> list[str]:
+        return [""] * len(imgs)
+
+    async def upload_func(_client: AsyncClient, _img: BinaryIO) -> str:
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return "https://example.com/pic.png"
+
+    mocker.patch.dict(UPLOAD, {"batch": upload_func, "single": upload_func})
+    mocker.patch.dict(BATCH_UPLOAD, {"batch": batch_func})
+    mocker.patch.dict(RATE_LIMITS, {name: RateLimit(rate=100, burst=100) for name in UPLOAD})
+
+    result = await upload_images(
+        hosting=("batch", "single"),
+        images=images,
+        thumbnail=False,
+        jobs=jobs,
+        batch_size=6,
+    )
+
+    assert result == [("https://example.com/pic.png", None)] * 6
+    assert max_in_flight == jobs
+
+
+@pytest.mark.asyncio
+async def test_upload_images_cache(httpx_mock: HTTPXMock, tmp_path: Path) -> None:
+    """Test that upload_images reuses the links of the cached images.
+
+    Args:
+        httpx_mock: An instance of the HTTPXMock class used for mocking HTTP responses.
+        tmp_path: A temporary directory for the cache.
+    """
+    images = (Path("tests/data/pic.png"),)
+    hosting = "imgur"
+    mock_link = RESPONSE[hosting][1]
+
+    # Only the first upload is expected to send a request.
+    httpx_mock.add_response(text=RESPONSE[hosting][0])
+
+    with closing(UploadCache(tmp_path / "cache.sqlite")) as cache:
+        for _ in range(2):
+            result = await upload_images(
+                hosting=hosting,
+                images=images,
+                thumbnail=False,
+                cache=cache,
+            )
+            assert result == [(mock_link, None)]
+
+    assert len(httpx_mock.get_requests()) == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "thumbnail",
+    [pytest.param(False, id="default"), pytest.param(True, id="thumbnail")],
+)
+async def test_upload_images_batch(
+    httpx_mock: HTTPXMock,
+    mocker: MockerFixture,
+    thumbnail: bool,
+) -> None:
+    """Test that upload_images sends several images per request to the hostings that accept them.
+
+    Args:
+        httpx_mock: An instance of the HTTPXMock class used for mocking HTTP responses.
+        mocker: An instance of MockerFixture used for mocking.
+        thumbnail: A boolean flag indicating whether to generate thumbnail images for the uploaded images.
+    """
+    images = (Path("tests/data/pic.png"),) * 3
+    hosting = "ptpimg"
+    mocker.patch.dict("os.environ", {"PTPIMG_KEY": "key"})
+    mock_links = [*BATCH_RESPONSE[hosting][1], RESPONSE[hosting][1]]
+
+    def respond(request: Request) -> Response:
+        if request.content.count(b"file-upload[") == 1:
+            return Response(200, text=RESPONSE[hosting][0])
+        return Response(200, text=BATCH_RESPONSE[hosting][0])
+
+    httpx_mock.add_callback(respond, is_reusable=True)
+
+    result = await upload_images(
+        hosting=hosting,
         images=images,
         thumbnail=thumbnail,
+        jobs=1,
+        batch_size=2,
+    )
+
+    if thumbnail:
+        assert result == list(zip(mock_links, mock_links, strict=True))
+    else:
+        assert result == [(link, None) for link in mock_links]
+    # The images are sent in batches of two, followed by their thumbnails.
+    assert len(httpx_mock.get_requests()) == (4 if thumbnail else 2)
+
+
+@pytest.mark.asyncio
+async def test_upload_images_batch_mismatch(httpx_mock: HTTPXMock, mocker: MockerFixture) -> None:
+    """Test that a batch is failed if the links can't be mapped back to the images.
+
+    Args:
+        httpx_mock: An instance of the HTTPXMock class used for mocking HTTP responses.
+        mocker: An instance of MockerFixture used for mocking.
+    """
+    images = (Path("tests/data/pic.png"),) * 3
+    hosting = "ptpimg"
+    mocker.patch.dict("os.environ", {"PTPIMG_KEY": "key"})
+
+    # A single link for the three images.
+    httpx_mock.add_response(text=RESPONSE[hosting][0])
+
+    result = await upload_images(
+        hosting=hosting,
+        images=images,
+        thumbnail=False,
     )
 
     assert result == []
+    assert len(httpx_mock.get_requests()) == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "mirrors",
+    [pytest.param(False, id="default"), pytest.param(True, id="mirrors")],
+)
+async def test_upload_images_race(
+    mocker: MockerFixture,
+    logot: Logot,
+    mirrors: bool,
+) -> None:
+    """Test that upload_images keeps the link of the fastest hosting in race mode.
+
+    Args:
+        mocker: An instance of MockerFixture used for mocking.
+        logot: An instance of the Logot class used for logging.
+        mirrors: Whether to let the slower uploads finish.
+    """
+    images = (Path("tests/data/pic.png"),)
+    finished = []
+
+    def make_upload_func(name: str, delay: float, link: str) -> Callable:
+        async def upload_func(_client: AsyncClient, _img: BinaryIO) -> str:
+            await asyncio.sleep(delay)
+            finished.append(name)
+            return link
+
+        return upload_func
+
+    mocker.patch.dict(
+        UPLOAD,
+        {
+            "failed": make_upload_func("failed", 0, ""),
+            "fast": make_upload_func("fast", 0.01, "https://fast.com/pic.png"),
+            "slow": make_upload_func("slow", 0.05, "https://slow.com/pic.png"),
+        },
+    )
+    mocker.patch.dict(RATE_LIMITS, dict.fromkeys(("failed", "fast", "slow"), RateLimit(10, 10)))
+
+    result = await upload_images(
+        hosting="imgur",
+        images=images,
+        thumbnail=False,
+        race=("slow", "failed", "fast"),
+        mirrors=mirrors,
+    )
+
+    assert result == [("https://fast.com/pic.png", None)]
+    if mirrors:
+        assert finished == ["failed", "fast", "slow"]
+        await logot.await_for(logged.info("Mirror on 'slow': https://slow.com/pic.png"))
+    else:
+        # The slower upload is cancelled.
+        assert finished == ["failed", "fast"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.httpx_mock(can_send_already_matched_responses=True)
+async def test_upload_images_race_thumbnail(httpx_mock: HTTPXMock) -> None:
+    """Test that the racing uploads of an image upload its thumbnail to the same hosting.
+
+    Args:
+        httpx_mock: An instance of the HTTPXMock class used for mocking HTTP responses.
+    """
+    images = (Path("tests/data/pic.png"),)
+    mock_link = RESPONSE["catbox"][1]
+
+    httpx_mock.add_response(url="https://catbox.moe/user/api.php", text=RESPONSE["catbox"][0])
+    httpx_mock.add_response(url="https://api.imgur.com/3/image", status_code=400)
+
+    result = await upload_images(
+        hosting="imgur",
+        images=images,
+        thumbnail=True,
+        race=("imgur", "catbox"),
+    )
+
+    assert result == [(mock_link, mock_link)]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "thumbnail",
+    [pytest.param(False, id="default"), pytest.param(True, id="thumbnail")],
+)
+@pytest.mark.httpx_mock(can_send_already_matched_responses=True)
+async def test_upload_images_failover(
+    httpx_mock: HTTPXMock,
+    logot: Logot,
+    thumbnail: bool,
+) -> None:
+    """Test that the images failed to upload are uploaded to the next hosting of the chain.
+
+    Args:
+        httpx_mock: An instance of the HTTPXMock class used for mocking HTTP responses.
+        logot: An instance of the Logot class used for logging.
+        thumbnail: A boolean flag indicating whether to generate thumbnail images for the uploaded images.
+    """
+    images = (Path("tests/data/pic.png"),)
+    mock_link = RESPONSE["catbox"][1]
+
+    httpx_mock.add_response(url="https://api.imgur.com/3/image", status_code=400)
+    httpx_mock.add_response(url="https://catbox.moe/user/api.php", text=RESPONSE["catbox"][0])
+
+    result = await upload_images(
+        hosting=("imgur", "catbox", "imgbb"),
+        images=images,
+        thumbnail=thumbnail,
+    )
+
+    assert result == [(mock_link, mock_link if thumbnail else None)]
+    await logot.await_for(logged.warning("Falling back to 'catbox' for 'tests/data/pic.png'."))
+    # The last hosting of the chain is not needed.
+    assert not httpx_mock.get_requests(url="https://api.imgbb.com/1/upload")
+
+
+@pytest.mark.asyncio
+@pytest.mark.httpx_mock(can_send_already_matched_responses=True)
+async def test_upload_images_failover_failure(httpx_mock: HTTPXMock, logot: Logot) -> None:
+    """Test that upload_images logs the images failed to upload to all the hostings of the chain.
+
+    Args:
+        httpx_mock: An instance of the HTTPXMock class used for mocking HTTP responses.
+        logot: An instance of the Logot class used for logging.
+    """
+    images = (Path("tests/data/pic.png"),)
+
+    httpx_mock.add_response(status_code=400)
+
+    result = await upload_images(
+        hosting=("imgur", "catbox"),
+        images=images,
+        thumbnail=False,
+    )
+
+    assert result == []
+    await logot.await_for(
+        logged.error("Failed to upload 'tests/data/pic.png' to any of the hostings.")
+    )
+    assert len(httpx_mock.get_requests()) == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.httpx_mock(can_send_already_matched_responses=True)
+async def test_upload_images_thumbnail_cache(httpx_mock: HTTPXMock, tmp_path: Path) -> None:
+    """Test that upload_images reuses the cached thumbnails.
+
+    Args:
+        httpx_mock: An instance of the HTTPXMock class used for mocking HTTP responses.
+        tmp_path: A temporary directory for the cache.
+    """
+    images = (Path("tests/data/pic.png"),)
+    hosting = "imgur"
+    font = get_font()
+    key = derive_key(
+        file_digest(images[0]), THUMBNAIL_SIZE, font.path, font.size, THUMBNAIL_VERSION
+    )
+
+    httpx_mock.add_response(text=RESPONSE[hosting][0])
+
+    with closing(ThumbnailCache(tmp_path / "cache.sqlite")) as cache:
+        cache.set(key, b"cached thumbnail")
+        await upload_images(
+            hosting=hosting,
+            images=images,
+            thumbnail=True,
+            thumbnail_cache=cache,
+        )
+
+    # The cached thumbnail is uploaded.
+    assert b"cached thumbnail" in httpx_mock.get_requests()[1].content
+
+
+@pytest.mark.asyncio
+@pytest.mark.httpx_mock(can_send_already_matched_responses=True)
+async def test_upload_images_thumbnail_cache_miss(httpx_mock: HTTPXMock, tmp_path: Path) -> None:
+    """Test that upload_images caches the generated thumbnails.
+
+    Args:
+        httpx_mock: An instance of the HTTPXMock class used for mocking HTTP responses.
+        tmp_path: A temporary directory for the cache.
+    """
+    images = (Path("tests/data/pic.png"),)
+    hosting = "imgur"
+
+    httpx_mock.add_response(text=RESPONSE[hosting][0])
+
+    with closing(ThumbnailCache(tmp_path / "cache.sqlite")) as cache:
+        await upload_images(
+            hosting=hosting,
+            images=images,
+            thumbnail=True,
+            thumbnail_cache=cache,
+        )
+        (thumb,) = cache.db.execute("SELECT data FROM thumbnails").fetchone()
+
+    assert thumb in httpx_mock.get_requests()[1].content
+
+
+@pytest.mark.asyncio
+@pytest.mark.httpx_mock(can_send_already_matched_responses=True)
+async def test_upload_images_caches_share_digest(
+    httpx_mock: HTTPXMock, mocker: MockerFixture, tmp_path: Path
+) -> None:
+    """Test that the upload cache and the thumbnail cache share the content hash of an image.
+
+    Args:
+        httpx_mock: An instance of the HTTPXMock class used for mocking HTTP responses.
+        mocker: The pytest-mock fixture.
+        tmp_path: A temporary directory for the caches.
+    """
+    images = (Path("tests/data/pic.png"),)
+    hosting = "imgur"
+    spy = mocker.spy(main, "file_digest")
+
+    httpx_mock.add_response(text=RESPONSE[hosting][0])
+
+    with (
+        closing(UploadCache(tmp_path / "cache.sqlite")) as cache,
+        closing(ThumbnailCache(tmp_path / "cache.sqlite")) as thumbnail_cache,
+    ):
+        await upload_images(
+            hosting=hosting,
+            images=images,
+            thumbnail=True,
+            cache=cache,
+            thumbnail_cache=thumbnail_cache,
+        )
+
+    # The image is read once for both caches.
+    spy.assert_called_once_with(images[0])
+
+
+@pytest.mark.asyncio
+@pytest.mark.httpx_mock(can_send_already_matched_responses=True)
+async def test_upload_images_transform(httpx_mock: HTTPXMock, tmp_path: Path) -> None:
+    """Test that upload_images uploads the transformed images and caches them apart from the originals.
+
+    Args:
+        httpx_mock: An instance of the HTTPXMock class used for mocking HTTP responses.
+        tmp_path: A temporary directory for the cache.
+    """
+    images = (Path("tests/data/pic.png"),)
+    hosting = "imgur"
+    transform = Transform(max_dimension=10, format="webp")
+    httpx_mock.add_response(text=RESPONSE[hosting][0])
+
+    with closing(UploadCache(tmp_path / "cache.sqlite")) as cache:
+        for item in (None, transform, transform):
+            result = await upload_images(
+                hosting=hosting,
+                images=images,
+                thumbnail=False,
+                cache=cache,
+                transform=item,
+            )
+            assert result == [(RESPONSE[hosting][1], None)]
+
+    # The original and the transformed image are uploaded once each.
+    requests = httpx_mock.get_requests()
+    assert len(requests) == 2
+    assert b"WEBP" not in requests[0].content
+    assert b"WEBP" in requests[1].content
+
+
+@pytest.mark.asyncio
+@pytest.mark.httpx_mock(can_send_already_matched_responses=True)
+async def test_upload_images_on_upload(httpx_mock: HTTPXMock) -> None:
+    """Test that upload_images hands over the records as they are uploaded instead of collecting the links.
+
+    Args:
+        httpx_mock: An instance of the HTTPXMock class used for mocking HTTP responses.
+    """
+    images = (Path("tests/data/pic.png"), Path("tests/data/pic.png"))
+    hosting = "imgur"
+    httpx_mock.add_response(text=RESPONSE[hosting][0])
+    uploaded: list[UploadRecord] = []
+
+    result = await upload_images(
+        hosting=hosting,
+        images=iter(images),
+        thumbnail=False,
+        on_upload=uploaded.append,
+    )
+
+    assert result == []
+    assert [(record.path, record.links) for record in uploaded] == [
+        (img_path, (RESPONSE[hosting][1], None)) for img_path in images
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.httpx_mock(can_send_already_matched_responses=True)
+async def test_upload_images_records(httpx_mock: HTTPXMock) -> None:
+    """Test that the records carry the sizes and the timings of the uploads.
+
+    Args:
+        httpx_mock: An instance of the HTTPXMock class used for mocking HTTP responses.
+    """
+    img_path = Path("tests/data/pic.png")
+    hosting = "imgur"
+    httpx_mock.add_response(text=RESPONSE[hosting][0])
+    records: list[UploadRecord] = []
+
+    await upload_images(
+        hosting=hosting, images=[img_path], thumbnail=True, on_upload=records.append
+    )
+
+    (record,) = records
+    assert record.links == (RESPONSE[hosting][1], RESPONSE[hosting][1])
+    assert record.hosting == hosting
+    assert record.format == "png"
+    assert record.size == (await asyncio.to_thread(img_path.stat)).st_size
+    assert record.thumbnail_size
+    assert record.timings.keys() == {"read", "sniff", "thumbnail", "http", "thumbnail_http"}
+    assert record.error is None
+
+
+@pytest.mark.asyncio
+async def test_upload_images_records_failure(httpx_mock: HTTPXMock) -> None:
+    """Test that the records of the failed uploads carry the reason of the failure.
+
+    Args:
+        httpx_mock: An instance of the HTTPXMock class used for mocking HTTP responses.
+    """
+    hosting = "imgur"
+    httpx_mock.add_response(status_code=403)
+    records: list[UploadRecord] = []
+
+    result = await upload_images(
+        hosting=hosting,
+        images=[Path("tests/data/pic.png")],
+        thumbnail=False,
+        retries=0,
+        on_upload=records.append,
+    )
+
+    assert result == []
+    (record,) = records
+    assert record.links is None
+    assert record.error == "Client error '403 Forbidden' for url 'https://api.imgur.com/3/image'."
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("content", "thumbnail", "transform", "error"),
+    [
+        pytest.param(None, False, None, "FileNotFoundError", id="missing"),
+        pytest.param(b"corrupt", True, None, "UnidentifiedImageError", id="thumbnail"),
+        pytest.param(
+            b"corrupt",
+            False,
+            Transform(max_dimension=10),
+            "UnidentifiedImageError",
+            id="transform",
+        ),
+    ],
+)
+@pytest.mark.httpx_mock(can_send_already_matched_responses=True)
+async def test_upload_images_bad_image(
+    httpx_mock: HTTPXMock,
+    *,
+    mocker: MockerFixture,
+    tmp_path: Path,
+    content: bytes | None,
+    thumbnail: bool,
+    transform: Transform | None,
+    error: str,
+) -> None:
+    """Test that an image that can't be read or processed fails alone, not the rest of its batch.
+
+    Args:
+        httpx_mock: An instance of the HTTPXMock class used for mocking HTTP responses.
+        mocker: An instance of MockerFixture used for mocking.
+        tmp_path: A temporary directory for the bad image.
+        content: The content of the bad image, or `None` for a missing file.
+        thumbnail: Whether to generate the thumbnails.
+        transform: The transformation applied to the images.
+        error: The type of the error of the bad image.
+    """
+    bad_path = tmp_path / "bad.png"
+    if content is not None:
+        bad_path.write_bytes(content)
+    img_path = Path("tests/data/pic.png")
+    hosting = "ptpimg"
+    mocker.patch.dict("os.environ", {"PTPIMG_KEY": "key"})
+
+    def respond(request: Request) -> Response:
+        if request.content.count(b"file-upload[") == 1:
+            return Response(200, text=RESPONSE[hosting][0])
+        return Response(200, text=BATCH_RESPONSE[hosting][0])
+
+    httpx_mock.add_callback(respond, is_reusable=True)
+    records: list[UploadRecord] = []
+
+    await upload_images(
+        hosting=hosting,
+        images=[img_path, bad_path, img_path],
+        thumbnail=thumbnail,
+        batch_size=2,
+        transform=transform,
+        on_upload=records.append,
+    )
+
+    # The bad image is left out of its batch, the other images are uploaded.
+    (bad_record,) = (record for record in records if record.path == bad_path)
+    assert bad_record.links is None
+    assert bad_record.error is not None
+    assert bad_record.error.startswith(error)
+    good_records = [record for record in records if record.path == img_path]
+    assert len(good_records) == 2
+    assert all(record.links is not None for record in good_records)
+
+
+@pytest.mark.asyncio
+async def test_upload_images_truncated_image(
+    httpx_mock: HTTPXMock, mocker: MockerFixture, tmp_path: Path, img: bytes
+) -> None:
+    """Test that an image with a truncated header fails alone, not the whole run.
+
+    Args:
+        httpx_mock: An instance of the HTTPXMock class used for mocking HTTP responses.
+        mocker: An instance of MockerFixture used for mocking.
+        tmp_path: A temporary directory for the truncated image.
+        img: The content of the valid image.
+    """
+    truncated_path = tmp_path / "truncated.png"
+    truncated_path.write_bytes(img[:16])
+    img_path = Path("tests/data/pic.png")
+    hosting = "vgy"
+    mocker.patch.dict("os.environ", {"VGY_KEY": "key"})
+
+    httpx_mock.add_response(text=RESPONSE[hosting][0])
+    records: list[UploadRecord] = []
+
+    await upload_images(
+        hosting=hosting,
+        images=[img_path, truncated_path],
+        thumbnail=False,
+        on_upload=records.append,
+    )
+
+    (truncated_record,) = (record for record in records if record.path == truncated_path)
+    assert truncated_record.links is None
+    assert truncated_record.error is not None
+    (img_record,) = (record for record in records if record.path == img_path)
+    assert img_record.links == (RESPONSE[hosting][1], None)
+
+
+@pytest.mark.asyncio
+async def test_upload_lazily() -> None:
+    """Test that the images are uploaded while they are being enumerated, in bounded batches."""
+    enumerated: list[Path] = []
+    started: list[int] = []
+    running: list[Sequence[Path]] = []
+    max_running = 0
+
+    def enumerate_images() -> Iterator[Path]:
+        for i in range(200):
+            img_path = Path(f"{i}.png")
+            enumerated.append(img_path)
+            yield img_path
+
+    async def upload(img_paths: Sequence[Path]) -> list[UploadRecord]:
+        nonlocal max_running
+        started.append(len(enumerated))
+        running.append(img_paths)
+        max_running = max(max_running, len(running))
+        await asyncio.sleep(0.001)
+        running.remove(img_paths)
+        return [
+            UploadRecord(img_path, "test", url=str(img_path) if img_path.stem != "7" else None)
+            for img_path in img_paths
+        ]
+
+    batches = [
+        batch
+        async for batch in upload_lazily(upload, enumerate_images(), batch_size=3, max_pending=2)
+    ]
+
+    # The batches keep their position in the enumeration.
+    assert sorted(start for start, _ in batches) == list(range(0, 200, 3))
+    for start, records in batches:
+        assert [record.path for record in records] == enumerated[start : start + 3]
+        assert [record.links for record in records] == [
+            (str(record.path), None) if record.path.stem != "7" else None for record in records
+        ]
+    # The first upload starts before the enumeration is done, the batches in flight are bounded.
+    assert started[0] < len(enumerated)
+    assert max_running == 2
+
+
+@pytest.mark.asyncio
+async def test_upload_lazily_async_iterable() -> None:
+    """Test that the images of an async iterable are uploaded as soon as each is yielded."""
+    uploaded: list[Sequence[Path]] = []
+
+    async def watch() -> AsyncIterator[Path]:
+        for i in range(5):
+            # The previous image is uploaded before the next one appears.
+            await asyncio.sleep(0.01)
+            assert len(uploaded) == i
+            yield Path(f"{i}.png")
+
+    async def upload(img_paths: Sequence[Path]) -> list[UploadRecord]:
+        uploaded.append(img_paths)
+        return [UploadRecord(img_path, "test", url=str(img_path)) for img_path in img_paths]
+
+    batches = [
+        batch async for batch in upload_lazily(upload, watch(), batch_size=1, max_pending=2)
+    ]
+
+    assert [start for start, _ in batches] == [0, 1, 2, 3, 4]
+    assert uploaded == [[Path(f"{i}.png")] for i in range(5)]
+
+
+@pytest.mark.asyncio
+async def test_share_futures() -> None:
+    """Test that an image is processed once per batch, for all the hostings of the batch."""
+    started: list[Path] = []
+    loop = asyncio.get_running_loop()
+
+    def start(img_path: Path) -> "asyncio.Future[bytes]":
+        started.append(img_path)
+        future = loop.create_future()
+        future.set_result(b"data")
+        return future
+
+    img_path = Path("pic.png")
+    for _ in range(2):
+        # A new batch starts with no futures.
+        get_future = share_futures(start, shared=True)
+        assert await get_future(img_path) == await get_future(img_path) == b"data"
+
+    assert started == [img_path, img_path]
 
 
 def test_format_link_plain():
@@ -115,3 +863,26 @@ def test_format_link_invalid_format():
     fmt = "invalid_format"
     expected_output = ""
     assert format_link(links, fmt) == expected_output
+
+
+def test_format_record():
+    record = UploadRecord(
+        Path("pic.png"),
+        "imgur",
+        url="https://example.com/image.png",
+        format="png",
+        size=100,
+        timings={"read": 0.0012345678, "http": 0.5},
+    )
+    assert json.loads(format_record(record)) == {
+        "path": "pic.png",
+        "hosting": "imgur",
+        "url": "https://example.com/image.png",
+        "thumbnail_url": None,
+        "format": "png",
+        "size": 100,
+        "thumbnail_size": None,
+        "cached": False,
+        "timings": {"read": 0.001235, "http": 0.5},
+        "error": None,
+    }
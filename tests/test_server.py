@@ -0,0 +1,224 @@
+import asyncio
+import json
+import os
+from collections.abc import AsyncIterator
+from contextlib import aclosing
+from functools import partial
+from pathlib import Path
+
+import pytest
+import pytest_asyncio
+from pytest_httpx import HTTPXMock
+from pytest_mock import MockerFixture
+
+from images_upload_cli.client import DaemonError, UnixHTTPConnection, request_upload
+from images_upload_cli.image import Transform
+from images_upload_cli.server import RequestError, UploadOptions, UploadServer, parse_target
+from tests.mock import RESPONSE
+
+
+@pytest_asyncio.fixture
+async def socket_path(tmp_path: Path) -> AsyncIterator[Path]:
+    path = tmp_path / "imgup.sock"
+    server = UploadServer(("imgur",), cache=False)
+    async with aclosing(server):
+        await server.start()
+        async with await server.listen(socket_path=path):
+            yield path
+
+
+@pytest.mark.asyncio
+async def test_upload_server_socket_private(mocker: MockerFixture, socket_path: Path) -> None:
+    """Test that the socket is bound under a umask restricting it to the current user."""
+    assert (await asyncio.to_thread(socket_path.stat)).st_mode & 0o777 == 0o600
+
+    umask = mocker.spy(os, "umask")
+    server = UploadServer(("imgur",), cache=False)
+    async with await server.listen(socket_path=socket_path.with_name("other.sock")):
+        pass
+    assert umask.call_args_list[0].args == (0o177,)
+
+
+@pytest.mark.asyncio
+@pytest.mark.httpx_mock(can_send_already_matched_responses=True)
+async def test_upload_server_paths(httpx_mock: HTTPXMock, socket_path: Path) -> None:
+    link = RESPONSE["imgur"][1]
+    httpx_mock.add_response(text=RESPONSE["imgur"][0])
+
+    response = await asyncio.to_thread(
+        request_upload, str(socket_path), [Path("tests/data/pic.png")], "markdown"
+    )
+
+    assert response == {"output": f"![image]({link})", "links": [[link, None]], "failed": 0}
+
+
+@pytest.mark.asyncio
+async def test_upload_server_lazy_workers(mocker: MockerFixture) -> None:
+    """Test that the caption font is resolved and the workers are started by the first thumbnail only."""
+    get_font = mocker.patch("images_upload_cli.server.get_font")
+    make_executor = mocker.patch("images_upload_cli.server.make_executor")
+    server = UploadServer(("imgur",), cache=False)
+
+    async with aclosing(server):
+        await server.start()
+        assert server.get_executor(UploadOptions()) is None
+        get_font.assert_not_called()
+
+        assert server.get_executor(UploadOptions(thumbnail=True)) is make_executor.return_value
+        assert server.get_executor(UploadOptions(thumbnail=True)) is make_executor.return_value
+        make_executor.assert_called_once_with(server.jobs, get_font.return_value)
+
+
+@pytest.mark.asyncio
+@pytest.mark.httpx_mock(can_send_already_matched_responses=True)
+async def test_upload_server_bytes(httpx_mock: HTTPXMock, socket_path: Path, img: bytes) -> None:
+    """Test that the image sent in the body is uploaded along with its thumbnail."""
+    link = RESPONSE["imgur"][1]
+    httpx_mock.add_response(text=RESPONSE["imgur"][0])
+
+    def post() -> tuple[int, bytes]:
+        connection = UnixHTTPConnection(str(socket_path), timeout=30)
+        connection.request("POST", "/upload?thumbnail=1", img)
+        response = connection.getresponse()
+        return response.status, response.read()
+
+    status, body = await asyncio.to_thread(post)
+
+    assert status == 200
+    assert f"[url={link}][img]{link}[/img][/url]".encode() in body
+    assert len(httpx_mock.get_requests()) == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.httpx_mock(can_send_already_matched_responses=True)
+async def test_upload_server_jsonl(httpx_mock: HTTPXMock, socket_path: Path) -> None:
+    """Test that the records of the images are returned in the jsonl format."""
+    link = RESPONSE["imgur"][1]
+    httpx_mock.add_response(text=RESPONSE["imgur"][0])
+
+    response = await asyncio.to_thread(
+        request_upload, str(socket_path), [Path("tests/data/pic.png")], "jsonl"
+    )
+
+    record = json.loads(response["output"])
+    assert record["path"].endswith("tests/data/pic.png")
+    assert record["url"] == link
+    assert response["links"] == [[link, None]]
+    assert response["failed"] == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.httpx_mock(can_send_already_matched_responses=True)
+async def test_upload_server_transform(httpx_mock: HTTPXMock, socket_path: Path) -> None:
+    """Test that the images are transformed by the daemon as requested."""
+    httpx_mock.add_response(text=RESPONSE["imgur"][0])
+
+    response = await asyncio.to_thread(
+        request_upload,
+        str(socket_path),
+        [Path("tests/data/pic.png")],
+        "plain",
+        transform=Transform(max_dimension=10, format="webp"),
+        cache=False,
+    )
+
+    assert response["failed"] == 0
+    assert b"WEBP" in httpx_mock.get_requests()[0].content
+
+
+@pytest.mark.parametrize(
+    ("target", "options"),
+    [
+        ("/upload", UploadOptions()),
+        (
+            "/upload?format=html&thumbnail=1&cache=0",
+            UploadOptions(format="html", thumbnail=True, cache=False),
+        ),
+        (
+            "/upload?max_dimension=600&recompress=jpeg&quality=75&strip_metadata=1",
+            UploadOptions(transform=Transform(600, None, "jpeg", 75, strip_metadata=True)),
+        ),
+        ("/upload?quality=75", UploadOptions()),
+    ],
+)
+def test_parse_target(target: str, options: UploadOptions) -> None:
+    assert parse_target("POST", target) == options
+
+
+@pytest.mark.parametrize(
+    "target",
+    [
+        "/upload?format=pdf",
+        "/upload?max_dimension=big",
+        "/upload?max_bytes=0",
+        "/upload?recompress=png",
+        "/upload?quality=101",
+    ],
+)
+def test_parse_target_invalid(target: str) -> None:
+    with pytest.raises(RequestError):
+        parse_target("POST", target)
+
+
+@pytest.mark.asyncio
+async def test_upload_server_internal_error(socket_path: Path, mocker: MockerFixture) -> None:
+    """Test that an unexpected error is reported to the client and the daemon keeps serving."""
+    mocker.patch("images_upload_cli.server.upload_images", side_effect=RuntimeError("boom"))
+
+    for _ in range(2):
+        with pytest.raises(DaemonError, match="rejected the request: boom"):
+            await asyncio.to_thread(
+                request_upload, str(socket_path), [Path("tests/data/pic.png")], "plain"
+            )
+
+
+@pytest.mark.asyncio
+async def test_upload_server_no_images(socket_path: Path) -> None:
+    response = await asyncio.to_thread(
+        request_upload, str(socket_path), [Path("/nonexistent/*.png")], "plain"
+    )
+
+    assert response == {"output": "", "links": [], "failed": 0}
+
+
+@pytest.mark.asyncio
+async def test_upload_server_not_image(socket_path: Path) -> None:
+    """Test that a path to a file other than an image is rejected, so it is never sent to a hosting."""
+    with pytest.raises(DaemonError, match="is not an image"):
+        await asyncio.to_thread(
+            request_upload, str(socket_path), [Path("pyproject.toml")], "plain"
+        )
+
+
+@pytest.mark.asyncio
+@pytest.mark.httpx_mock(can_send_already_matched_responses=True)
+async def test_upload_server_token(httpx_mock: HTTPXMock) -> None:
+    """Test that the daemon listening on TCP requires its token."""
+    httpx_mock.add_response(text=RESPONSE["imgur"][0])
+    server = UploadServer(("imgur",), cache=False, token="secret")
+
+    async with aclosing(server):
+        await server.start()
+        async with await server.listen(port=0) as listener:
+            port = listener.sockets[0].getsockname()[1]
+            address = f"http://127.0.0.1:{port}"
+            upload = partial(request_upload, address, [Path("tests/data/pic.png")], "plain")
+
+            for token in (None, "wrong"):
+                with pytest.raises(DaemonError, match="Missing or invalid token"):
+                    await asyncio.to_thread(upload, token=token)
+            response = await asyncio.to_thread(upload, token="secret")
+
+    assert response["links"] == [[RESPONSE["imgur"][1], None]]
+
+
+@pytest.mark.asyncio
+async def test_upload_server_tcp_without_token() -> None:
+    server = UploadServer(("imgur",), cache=False)
+    with pytest.raises(ValueError, match="A token is required"):
+        await server.listen(port=0)
+
+
+def test_request_upload_unreachable(tmp_path: Path) -> None:
+    with pytest.raises(DaemonError, match="not reachable"):
+        request_upload(str(tmp_path / "missing.sock"), [], "plain")
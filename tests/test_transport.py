@@ -0,0 +1,213 @@
+from email.utils import formatdate
+from time import monotonic, time
+
+import pytest
+from httpx import (
+    AsyncClient,
+    AsyncHTTPTransport,
+    ConnectError,
+    Headers,
+    Limits,
+    ReadTimeout,
+    Response,
+    Timeout,
+    codes,
+)
+from logot import Logot, logged
+from pytest_httpx import HTTPXMock
+from pytest_mock import MockerFixture
+
+from images_upload_cli.transport import (
+    DEFAULT_LIMITS,
+    RateLimit,
+    RateLimitTransport,
+    RetryTransport,
+    TokenBucket,
+    get_retry_after,
+    is_transient,
+    make_client,
+)
+
+
+@pytest.mark.parametrize(
+    ("headers", "expected"),
+    [
+        pytest.param({}, None, id="none"),
+        pytest.param({"Retry-After": "2"}, 2, id="retry-after"),
+        pytest.param({"Retry-After": "-2"}, 0, id="retry-after-negative"),
+        pytest.param({"Retry-After": "soon"}, None, id="retry-after-invalid"),
+        pytest.param({"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "5"}, 5, id="ratelimit"),
+        pytest.param(
+            {"X-RateLimit-ClientRemaining": "0", "X-RateLimit-ClientReset": "7"},
+            7,
+            id="ratelimit-prefixed",
+        ),
+        pytest.param(
+            {"X-RateLimit-Remaining": "3", "X-RateLimit-Reset": "5"}, None, id="remaining"
+        ),
+        pytest.param({"X-RateLimit-Remaining": "0"}, None, id="no-reset"),
+    ],
+)
+def test_get_retry_after(headers: dict[str, str], expected: float | None) -> None:
+    assert get_retry_after(Headers(headers)) == expected
+
+
+def test_get_retry_after_date() -> None:
+    headers = Headers({"Retry-After": formatdate(time() + 60, usegmt=True)})
+    delay = get_retry_after(headers)
+    assert delay is not None
+    assert 55 < delay <= 60
+
+
+def test_get_retry_after_unix_time() -> None:
+    headers = Headers({"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(time() + 60)})
+    delay = get_retry_after(headers)
+    assert delay is not None
+    assert 55 < delay <= 60
+
+
+@pytest.mark.asyncio
+async def test_token_bucket() -> None:
+    bucket = TokenBucket(RateLimit(rate=20, burst=2))
+
+    start = monotonic()
+    # The burst is available at once.
+    await bucket.acquire()
+    await bucket.acquire()
+    assert monotonic() - start < 0.04
+    # Then the tokens are refilled at the rate.
+    await bucket.acquire()
+    assert monotonic() - start >= 0.04
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_pause() -> None:
+    bucket = TokenBucket(RateLimit(rate=100, burst=10))
+    bucket.pause(0.05)
+
+    start = monotonic()
+    await bucket.acquire()
+    assert monotonic() - start >= 0.05
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_transport(httpx_mock: HTTPXMock) -> None:
+    httpx_mock.add_response(status_code=429, headers={"Retry-After": "30"})
+
+    transport = RateLimitTransport(AsyncHTTPTransport(), RateLimit(rate=1, burst=1))
+    async with AsyncClient(transport=transport) as client:
+        response = await client.get("https://example.com")
+
+    assert response.status_code == 429
+    assert transport.bucket.tokens == 0
+    assert transport.bucket.paused_until > monotonic() + 25
+
+
+@pytest.fixture
+def retry_transport(mocker: MockerFixture) -> RetryTransport:
+    # Skip the backoff delays.
+    mocker.patch("images_upload_cli.transport.uniform", return_value=0)
+    return RetryTransport(AsyncHTTPTransport(), retries=2, max_delay=10)
+
+
+@pytest.mark.parametrize(
+    ("status_code", "expected"),
+    [
+        (codes.INTERNAL_SERVER_ERROR, True),
+        (codes.BAD_GATEWAY, True),
+        (codes.REQUEST_TIMEOUT, True),
+        (codes.TOO_MANY_REQUESTS, True),
+        (codes.BAD_REQUEST, False),
+        (codes.UNAUTHORIZED, False),
+        (codes.NOT_FOUND, False),
+    ],
+)
+def test_is_transient(status_code: int, expected: bool) -> None:
+    assert is_transient(Response(status_code)) is expected
+
+
+@pytest.mark.asyncio
+async def test_retry_transport(httpx_mock: HTTPXMock, retry_transport: RetryTransport) -> None:
+    httpx_mock.add_exception(ConnectError("Connection refused"))
+    httpx_mock.add_response(status_code=503)
+    httpx_mock.add_response(text="ok")
+
+    async with AsyncClient(transport=retry_transport) as client:
+        response = await client.post("https://example.com", files={"file": b"data"})
+
+    assert response.text == "ok"
+    # The request body is sent again on every attempt.
+    assert all(b"data" in request.content for request in httpx_mock.get_requests())
+
+
+@pytest.mark.asyncio
+async def test_retry_transport_permanent_error(
+    httpx_mock: HTTPXMock, retry_transport: RetryTransport
+) -> None:
+    httpx_mock.add_response(status_code=403)
+
+    async with AsyncClient(transport=retry_transport) as client:
+        response = await client.get("https://example.com")
+
+    assert response.status_code == 403
+    assert len(httpx_mock.get_requests()) == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.httpx_mock(can_send_already_matched_responses=True)
+async def test_retry_transport_exhausted(
+    httpx_mock: HTTPXMock, retry_transport: RetryTransport
+) -> None:
+    httpx_mock.add_exception(ReadTimeout("Timed out"))
+
+    async with AsyncClient(transport=retry_transport) as client:
+        with pytest.raises(ReadTimeout):
+            await client.get("https://example.com")
+
+    assert len(httpx_mock.get_requests()) == 3
+
+
+@pytest.mark.asyncio
+async def test_retry_transport_retry_after(
+    httpx_mock: HTTPXMock, retry_transport: RetryTransport, mocker: MockerFixture
+) -> None:
+    httpx_mock.add_response(status_code=429, headers={"Retry-After": "2"})
+    httpx_mock.add_response(status_code=429, headers={"Retry-After": "3600"})
+    mock_sleep = mocker.patch("images_upload_cli.transport.asyncio.sleep")
+
+    async with AsyncClient(transport=retry_transport) as client:
+        response = await client.get("https://example.com")
+
+    # The requested delay is honoured, unless it exceeds the maximum delay.
+    mock_sleep.assert_called_once_with(2.0)
+    assert response.status_code == 429
+    assert len(httpx_mock.get_requests()) == 2
+
+
+@pytest.mark.asyncio
+async def test_make_client(mocker: MockerFixture) -> None:
+    mock_transport = mocker.patch(
+        "images_upload_cli.transport.AsyncHTTPTransport", wraps=AsyncHTTPTransport
+    )
+    limits = Limits(max_connections=4)
+
+    async with make_client(
+        RateLimit(rate=1, burst=1), limits=limits, timeout=Timeout(1)
+    ) as client:
+        assert client.timeout == Timeout(1)
+
+    mock_transport.assert_called_once_with(http2=False, limits=limits)
+
+
+@pytest.mark.asyncio
+async def test_make_client_http2_not_installed(mocker: MockerFixture, logot: Logot) -> None:
+    mock_transport = mocker.patch(
+        "images_upload_cli.transport.AsyncHTTPTransport", wraps=AsyncHTTPTransport
+    )
+    mocker.patch("images_upload_cli.transport.find_spec", return_value=None)
+
+    async with make_client(RateLimit(rate=1, burst=1), http2=True):
+        pass
+
+    mock_transport.assert_called_once_with(http2=False, limits=DEFAULT_LIMITS)
+    logot.assert_logged(logged.warning("HTTP/2 support is not installed%s"))
@@ -1,11 +1,13 @@
+from io import BytesIO
+
 import pytest
 from dotenv import load_dotenv
-from httpx import AsyncClient
+from httpx import AsyncClient, ConnectError
 from logot import Logot, logged
 from pytest_httpx import HTTPXMock
 
-from images_upload_cli.upload import UPLOAD
-from tests.mock import MOCK_HOSTINGS, RESPONSE
+from images_upload_cli.upload import BATCH_UPLOAD, RATE_LIMITS, UPLOAD
+from tests.mock import BATCH_RESPONSE, MOCK_HOSTINGS, RESPONSE
 
 
 @pytest.mark.asyncio
@@ -49,6 +51,50 @@ async def test_upload_funcs(
         assert link == mock_link
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("hosting", "mock_text", "mock_link"),
+    [
+        pytest.param(hosting, RESPONSE[hosting][0], RESPONSE[hosting][1], id=hosting)
+        for hosting in MOCK_HOSTINGS
+    ],
+)
+@pytest.mark.httpx_mock(can_send_already_matched_responses=True)
+async def test_upload_funcs_file(
+    httpx_mock: HTTPXMock,
+    hosting: str,
+    mock_text: str,
+    mock_link: str,
+    img: bytes,
+) -> None:
+    """Test the image upload functionality of different hosting services with a binary file.
+
+    Args:
+        httpx_mock: An instance of the HTTPXMock class used for mocking HTTP responses.
+        hosting: A string representing the hosting service to test.
+        mock_text: A string representing the mock response text.
+        mock_link: A string representing the expected link after image upload.
+        img: Bytes of the image to be uploaded.
+
+    Raises:
+        AssertionError: If the returned link is not equal to the expected mock_link or the file is not sent.
+    """
+    # Mock the response
+    httpx_mock.add_response(text=mock_text)
+
+    # Load environment variables
+    load_dotenv(dotenv_path="tests/data/.env.sample")
+
+    # Upload the image
+    async with AsyncClient() as client:
+        upload_func = UPLOAD[hosting]
+        link = await upload_func(client, BytesIO(img))
+        assert link == mock_link
+
+    # Assert the file content is sent
+    assert img in httpx_mock.get_requests()[0].content
+
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize("hosting", MOCK_HOSTINGS)
 async def test_upload_funcs_error(
@@ -120,3 +166,132 @@ async def test_upload_funcs_not_found(
     # Assert the log messages
     await logot.await_for(logged.error("Image link not found in '%s' response."))
     await logot.await_for(logged.debug("Response text:\nResponse without the url."))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("hosting", "mock_text", "mock_links"),
+    [
+        pytest.param(hosting, BATCH_RESPONSE[hosting][0], BATCH_RESPONSE[hosting][1], id=hosting)
+        for hosting in BATCH_UPLOAD
+    ],
+)
+async def test_upload_batch_funcs(
+    httpx_mock: HTTPXMock,
+    hosting: str,
+    mock_text: str,
+    mock_links: list[str],
+    img: bytes,
+) -> None:
+    """Test the upload of several images in a single request.
+
+    Args:
+        httpx_mock: An instance of the HTTPXMock class used for mocking HTTP responses.
+        hosting: A string representing the hosting service to test.
+        mock_text: A string representing the mock response text.
+        mock_links: The expected links in the order of the images.
+        img: Bytes of the image to be uploaded.
+
+    Raises:
+        AssertionError: If the returned links are not equal to the expected mock_links or the files are not sent.
+    """
+    # Mock the response
+    httpx_mock.add_response(text=mock_text)
+
+    # Load environment variables
+    load_dotenv(dotenv_path="tests/data/.env.sample")
+
+    # Upload the images
+    async with AsyncClient() as client:
+        batch_func = BATCH_UPLOAD[hosting]
+        links = await batch_func(client, [BytesIO(img), BytesIO(img)])
+        assert list(links) == mock_links
+
+    # Both files are sent in a single request.
+    request = httpx_mock.get_request()
+    assert request is not None
+    assert request.content.count(img) == len(mock_links)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("hosting", BATCH_UPLOAD)
+async def test_upload_batch_funcs_error(
+    httpx_mock: HTTPXMock,
+    logot: Logot,
+    hosting: str,
+    img: bytes,
+) -> None:
+    """Test the upload of several images in a single request when an error occurs.
+
+    Args:
+        httpx_mock: An instance of the HTTPXMock class used for mocking HTTP responses.
+        logot: An instance of the Logot class used for logging.
+        hosting: A string representing the hosting service to test.
+        img: Bytes of the image to be uploaded.
+
+    Raises:
+        AssertionError: If the returned result is not empty.
+    """
+    # Mock the response
+    httpx_mock.add_response(text="Upload failed.", status_code=500)
+
+    # Load environment variables
+    load_dotenv(dotenv_path="tests/data/.env.sample")
+
+    # Upload the images
+    async with AsyncClient() as client:
+        batch_func = BATCH_UPLOAD[hosting]
+        result = await batch_func(client, [img, img])
+
+    # Assert the result is empty
+    assert result == ()
+
+    # Assert the log messages
+    await logot.await_for(logged.error("Server error '500 Internal Server Error' for url '%s'."))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("hosting", BATCH_UPLOAD)
+async def test_upload_batch_funcs_exception(
+    httpx_mock: HTTPXMock,
+    logot: Logot,
+    hosting: str,
+    img: bytes,
+) -> None:
+    """Test the upload of several images in a single request when the request raises.
+
+    Args:
+        httpx_mock: An instance of the HTTPXMock class used for mocking HTTP responses.
+        logot: An instance of the Logot class used for logging.
+        hosting: A string representing the hosting service to test.
+        img: Bytes of the image to be uploaded.
+
+    Raises:
+        AssertionError: If the result is not empty.
+    """
+    # Mock the failed requests
+    httpx_mock.add_exception(ConnectError("Connection refused"), is_reusable=True)
+
+    # Load environment variables
+    load_dotenv(dotenv_path="tests/data/.env.sample")
+
+    # Upload the images
+    async with AsyncClient() as client:
+        batch_func = BATCH_UPLOAD[hosting]
+        result = await batch_func(client, [img, img])
+
+    # Assert the result is empty and immutable, so it can't leak between the failed calls
+    assert result == ()
+
+    # Assert the log messages
+    await logot.await_for(logged.error("An error has been caught in function %s"))
+
+
+def test_batch_upload() -> None:
+    """Test that every batch upload function has a single image counterpart."""
+    assert BATCH_UPLOAD.keys() <= UPLOAD.keys()
+
+
+def test_rate_limits() -> None:
+    """Test that every hosting has a rate limit."""
+    assert RATE_LIMITS.keys() == UPLOAD.keys()
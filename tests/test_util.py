@@ -1,3 +1,5 @@
+import os
+from io import BytesIO
 from pathlib import Path
 
 import pytest
@@ -8,11 +10,13 @@ from pytest_mock import MockerFixture
 
 from images_upload_cli.util import (
     GetEnvError,
+    TimedReader,
     get_config_path,
     get_env,
     human_size,
     log_on_error,
     notify_send,
+    read_paths,
 )
 
 
@@ -126,3 +130,38 @@ def test_log_on_error(httpx_mock: HTTPXMock, logot: Logot):
         logged.error("Client error '404 Not Found' for url 'https://example.com'.")
     )
     logot.assert_logged(logged.debug("Response text:\nPage not found"))
+
+
+@pytest.mark.parametrize(
+    ("data", "delimiter", "expected"),
+    [
+        (b"a.png\nb c.jpg\r\n\nd.gif", b"\n", ["a.png", "b c.jpg", "d.gif"]),
+        (b"a.png\x00new\nline.jpg\x00\x00", b"\x00", ["a.png", "new\nline.jpg"]),
+        (b"", b"\n", []),
+    ],
+)
+def test_read_paths(data: bytes, delimiter: bytes, expected: list[str]) -> None:
+    assert list(read_paths(BytesIO(data), delimiter)) == [Path(path) for path in expected]
+
+
+def test_read_paths_incremental() -> None:
+    """Test that a path is yielded as soon as its delimiter arrives, without waiting for more input."""
+    read_fd, write_fd = os.pipe()
+    with open(read_fd, "rb") as stream:  # noqa: PTH123
+        paths = read_paths(stream)
+
+        os.write(write_fd, b"a.png\nb")
+        assert next(paths) == Path("a.png")
+
+        os.write(write_fd, b".png\n")
+        os.close(write_fd)
+        assert list(paths) == [Path("b.png")]
+
+
+def test_timed_reader() -> None:
+    f = TimedReader(BytesIO(b"image"))
+
+    assert f.read(2) == b"im"
+    assert f.read() == b"age"
+    assert f.file.tell() == 5
+    assert f.elapsed > 0
@@ -0,0 +1,125 @@
+import asyncio
+import shutil
+import struct
+from contextlib import aclosing, suppress
+from pathlib import Path
+
+import pytest
+from logot import Logot, logged
+from pytest_httpx import HTTPXMock
+from pytest_mock import MockerFixture
+
+from images_upload_cli.main import UploadRecord, upload_images
+from images_upload_cli.watch import settle_files, watch_images
+from tests.mock import RESPONSE
+
+IMG = Path("tests/data/pic.png").read_bytes()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("use_inotify", [True, False])
+async def test_watch_images(tmp_path: Path, use_inotify: bool) -> None:
+    """Test that only the new images are yielded, once they are completely written."""
+    shutil.copy("tests/data/pic.png", tmp_path / "old.png")
+    images = watch_images(tmp_path, settle=0.2, interval=0.05, use_inotify=use_inotify)
+
+    async with aclosing(images):
+        next_image = asyncio.ensure_future(anext(images))
+        await asyncio.sleep(0.1)
+        (tmp_path / "notes.txt").write_text("not an image")
+        # A partially written image.
+        (tmp_path / "new.png").write_bytes(IMG[:100])
+        await asyncio.sleep(0.1)
+        assert not next_image.done()
+
+        (tmp_path / "new.png").write_bytes(IMG)
+        assert await asyncio.wait_for(next_image, 2) == tmp_path / "new.png"
+
+        # An overwritten image is uploaded again.
+        (tmp_path / "new.png").write_bytes(IMG + b"\0")
+        assert await asyncio.wait_for(anext(images), 2) == tmp_path / "new.png"
+
+
+@pytest.mark.asyncio
+async def test_watch_images_truncated_header(
+    logot: Logot, mocker: MockerFixture, tmp_path: Path
+) -> None:
+    """Test that a file with a truncated header is skipped and the watcher keeps going."""
+    images = watch_images(tmp_path, settle=0.1, interval=0.05, use_inotify=False)
+
+    async with aclosing(images):
+        next_image = asyncio.ensure_future(anext(images))
+        await logot.await_for(logged.info("Watching %s for new images."), timeout=5)
+        # A suffix-less file is identified by its header.
+        (tmp_path / "truncated").write_bytes(IMG[:16])
+        await asyncio.sleep(0.3)
+        (tmp_path / "new.png").write_bytes(IMG)
+        assert await asyncio.wait_for(next_image, 2) == tmp_path / "new.png"
+
+        # A header the sniffer fails to parse is logged and skipped too.
+        next_image = asyncio.ensure_future(anext(images))
+        mocker.patch("images_upload_cli.watch.is_image_file", side_effect=struct.error("short"))
+        (tmp_path / "broken").write_bytes(IMG[:16])
+        await logot.await_for(
+            logged.warning("Skipping %s, its header can't be parsed: short"), timeout=5
+        )
+        mocker.stopall()
+        (tmp_path / "next.png").write_bytes(IMG)
+        assert await asyncio.wait_for(next_image, 2) == tmp_path / "next.png"
+
+
+@pytest.mark.asyncio
+@pytest.mark.httpx_mock(can_send_already_matched_responses=True)
+async def test_watch_images_corrupt(httpx_mock: HTTPXMock, logot: Logot, tmp_path: Path) -> None:
+    """Test that a corrupt image dropped into the watched directory fails alone and the watcher keeps going."""
+    hosting = "imgur"
+    httpx_mock.add_response(text=RESPONSE[hosting][0])
+    records: list[UploadRecord] = []
+    uploaded = asyncio.Event()
+
+    def on_upload(record: UploadRecord) -> None:
+        records.append(record)
+        if len(records) == 2:
+            uploaded.set()
+
+    upload = asyncio.ensure_future(
+        upload_images(
+            hosting=hosting,
+            images=watch_images(tmp_path, settle=0.1, interval=0.05, use_inotify=False),
+            thumbnail=True,
+            batch_size=1,
+            on_upload=on_upload,
+        )
+    )
+
+    try:
+        await logot.await_for(logged.info("Watching %s for new images."), timeout=5)
+        (tmp_path / "bad.png").write_bytes(b"corrupt")
+        await asyncio.sleep(0.5)
+        (tmp_path / "good.png").write_bytes(IMG)
+        await asyncio.wait_for(uploaded.wait(), 5)
+    finally:
+        upload.cancel()
+        with suppress(asyncio.CancelledError):
+            await upload
+
+    assert [record.path.name for record in records] == ["bad.png", "good.png"]
+    assert records[0].links is None
+    assert records[0].error is not None
+    assert records[1].links == (RESPONSE[hosting][1], RESPONSE[hosting][1])
+
+
+def test_settle_files() -> None:
+    known = {"old.png": (1, 1)}
+    pending: dict[str, tuple[tuple[int, int], float]] = {}
+
+    stats = {"old.png": (1, 1), "new.png": (1, 1), "empty.png": (0, 1)}
+    assert settle_files(stats, known, pending, settle=0) == []
+    assert pending.keys() == {"new.png", "empty.png"}
+
+    # A file changed since the last check is not settled, an empty one is settled but not picked.
+    stats["new.png"] = (2, 2)
+    assert settle_files(stats, known, pending, settle=0) == []
+    assert settle_files(stats, known, pending, settle=0) == ["new.png"]
+    assert known == {"old.png": (1, 1), "new.png": (2, 2), "empty.png": (0, 1)}
+    assert pending == {}